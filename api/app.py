@@ -1,14 +1,50 @@
-from flask import Flask, request, jsonify, Response
+from flask import Flask, Request, request, jsonify, Response, url_for
+from contextlib import nullcontext
+import json
 import os
+import time
 from werkzeug.utils import secure_filename
 
 from utils.config import config
-from utils.eml_extractor import extract_email_chain
 from utils.scraper import site_scraper
+from utils.crawler import crawl_site
+from utils.batch import batch_runner, expand_uploads, STATUS_DONE, STATUS_ERROR
+from utils.job_queue import job_queue, KIND_OCR, KIND_SUMMARY, JOB_DONE
+from utils.result_cache import result_cache, make_cache_key, CACHE_HIT, CACHE_MISS
+from utils.sse import format_sse
+from utils.http_session import http_stats
+from utils.uploads import (UploadTooLarge, create_spool_file, open_spooled, remove_spooled, check_content_length,
+                           check_file_size, max_request_bytes, spool_min_bytes, spool_stream)
+from utils.router import provider_router, is_routed
+from utils.admission import AdmissionRejected, PRIORITY_BATCH, set_priority
+from utils.tables import TABLE_MIME_TYPES, TableShapeError, is_table_format, encode_table
+from utils.metrics import (set_labels, stage_timer, observe_stage, provider_call, tracked,
+                           render_metrics)
 import utils.call_ai as ai
+from utils.call_ai import get_model_version, handle_eml
+
+
+class SpoolingRequest(Request):
+    """
+    Writes large uploaded files straight to the spool directory while the body
+    is parsed, so /ocr can map them instead of reading them into memory.
+    """
+    spooled_paths = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= spool_min_bytes():
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        
+        spool_file = create_spool_file()
+        self.spooled_paths = (self.spooled_paths or []) + [spool_file.name]
+        return spool_file
+
 
 app = Flask(__name__)
 app.url_map.strict_slashes = False
+app.request_class = SpoolingRequest
+# Whole-body ceiling, checked against Content-Length before anything is read
+app.config['MAX_CONTENT_LENGTH'] = max_request_bytes()
 
 # Create a blueprint for api routes
 from flask import Blueprint
@@ -35,43 +71,240 @@ def get_mimetype(file_ext):
     mime_types = {
         "txt": "text/plain",
         "csv": "text/csv", 
-        "md": "text/markdown"
+        "md": "text/markdown",
+        **TABLE_MIME_TYPES
     }
     return mime_types.get(file_ext, "text/plain")  # Default to text/plain if extension not found
 
 
-def handle_eml(file_blob, file_name):
-    # If it's an email file (.eml), extract its content
-    if not file_name.lower().endswith('.eml'):
-        return file_blob
+def output_body(output_text, file_ext):
+    # Parquet/Arrow requests get the CSV output as a typed table (see utils/tables.py)
+    if is_table_format(file_ext):
+        return encode_table(output_text, file_ext)
+    return output_text
+
+
+@app.after_request
+def remove_spooled_uploads(response):
+    # Streamed responses keep using the upload after the view returns: remove on close
+    paths = request.spooled_paths
+    if paths:
+        response.call_on_close(lambda: [remove_spooled(path) for path in paths])
+    return response
+
+
+def rate_limited(e):
+    # Provider quota exhausted (see utils/admission.py): tell the client when to come back
+    return jsonify({"error": str(e), "retry_after": e.retry_after}), 429, {"Retry-After": str(e.retry_after)}
+
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({"error": f"Request is larger than {max_request_bytes() >> 20} MB"}), 413
+
+
+def read_upload(file):
+    """
+    Returns the upload's content: a SpooledBlob (memory map) for uploads that
+    were spooled to disk, bytes for small ones.
+
+    Raises:
+        UploadTooLarge: If the file is over [Uploads] MaxFileMB
+    """
+    spooled_path = getattr(file.stream, "name", None)
+    if isinstance(spooled_path, str) and os.path.exists(spooled_path):
+        check_file_size(os.path.getsize(spooled_path))
+        return open_spooled(spooled_path)
     
-    try:
-        # Use the extract_email_chain function to get readable text
-        extracted_text = extract_email_chain(file_blob)
-        return extracted_text.encode('utf-8') if isinstance(extracted_text, str) else extracted_text
-    except Exception as email_err:
-        # Log the error but continue with the original content if extraction fails
-        print(f"Email extraction error: {str(email_err)}")
-    
-    return file_blob      
-            
+    file_blob = file.read()
+    check_file_size(len(file_blob))
+    return file_blob
+
+
+def spool_upload(file):
+    """
+    Returns the path of the upload on disk, for the job queue to take over:
+    the spooled upload itself, or a spooled copy of a small one.
+
+    Raises:
+        UploadTooLarge: If the file is over [Uploads] MaxFileMB
+    """
+    spooled_path = getattr(file.stream, "name", None)
+    if isinstance(spooled_path, str) and os.path.exists(spooled_path):
+        file.stream.flush()
+        check_file_size(os.path.getsize(spooled_path))
+        return spooled_path
+    return spool_stream(file.stream)
+
 
 # Could add more detailed logging here
-def call_ai(model, file_blob, file_name, prompt_text):
+def call_ai(model, file_blob, file_name, prompt_text, slot=None):
+    # slot(provider), if given, is held around the provider call (batch per-provider limits)
+    if is_routed(model):
+        # model=Auto: the fastest healthy provider answers (with failover/hedging)
+        return provider_router.route(lambda provider: call_ai(provider, file_blob, file_name, prompt_text, slot))
+    
     # Call the function to extract text from the file
-    if model == "OpenAI":
-        output_text = ai.openai_extract_text(file_blob, file_name, prompt_text)
+    with slot(model) if slot else nullcontext():
+        return ai.provider_extract_text(model, file_blob, file_name, prompt_text)
+
+
+def result_cache_key(model, file_blob, file_name, prompt_text):
+    return make_cache_key(file_blob, model, get_model_version(model), prompt_text,
+                          ai.get_file_type(file_name))
+
+
+def cached_call_ai(model, file_blob, file_name, prompt_text, slot=None):
+    """
+    Wraps call_ai with the content-addressed result cache.
+
+    Returns:
+        tuple: (output_text, cache_headers)
+    """
+    if not config['Cache'].getboolean('Enabled', True):
+        return call_ai(model, file_blob, file_name, prompt_text, slot), {}
+
+    key = result_cache_key(model, file_blob, file_name, prompt_text)
+    output_text, tier = result_cache.get(key)
+    if output_text is not None:
+        return output_text, {"X-Cache": CACHE_HIT, "X-Cache-Tier": tier}
+
+    output_text = call_ai(model, file_blob, file_name, prompt_text, slot)
+    result_cache.put(key, output_text)
+    return output_text, {"X-Cache": CACHE_MISS}
+
+
+def stream_ai(model, file_blob, file_name, prompt_text):
+    # Streaming counterpart of call_ai: yields raw (not post-processed) chunks
+    if is_routed(model):
+        return provider_router.route_stream(lambda provider: stream_ai(provider, file_blob, file_name, prompt_text))
+    elif model == "OpenAI":
+        return ai.openai_stream_text(file_blob, file_name, prompt_text)
     elif model == "Mistral":
-        output_text = ai.mistral_extract_text(file_blob, file_name, prompt_text)
+        return ai.mistral_stream_text(file_blob, file_name, prompt_text)
     else:
-        output_text = ai.gemini_extract_text(file_blob, file_name, prompt_text)
+        return ai.gemini_stream_text(file_blob, file_name, prompt_text)
+
+
+def is_stream_request():
+    return request.form.get('stream', request.args.get('stream', '')).lower() in ('1', 'true', 'yes')
+
+
+def is_crawl_request():
+    # /summary crawls the site with crawl=true (or [Crawler] Crawl on)
+    default = config['Crawler'].get('Crawl', 'False')
+    return request.form.get('crawl', request.args.get('crawl', default)).lower() in ('1', 'true', 'yes')
+
+
+def lookup_cached(model, file_blob, file_name, prompt_text):
+    """
+    Returns:
+        tuple: (key, cached_text, tier); key is None when the cache is disabled
+    """
+    if not config['Cache'].getboolean('Enabled', True):
+        return None, None, None
+    key = result_cache_key(model, file_blob, file_name, prompt_text)
+    cached_text, tier = result_cache.get(key)
+    return key, cached_text, tier
+
+
+def stream_events(model, file_blob, file_name, prompt_text, key=None, cached_text=None):
+    """
+    Yields (event, data) pairs: "chunk" events with raw model output as it
+    arrives, then one "done" event carrying the post-processed text and timings
+    (or an "error" event). key/cached_text come from lookup_cached.
+    """
+    # Runs after the handler returned, so re-apply the request's metric labels
+    set_labels(model=model, file_type=ai.get_file_type(file_name), prompt_text=prompt_text)
+    start = time.perf_counter()
+    if cached_text is not None:
+        yield "chunk", {"text": cached_text}
+        yield "done", {"text": cached_text, "ttft_ms": 0, "total_ms": 0}
+        return
     
-    return output_text
+    ttft_ms = None
+    parts = []
+    try:
+        with provider_call(model):
+            for chunk in stream_ai(model, file_blob, file_name, prompt_text):
+                if ttft_ms is None:
+                    ttft_ms = round((time.perf_counter() - start) * 1000, 1)
+                    observe_stage("ttft", ttft_ms / 1000)
+                parts.append(chunk)
+                yield "chunk", {"text": chunk}
+        
+        # Post-process once the whole output is in, so the CSV fence and '^^' are seen intact
+        output_text = ai.post_process_csv("".join(parts))
+        if key is not None:
+            result_cache.put(key, output_text)
+        
+        total_ms = round((time.perf_counter() - start) * 1000, 1)
+        yield "done", {"text": output_text, "ttft_ms": ttft_ms, "total_ms": total_ms}
+    except AdmissionRejected as e:
+        yield "error", {"error": str(e), "retry_after": e.retry_after}
+    except Exception as e:
+        yield "error", {"error": str(e)}
+
+
+def stream_response(model, file_blob, file_name, prompt_text, file_ext, download_name):
+    """
+    Returns stream_events as a Server-Sent Events response.
+    """
+    key, cached_text, tier = lookup_cached(model, file_blob, file_name, prompt_text)
+    
+    headers = {
+        "Content-disposition": f"attachment; filename={download_name}.{file_ext}",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # Stop nginx from buffering the stream
+    }
+    if key is not None:
+        headers["X-Cache"] = CACHE_HIT if cached_text is not None else CACHE_MISS
+        if tier:
+            headers["X-Cache-Tier"] = tier
+    
+    events = stream_events(model, file_blob, file_name, prompt_text, key, cached_text)
+    return Response((format_sse(event, data) for event, data in events),
+                    mimetype="text/event-stream", headers=headers)
+
+
+def prepare_upload(model, file_blob, file_name, prompt_text):
+    # Shared by /ocr and the frontend's in-process transport
+    set_labels(model=model, file_type=ai.get_file_type(file_name), prompt_text=prompt_text)
+    with stage_timer("handle_eml"):
+        return handle_eml(file_blob, file_name)
+
+
+def prepare_site(model, url, prompt_text, crawl=None):
+    """
+    Scrapes url for /summary and the frontend's in-process transport: with
+    crawl (default [Crawler] Crawl), the site's pages combined, else url alone.
+
+    Returns:
+        tuple: (site_text, file_name)
+
+    Raises:
+        ValueError: If the site could not be scraped
+    """
+    set_labels(model=model, file_type="site", prompt_text=prompt_text)
+    if crawl is None:
+        crawl = config['Crawler'].getboolean('Crawl', False)
+    with stage_timer("scrape"):
+        return_code, site_text, file_name = crawl_site(url) if crawl else site_scraper(url)
+    if return_code != 200:
+        raise ValueError(site_text)
+    return site_text, file_name
 
 
 @app.route('/ocr', methods=['POST'])
 @api_bp.route('/ocr', methods=['POST'])
+@tracked('ocr')
 def ocr():
+    # Fail fast on oversized uploads before the body is read
+    try:
+        check_content_length(request.content_length)
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    
     if 'file' not in request.files:
         return jsonify({"error": "No file part"}), 400
     
@@ -86,25 +319,173 @@ def ocr():
     try:
         # Get the file name and content
         file_name = secure_filename(file.filename)
-        file_blob = file.read()
-        file_blob = handle_eml(file_blob, file_name)
+        set_labels(model=model, file_type=ai.get_file_type(file_name), prompt_text=prompt_text)
+        with stage_timer("upload_read"):
+            file_blob = read_upload(file)
+        file_blob = prepare_upload(model, file_blob, file_name, prompt_text)
+        
+        if is_stream_request():
+            return stream_response(model, file_blob, file_name, prompt_text, file_ext,
+                                   os.path.splitext(file_name)[0])
         
         # Call the function to extract text from the file
-        output_text = call_ai(model, file_blob, file_name, prompt_text)
+        output_text, cache_headers = cached_call_ai(model, file_blob, file_name, prompt_text)
        
-        # Return the CSV content directly
+        # Return the CSV content directly, or typed as Parquet/Arrow
         return Response(
-            output_text,
+            output_body(output_text, file_ext),
             mimetype=get_mimetype(file_ext),
-            headers={"Content-disposition": f"attachment; filename={os.path.splitext(file_name)[0]}.{file_ext}"}
+            headers={"Content-disposition": f"attachment; filename={os.path.splitext(file_name)[0]}.{file_ext}",
+                     **cache_headers}
         )
     
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except AdmissionRejected as e:
+        return rate_limited(e)
+    except TableShapeError as e:
+        return jsonify({"error": str(e)}), 422
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+def batch_call_ai(model, file_blob, file_name, prompt_text, slot):
+    # Per-file work for batch jobs: same EML handling and cache as /ocr, queued behind interactive calls
+    set_priority(PRIORITY_BATCH)
+    file_blob = prepare_upload(model, file_blob, file_name, prompt_text)
+    output_text, _ = cached_call_ai(model, file_blob, file_name, prompt_text, slot)
+    return output_text
+
+
+def batch_status(job):
+    # Add download links for finished files
+    for file_state in job["files"]:
+        if file_state["status"] == STATUS_DONE:
+            file_state["result_url"] = url_for('api.ocr_batch_result', job_id=job["job_id"],
+                                               index=file_state["index"])
+    return job
+
+
+@app.route('/ocr/batch', methods=['POST'])
+@api_bp.route('/ocr/batch', methods=['POST'])
+def ocr_batch():
+    uploads = request.files.getlist('files') + request.files.getlist('file')
+    uploads = [u for u in uploads if u.filename]
+    if not uploads:
+        return jsonify({"error": "No files provided"}), 400
+    
+    prompt_text = request.form.get('prompt_text', '')
+    file_ext = request.form.get('file_ext', '')
+    model = request.form.get('model', config['API']['DefaultModel'])
+    
+    # Spooled, not read into memory: the batch takes the files over and removes each when it is done
+    spooled = []
+    try:
+        for u in uploads:
+            spooled.append((u.filename, spool_upload(u)))
+        files = expand_uploads(spooled)
+    except UploadTooLarge as e:
+        [remove_spooled(path) for _, path in spooled]
+        return jsonify({"error": str(e)}), 413
+    except Exception as e:
+        [remove_spooled(path) for _, path in spooled]
+        return jsonify({"error": f"Invalid upload: {str(e)}"}), 400
+    
+    max_files = config['Batch'].getint('MaxFiles', 500)
+    if not files:
+        return jsonify({"error": "No files provided"}), 400
+    if len(files) > max_files:
+        [remove_spooled(path) for _, path in files]
+        return jsonify({"error": f"Too many files ({len(files)}), maximum is {max_files}"}), 400
+    
+    job_id = batch_runner.submit(files, model, prompt_text, file_ext, batch_call_ai)
+    
+    return jsonify({
+        "job_id": job_id,
+        "file_count": len(files),
+        "status_url": url_for('api.ocr_batch_status', job_id=job_id),
+        "stream_url": url_for('api.ocr_batch_stream', job_id=job_id)
+    }), 202
+
+
+@app.route('/ocr/batch/<job_id>', methods=['GET'])
+@api_bp.route('/ocr/batch/<job_id>', methods=['GET'])
+def ocr_batch_status(job_id):
+    job = batch_runner.store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    
+    return jsonify(batch_status(job))
+
+
+@app.route('/ocr/batch/<job_id>/files/<int:index>', methods=['GET'])
+@api_bp.route('/ocr/batch/<job_id>/files/<int:index>', methods=['GET'])
+def ocr_batch_result(job_id, index):
+    job = batch_runner.store.get(job_id)
+    if job is None or index >= len(job["files"]):
+        return jsonify({"error": "Unknown job or file"}), 404
+    
+    file_state = job["files"][index]
+    if file_state["status"] != STATUS_DONE:
+        return jsonify({"error": f"File is {file_state['status']}", **file_state}), 409
+    
+    file_ext = job.get("file_ext", "")
+    file_name = os.path.splitext(file_state["file_name"])[0]
+    try:
+        body = output_body(batch_runner.store.read_result(job_id, index), file_ext)
+    except TableShapeError as e:
+        return jsonify({"error": str(e)}), 422
+    return Response(
+        body,
+        mimetype=get_mimetype(file_ext),
+        headers={"Content-disposition": f"attachment; filename={file_name}.{file_ext}"}
+    )
+
+
+@app.route('/ocr/batch/<job_id>/stream', methods=['GET'])
+@api_bp.route('/ocr/batch/<job_id>/stream', methods=['GET'])
+def ocr_batch_stream(job_id):
+    job = batch_runner.store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    
+    # url_for needs the request context, which is gone once the generator runs
+    result_urls = {i: url_for('api.ocr_batch_result', job_id=job_id, index=i)
+                   for i in range(job["file_count"])}
+    
+    def generate():
+        # Emit one JSON line per file as it finishes, then a final summary line
+        reported = set()
+        while True:
+            job = batch_runner.store.get(job_id)
+            if job is None:
+                # Removed while the stream was open
+                yield json.dumps({"job_id": job_id, "status": STATUS_ERROR, "error": "Unknown job"}) + "\n"
+                return
+            for file_state in job["files"]:
+                if file_state["index"] in reported or file_state["status"] not in (STATUS_DONE, STATUS_ERROR):
+                    continue
+                reported.add(file_state["index"])
+                if file_state["status"] == STATUS_DONE:
+                    file_state["result_url"] = result_urls[file_state["index"]]
+                yield json.dumps(file_state) + "\n"
+            
+            if job["status"] == STATUS_DONE:
+                yield json.dumps({"job_id": job_id, "status": STATUS_DONE, "counts": job["counts"]}) + "\n"
+                return
+            if job["status"] == STATUS_ERROR:
+                # Its worker stopped (see BatchStore): the remaining files will never finish
+                yield json.dumps({"job_id": job_id, "status": STATUS_ERROR, "counts": job["counts"],
+                                  "error": job["error"]}) + "\n"
+                return
+            time.sleep(0.5)
+    
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
 @app.route('/summary', methods=['POST'])
 @api_bp.route('/summary', methods=['POST'])
+@tracked('summary')
 def summary():
     # Check if URL is provided
     url = request.form.get('url', '')
@@ -116,28 +497,138 @@ def summary():
     model = request.form.get('model', config['API']['DefaultModel'])
     
     try:
-        return_code, site_text, file_name = site_scraper(url)
-        if return_code != 200:
-            raise ValueError(site_text)
+        site_text, file_name = prepare_site(model, url, prompt_text, is_crawl_request())
   
+        if is_stream_request():
+            return stream_response(model, site_text, file_name, prompt_text, file_ext, file_name)
+        
         # Call the function to create summary
-        output_text = call_ai(model, site_text, file_name, prompt_text)
+        output_text, cache_headers = cached_call_ai(model, site_text, file_name, prompt_text)
                 
         # Return the processed content directly
         return Response(
             output_text,
             mimetype=get_mimetype(file_ext),
-            headers={"Content-disposition": f"attachment; filename={file_name}.{file_ext}"}
+            headers={"Content-disposition": f"attachment; filename={file_name}.{file_ext}",
+                     **cache_headers}
         )
     
+    except AdmissionRejected as e:
+        return rate_limited(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def job_links(job_id):
+    return {
+        "status_url": url_for('api.job_status', job_id=job_id),
+        "result_url": url_for('api.job_result', job_id=job_id)
+    }
+
+
+@app.route('/ocr/jobs', methods=['POST'])
+@api_bp.route('/ocr/jobs', methods=['POST'])
+def ocr_job():
+    # Same form as /ocr, answered with a job ID; api/job_worker.py does the work
+    try:
+        check_content_length(request.content_length)
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return jsonify({"error": "No file provided"}), 400
+    
+    prompt_text = request.form.get('prompt_text', '')
+    file_ext = request.form.get('file_ext', '')
+    model = request.form.get('model', config['API']['DefaultModel'])
+    
+    try:
+        job_id = job_queue.enqueue(KIND_OCR, model, prompt_text, file_ext,
+                                   file_name=secure_filename(file.filename), input_path=spool_upload(file))
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    
+    return jsonify({"job_id": job_id, **job_links(job_id)}), 202
+
+
+@app.route('/summary/jobs', methods=['POST'])
+@api_bp.route('/summary/jobs', methods=['POST'])
+def summary_job():
+    url = request.form.get('url', '')
+    if not url:
+        return jsonify({"error": "URL is required"}), 400
+    
+    prompt_text = request.form.get('prompt_text', '')
+    file_ext = request.form.get('file_ext', '')
+    model = request.form.get('model', config['API']['DefaultModel'])
+    
+    try:
+        job_id = job_queue.enqueue(KIND_SUMMARY, model, prompt_text, file_ext, url=url)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    
+    return jsonify({"job_id": job_id, **job_links(job_id)}), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+@api_bp.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    
+    if job["status"] == JOB_DONE:
+        job["result_url"] = url_for('api.job_result', job_id=job_id)
+    return jsonify(job)
+
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+@api_bp.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if job["status"] != JOB_DONE:
+        return jsonify({"error": f"Job is {job['status']}", **job}), 409
+    
+    file_ext = job["file_ext"]
+    file_name = os.path.splitext(job["file_name"] or "summary")[0]
+    try:
+        body = output_body(job_queue.read_result(job_id), file_ext)
+    except TableShapeError as e:
+        return jsonify({"error": str(e)}), 422
+    return Response(
+        body,
+        mimetype=get_mimetype(file_ext),
+        headers={"Content-disposition": f"attachment; filename={file_name}.{file_ext}"}
+    )
+
+
+def job_stats():
+    # Health must not fail because the queue database is busy or missing
+    try:
+        return job_queue.stats()
+    except Exception as e:
+        return {"error": str(e)}
 
 
 @app.route('/health', methods=['GET'])
 @api_bp.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy"})
+    # Outbound call latency/retries (e.g. ScrapingFish) for this worker
+    # and the router's view of each provider, plus the job queue's backlog
+    return jsonify({"status": "healthy", "http": http_stats.snapshot(), "router": provider_router.snapshot(),
+                    "jobs": job_stats()})
+
+@app.route('/metrics', methods=['GET'])
+@api_bp.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus text format, aggregated across gunicorn workers
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
 
 # Register the blueprint
 app.register_blueprint(api_bp)
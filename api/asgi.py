@@ -0,0 +1,254 @@
+import asyncio
+import os
+import time
+
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from werkzeug.utils import secure_filename
+
+from utils.config import config
+from utils.scraper import site_scraper
+from utils.crawler import crawl_site_async
+from utils.result_cache import result_cache, CACHE_HIT, CACHE_MISS
+from utils.sse import format_sse
+from utils.http_session import http_stats
+from utils.router import provider_router
+from utils.admission import AdmissionRejected
+from utils.uploads import UploadTooLarge, check_content_length, spool_stream, open_spooled, remove_spooled
+from utils.metrics import set_labels, stage_timer, observe_stage, provider_call, track_request, render_metrics
+from utils.call_ai_async import call_ai_async, stream_ai_async, handle_eml_async, run_cpu
+from utils.tables import TableShapeError, is_table_format, encode_table
+from api.app import get_mimetype, result_cache_key
+import utils.call_ai as ai
+
+# Async serving mode: the same /add, /ocr, /summary, /health and /metrics
+# contracts as api/app.py, but provider calls are awaited on one event loop and
+# parsing runs in a process pool. Batch and job endpoints stay on the WSGI app.
+app = FastAPI(title="ARU API", docs_url=None, redoc_url=None, openapi_url=None)
+
+# Routes are served both at the root and under /api, like the Flask blueprint
+router = APIRouter()
+
+
+def error_response(message, status_code):
+    return JSONResponse({"error": message}, status_code=status_code)
+
+
+def rate_limited(e):
+    return JSONResponse({"error": str(e), "retry_after": e.retry_after}, status_code=429,
+                        headers={"Retry-After": str(e.retry_after)})
+
+
+def is_stream_request(request, form):
+    return form.get('stream', request.query_params.get('stream', '')).lower() in ('1', 'true', 'yes')
+
+
+def is_crawl_request(request, form):
+    default = config['Crawler'].get('Crawl', 'False')
+    return form.get('crawl', request.query_params.get('crawl', default)).lower() in ('1', 'true', 'yes')
+
+
+@router.post('/add')
+async def add_numbers(request: Request):
+    try:
+        data = await request.json()
+    except Exception:
+        data = None
+
+    if not isinstance(data, dict) or 'a' not in data or 'b' not in data:
+        return error_response("Missing required parameters 'a' and 'b'", 400)
+
+    try:
+        return {"result": float(data['a']) + float(data['b'])}
+    except (TypeError, ValueError):
+        return error_response("Parameters 'a' and 'b' must be numbers", 400)
+
+
+async def cached_call_ai(model, file_blob, file_name, prompt_text):
+    """
+    Async form of api.app.cached_call_ai.
+
+    Returns:
+        tuple: (output_text, cache_headers)
+    """
+    if not config['Cache'].getboolean('Enabled', True):
+        return await call_ai_async(model, file_blob, file_name, prompt_text), {}
+
+    # The cache may hash megabytes and touch disk: keep it off the event loop
+    key = await asyncio.to_thread(result_cache_key, model, file_blob, file_name, prompt_text)
+    output_text, tier = await asyncio.to_thread(result_cache.get, key)
+    if output_text is not None:
+        return output_text, {"X-Cache": CACHE_HIT, "X-Cache-Tier": tier}
+
+    output_text = await call_ai_async(model, file_blob, file_name, prompt_text)
+    await asyncio.to_thread(result_cache.put, key, output_text)
+    return output_text, {"X-Cache": CACHE_MISS}
+
+
+async def stream_response(model, file_blob, file_name, prompt_text, file_ext, download_name):
+    # Async form of api.app.stream_response: same SSE events and headers
+    use_cache = config['Cache'].getboolean('Enabled', True)
+    key, cached_text, tier = None, None, None
+    if use_cache:
+        key = await asyncio.to_thread(result_cache_key, model, file_blob, file_name, prompt_text)
+        cached_text, tier = await asyncio.to_thread(result_cache.get, key)
+
+    headers = {
+        "Content-disposition": f"attachment; filename={download_name}.{file_ext}",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    }
+    if use_cache:
+        headers["X-Cache"] = CACHE_HIT if cached_text is not None else CACHE_MISS
+        if tier:
+            headers["X-Cache-Tier"] = tier
+
+    async def generate():
+        set_labels(model=model, file_type=ai.get_file_type(file_name), prompt_text=prompt_text)
+        start = time.perf_counter()
+        if cached_text is not None:
+            yield format_sse("chunk", {"text": cached_text})
+            yield format_sse("done", {"text": cached_text, "ttft_ms": 0, "total_ms": 0})
+            return
+
+        ttft_ms = None
+        parts = []
+        try:
+            with provider_call(model):
+                async for chunk in stream_ai_async(model, file_blob, file_name, prompt_text):
+                    if ttft_ms is None:
+                        ttft_ms = round((time.perf_counter() - start) * 1000, 1)
+                        observe_stage("ttft", ttft_ms / 1000)
+                    parts.append(chunk)
+                    yield format_sse("chunk", {"text": chunk})
+
+            output_text = ai.post_process_csv("".join(parts))
+            if use_cache:
+                await asyncio.to_thread(result_cache.put, key, output_text)
+
+            total_ms = round((time.perf_counter() - start) * 1000, 1)
+            yield format_sse("done", {"text": output_text, "ttft_ms": ttft_ms, "total_ms": total_ms})
+        except AdmissionRejected as e:
+            yield format_sse("error", {"error": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            yield format_sse("error", {"error": str(e)})
+
+    return StreamingResponse(generate(), media_type="text/event-stream", headers=headers)
+
+
+@router.post('/ocr')
+async def ocr(request: Request):
+    with track_request('ocr'):
+        # Fail fast on oversized uploads before the body is parsed
+        try:
+            check_content_length(int(request.headers.get('content-length', 0)))
+        except UploadTooLarge as e:
+            return error_response(str(e), 413)
+
+        form = await request.form()
+        file = form.get('file')
+        if file is None or isinstance(file, str):
+            return error_response("No file part", 400)
+
+        prompt_text = form.get('prompt_text', '')
+        file_ext = form.get('file_ext', '')
+        model = form.get('model', config['API']['DefaultModel'])
+
+        if not file.filename:
+            return error_response("No selected file", 400)
+
+        spooled_path = None
+        try:
+            file_name = secure_filename(file.filename)
+            set_labels(model=model, file_type=ai.get_file_type(file_name), prompt_text=prompt_text)
+            # Copy to a named spool file in chunks and map it: the CPU pool and SDK uploads reopen it by path
+            with stage_timer("upload_read"):
+                spooled_path = await asyncio.to_thread(spool_stream, file.file)
+                file_blob = open_spooled(spooled_path)
+            with stage_timer("handle_eml"):
+                file_blob = await handle_eml_async(file_blob, file_name)
+
+            if is_stream_request(request, form):
+                response = await stream_response(model, file_blob, file_name, prompt_text, file_ext,
+                                                 os.path.splitext(file_name)[0])
+            else:
+                output_text, cache_headers = await cached_call_ai(model, file_blob, file_name, prompt_text)
+                if is_table_format(file_ext):
+                    output_text = await run_cpu(encode_table, output_text, file_ext)
+                response = Response(
+                    output_text,
+                    media_type=get_mimetype(file_ext),
+                    headers={"Content-disposition": f"attachment; filename={os.path.splitext(file_name)[0]}.{file_ext}",
+                             **cache_headers}
+                )
+
+        except UploadTooLarge as e:
+            response = error_response(str(e), 413)
+        except AdmissionRejected as e:
+            response = rate_limited(e)
+        except TableShapeError as e:
+            response = error_response(str(e), 422)
+        except Exception as e:
+            response = error_response(str(e), 500)
+
+        # Runs once the response (including a stream) has been sent
+        if spooled_path is not None:
+            response.background = BackgroundTask(remove_spooled, spooled_path)
+        return response
+
+
+@router.post('/summary')
+async def summary(request: Request):
+    with track_request('summary'):
+        form = await request.form()
+        url = form.get('url', '')
+        if not url:
+            return error_response("URL is required", 400)
+
+        prompt_text = form.get('prompt_text', '')
+        file_ext = form.get('file_ext', '')
+        model = form.get('model', config['API']['DefaultModel'])
+
+        try:
+            set_labels(model=model, file_type="site", prompt_text=prompt_text)
+            with stage_timer("scrape"):
+                if is_crawl_request(request, form):
+                    return_code, site_text, file_name = await crawl_site_async(url)
+                else:
+                    # The crawler cache and scraper session are synchronous
+                    return_code, site_text, file_name = await asyncio.to_thread(site_scraper, url)
+            if return_code != 200:
+                raise ValueError(site_text)
+
+            if is_stream_request(request, form):
+                return await stream_response(model, site_text, file_name, prompt_text, file_ext, file_name)
+
+            output_text, cache_headers = await cached_call_ai(model, site_text, file_name, prompt_text)
+
+            return Response(
+                output_text,
+                media_type=get_mimetype(file_ext),
+                headers={"Content-disposition": f"attachment; filename={file_name}.{file_ext}",
+                         **cache_headers}
+            )
+
+        except AdmissionRejected as e:
+            return rate_limited(e)
+        except Exception as e:
+            return error_response(str(e), 500)
+
+
+@router.get('/health')
+async def health_check():
+    return {"status": "healthy", "http": http_stats.snapshot(), "router": provider_router.snapshot()}
+
+
+@router.get('/metrics')
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(body, headers={"Content-Type": content_type})
+
+
+app.include_router(router)
+app.include_router(router, prefix='/api')
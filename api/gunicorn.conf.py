@@ -0,0 +1,27 @@
+# Gunicorn settings for the API (command-line flags in systemd override these)
+import os
+import shutil
+
+bind = "0.0.0.0:8000"
+workers = 3
+
+# Workers write metrics here so /api/metrics can aggregate across all of them.
+# Set before the workers import prometheus_client (they inherit the master's env).
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/aru-api-metrics")
+
+
+def on_starting(server):
+    # Start each run with empty metric files so old worker PIDs do not linger
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def worker_exit(server, worker):
+    from utils.ai_clients import close_clients
+    close_clients()
@@ -0,0 +1,169 @@
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+
+from utils.config import config
+from utils.admission import AdmissionRejected, PRIORITY_BATCH, set_priority
+from utils.job_queue import job_queue, KIND_SUMMARY, JOB_DONE
+
+
+def run_job(job):
+    """
+    Runs a claimed job the way /ocr or /summary would, with the same EML
+    handling and result cache, queued behind interactive calls.
+
+    Returns:
+        str: The output text
+    """
+    # Imported here so the supervisor process never loads the API or the provider clients
+    from api.app import prepare_upload, prepare_site, cached_call_ai
+    from utils.uploads import open_spooled
+
+    set_priority(PRIORITY_BATCH)
+    model, prompt_text = job["model"], job["prompt_text"]
+    if job["kind"] == KIND_SUMMARY:
+        site_text, file_name = prepare_site(model, job["url"], prompt_text)
+        output_text, _ = cached_call_ai(model, site_text, file_name, prompt_text)
+        return output_text
+
+    file_blob = prepare_upload(model, open_spooled(job["input_path"]), job["file_name"], prompt_text)
+    output_text, _ = cached_call_ai(model, file_blob, job["file_name"], prompt_text)
+    return output_text
+
+
+class JobWorker:
+    """
+    One worker process: each of its threads claims and runs one job at a
+    time, and the main thread renews the leases of the running jobs. On
+    SIGTERM it stops claiming and lets the running jobs finish.
+    """
+    def __init__(self, queue, threads=4, poll_seconds=1.0):
+        self.queue = queue
+        self.threads = threads
+        self.poll_seconds = poll_seconds
+        self.stopping = threading.Event()
+        self._running = {}  # job_id -> lease_token
+        self._lock = threading.Lock()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stopping.set())
+        signal.signal(signal.SIGINT, lambda signum, frame: self.stopping.set())
+
+        threads = [threading.Thread(target=self._loop, args=(i,), name=f"job-{i}") for i in range(self.threads)]
+        for thread in threads:
+            thread.start()
+
+        # Renew well before the lease runs out, until the last running job has finished
+        renew_every = max(1.0, self.queue.lease_seconds / 3)
+        last_renew = time.monotonic()
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(min(renew_every, self.poll_seconds))
+            if time.monotonic() - last_renew >= renew_every:
+                last_renew = time.monotonic()
+                self._renew_leases()
+
+    def _renew_leases(self):
+        with self._lock:
+            running = list(self._running.items())
+        for job_id, lease_token in running:
+            if not self.queue.renew(job_id, lease_token):
+                print(f"Job {job_id}: lease lost, its result will be discarded")
+
+    def _loop(self, index):
+        worker = f"{socket.gethostname()}:{os.getpid()}:{index}"
+        while not self.stopping.is_set():
+            try:
+                job = self.queue.claim(worker)
+            except Exception as e:
+                # e.g. the database is locked for longer than the timeout: try again later
+                print(f"Job claim failed: {e}")
+                job = None
+            if job is None:
+                self.stopping.wait(self.poll_seconds)
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        job_id, lease_token = job["id"], job["lease_token"]
+        with self._lock:
+            self._running[job_id] = lease_token
+
+        start = time.perf_counter()
+        try:
+            output_text = run_job(job)
+            status = JOB_DONE if self.queue.complete(job_id, lease_token, output_text) else None
+        except AdmissionRejected as e:
+            # Out of provider quota: come back when it refills, without using up an attempt
+            status = self.queue.fail(job_id, lease_token, str(e), retry_after=e.retry_after, count_attempt=False)
+        except Exception as e:
+            status = self.queue.fail(job_id, lease_token, str(e))
+        finally:
+            with self._lock:
+                self._running.pop(job_id, None)
+
+        print(f"Job {job_id} ({job['kind']} via {job['model']}, attempt {job['attempts']}): "
+              f"{status or 'lease lost'} in {time.perf_counter() - start:.1f} s")
+
+
+def worker_main(threads, poll_seconds):
+    JobWorker(job_queue, threads, poll_seconds).run()
+
+
+def supervise(processes, threads, poll_seconds, sweep_seconds=600):
+    """
+    Starts the worker processes and replaces any that die, until SIGTERM or
+    SIGINT. Also sweeps old finished jobs out of the queue.
+    """
+    # Spawned, not forked: each worker starts clean and creates its own clients and pools
+    context = multiprocessing.get_context("spawn")
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+    def start():
+        process = context.Process(target=worker_main, args=(threads, poll_seconds), name="aru-job-worker")
+        process.start()
+        return process
+
+    workers = [start() for _ in range(processes)]
+    print(f"Job workers started: {processes} processes x {threads} threads, queue {job_queue.db_path}")
+    last_sweep = 0.0
+    while not stopping.is_set():
+        for i, process in enumerate(workers):
+            if not process.is_alive():
+                print(f"Job worker {process.pid} exited with {process.exitcode}, restarting")
+                workers[i] = start()
+
+        if time.monotonic() - last_sweep > sweep_seconds:
+            last_sweep = time.monotonic()
+            try:
+                deleted = job_queue.sweep()
+                if deleted:
+                    print(f"Swept {deleted} finished jobs")
+            except Exception as e:
+                print(f"Job sweep failed: {e}")
+        stopping.wait(1.0)
+
+    # Running jobs finish first; a job cut off by a kill is picked up again once its lease runs out
+    for process in workers:
+        process.terminate()
+    for process in workers:
+        process.join()
+
+
+# Runs the jobs queued by /ocr/jobs and /summary/jobs (see utils/job_queue.py).
+# Example usage (from the repo root):
+#   python -m api.job_worker --processes 2 --threads 4
+if __name__ == "__main__":
+    settings = config['Jobs']
+    parser = argparse.ArgumentParser(description="ARU job worker")
+    parser.add_argument("--processes", type=int, default=settings.getint('Processes', 2))
+    parser.add_argument("--threads", type=int, default=settings.getint('ThreadsPerProcess', 4),
+                        help="Concurrent jobs per process")
+    args = parser.parse_args()
+
+    supervise(args.processes, args.threads, settings.getfloat('PollSeconds', 1.0))
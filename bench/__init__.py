@@ -0,0 +1 @@
+# Offline pipeline benchmarks (fixtures, provider stand-ins, runner)
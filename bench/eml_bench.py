@@ -0,0 +1,67 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import io
+import statistics
+import tempfile
+import time
+import tracemalloc
+from email import policy
+from email.parser import BytesParser
+
+from bench.fixtures import make_eml_thread
+from utils.eml_extractor import extract_email_body, extract_email_body_lazy
+from utils.uploads import open_spooled
+
+
+def full_parse(eml_blob):
+    # What extract_email_chain did before: parse everything, then walk the parts
+    msg = BytesParser(policy=policy.default).parse(io.BytesIO(eml_blob))
+    return extract_email_body(msg)
+
+
+def lazy_parse(eml_blob):
+    return extract_email_body_lazy(eml_blob)[1]
+
+
+def measure(fn, eml_blob, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(eml_blob)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    fn(eml_blob)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak / (1 << 20)
+
+
+# Example usage:
+#   python bench/eml_bench.py --sizes 2 10 50 --repeat 5
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Full vs lazy EML parsing on threads with large attachments")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2, 10, 50], help="Attachment sizes (MB)")
+    parser.add_argument("--messages", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'attachment':>10}{'full ms':>10}{'full MB':>10}{'lazy ms':>10}{'lazy MB':>10}{'mmap ms':>10}{'mmap MB':>10}")
+    for size in args.sizes:
+        eml_blob = make_eml_thread(args.messages, size << 20)
+        if full_parse(eml_blob) != lazy_parse(eml_blob):
+            raise RuntimeError("Lazy parse differs from the full parse")
+
+        with tempfile.NamedTemporaryFile(suffix=".eml", delete=False) as f:
+            f.write(eml_blob)
+        try:
+            spooled = open_spooled(f.name)
+            results = [measure(full_parse, eml_blob, args.repeat), measure(lazy_parse, eml_blob, args.repeat),
+                       measure(lazy_parse, spooled, args.repeat)]
+            spooled.close()
+        finally:
+            os.remove(f.name)
+
+        print(f"{size:>8} MB" + "".join(f"{ms:>10.1f}{mb:>10.1f}" for ms, mb in results))
@@ -0,0 +1,176 @@
+import io
+import struct
+import zlib
+from email.message import EmailMessage
+from email.utils import format_datetime
+from datetime import datetime, timedelta
+
+
+def _pdf_escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def make_pdf(pages):
+    """
+    Writes a minimal PDF without extra dependencies.
+
+    Args:
+        pages (list): One list of text lines per page; an empty list gives a page
+            with only vector graphics (a stand-in for a scanned page)
+
+    Returns:
+        bytes: The PDF file
+    """
+    objects = []  # object bodies, numbered from 1
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog_id = add(None)  # filled in once the page tree exists
+    pages_id = add(None)
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    page_ids = []
+    for lines in pages:
+        if lines:
+            ops = ["BT /F1 9 Tf 11 TL 40 800 Td"]
+            ops += [f"({_pdf_escape(line)}) Tj T*" for line in lines]
+            ops.append("ET")
+        else:
+            # Grey blocks where a scanner would have put an image
+            ops = ["0.5 g"] + [f"40 {760 - i * 30} 500 20 re f" for i in range(20)]
+        stream = "\n".join(ops).encode('latin-1')
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>".encode()))
+
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[pages_id - 1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+    objects[catalog_id - 1] = f"<< /Type /Catalog /Pages {pages_id} 0 R >>".encode()
+
+    output = io.BytesIO()
+    output.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(output.tell())
+        output.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+
+    xref_offset = output.tell()
+    output.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        output.write(b"%010d 00000 n \n" % offset)
+    output.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                 % (len(objects) + 1, catalog_id, xref_offset))
+    return output.getvalue()
+
+
+def loss_run_lines(page, rows=60):
+    lines = [f"ACME Mutual - Loss Run - Page {page + 1}",
+             "Claim #   Date of Loss   Claimant          Paid         Reserve      Incurred    Pct"]
+    for r in range(rows):
+        n = page * rows + r
+        lines.append(f"C-{n:06d}  01/{n % 28 + 1:02d}/2024     Claimant {n:<8} ${n * 10:,}.50   "
+                     f"${n * 3:,}.25    ${n * 13:,}.75   {n % 100}%")
+    return lines
+
+
+def make_text_pdf(num_pages=20):
+    return make_pdf([loss_run_lines(page) for page in range(num_pages)])
+
+
+def make_scanned_pdf(num_pages=20):
+    return make_pdf([[] for _ in range(num_pages)])
+
+
+def make_mixed_pdf(num_pages=20):
+    # Every third page has no text layer
+    return make_pdf([[] if page % 3 == 2 else loss_run_lines(page) for page in range(num_pages)])
+
+
+def make_xlsx(sheets=3, rows=5000):
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    for s in range(sheets):
+        worksheet = workbook.create_sheet(f"Year {2020 + s}")
+        worksheet.append(["Claim #", "Date of Loss", "Claimant", "Paid", "Reserve", "Incurred", "Pct"])
+        for r in range(rows):
+            worksheet.append([f"C{s}-{r:06d}", f"2024-01-{r % 28 + 1:02d}", f"Claimant {r}",
+                              r * 10.5, r * 2.25, r * 12.75, (r % 100) / 100])
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+def make_eml_thread(messages=40, attachment_bytes=2 << 20):
+    """
+    An email thread in which every reply quotes the whole history, with one
+    large PDF attachment, like the chains users upload.
+    """
+    people = [("Alice Broker", "alice@brokerage.com"), ("Bob Underwriter", "bob@carrier.com"),
+              ("Carol Risk", "carol@insured.com"), ("Dan Claims", "dan@carrier.com")]
+    start = datetime(2024, 3, 1, 9, 0)
+
+    history = ""
+    for i in range(messages):
+        name, address = people[i % len(people)]
+        sent = start + timedelta(hours=i * 5)
+        body = (f"Hi all,\n\nUpdate {i + 1}: we reviewed the loss runs for policy year {2020 + i % 4}. "
+                f"Action: {name.split()[0]} to send the revised schedule by Friday.\n\n"
+                f"Thanks,\n{name}\n")
+        quoted = "".join(f"> {line}\n" if line else ">\n" for line in history.splitlines())
+        header = f"On {format_datetime(sent)}, {name} <{address}> wrote:\n" if history else ""
+        history = body + ("\n" + header + quoted if history else "")
+
+    msg = EmailMessage()
+    msg["From"] = f"{people[0][0]} <{people[0][1]}>"
+    msg["To"] = ", ".join(f"{n} <{a}>" for n, a in people[1:])
+    msg["Cc"] = "Team <team@brokerage.com>"
+    msg["Subject"] = "RE: Loss runs for renewal"
+    msg["Date"] = format_datetime(start + timedelta(hours=messages * 5))
+    msg.set_content(history)
+    msg.add_alternative("<html><body>" + "".join(f"<p>{line}</p>" for line in history.splitlines()) +
+                        "</body></html>", subtype="html")
+    if attachment_bytes:
+        msg.add_attachment(make_scanned_pdf(1) + b"%" * attachment_bytes,
+                           maintype="application", subtype="pdf", filename="loss_run.pdf")
+    return msg.as_bytes()
+
+
+def make_png(width=256, height=256):
+    # Uncompressed-looking gradient, encoded as a real PNG
+    raw = b"".join(b"\x00" + bytes((x + y) % 256 for x in range(width) for _ in range(3)) for y in range(height))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)) +
+            chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b""))
+
+
+def make_scraped_html(sections=30):
+    parts = ["<html><head><title>ACME Captive Insurance</title><script>var x = 1;</script></head><body>",
+             "<nav><a href='/about'>About</a> <a href='/products'>Products</a> <a href='/contact'>Contact</a></nav>"]
+    for s in range(sections):
+        parts.append(f"<section><h2>Section {s}</h2><p>ACME provides captive insurance programs for "
+                     f"mid-sized fleets, with loss control service number {s}.</p></section>")
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def build_corpus(scale=1):
+    """
+    Returns:
+        dict: fixture name -> (file_name, file_blob)
+    """
+    return {
+        "text_pdf": ("loss_run_text.pdf", make_text_pdf(20 * scale)),
+        "scanned_pdf": ("loss_run_scanned.pdf", make_scanned_pdf(20 * scale)),
+        "mixed_pdf": ("loss_run_mixed.pdf", make_mixed_pdf(20 * scale)),
+        "xlsx": ("loss_run.xlsx", make_xlsx(3, 5000 * scale)),
+        "eml": ("thread.eml", make_eml_thread(40 * scale)),
+        "image": ("loss_run.png", make_png()),
+        "html": ("acme.com", make_scraped_html(30 * scale)),
+    }
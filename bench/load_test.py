@@ -0,0 +1,130 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import socket
+import statistics
+import subprocess
+import time
+
+import httpx
+
+from utils.call_ai import load_prompts
+from bench.fixtures import make_text_pdf
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    # Production shapes: gunicorn sync workers vs a single uvicorn worker
+    "wsgi": ["gunicorn", "--workers", "3", "--bind", "127.0.0.1:{port}", "bench.standin_apps:wsgi_app"],
+    "asgi": ["uvicorn", "--workers", "1", "--host", "127.0.0.1", "--port", "{port}", "--no-access-log",
+             "bench.standin_apps:asgi_app"],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode, port, latency):
+    command = [arg.format(port=port) for arg in SERVERS[mode]]
+    command[0] = os.path.join(os.path.dirname(sys.executable), command[0])
+    env = dict(os.environ, ARU_STANDIN_LATENCY=str(latency))
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    return subprocess.Popen(command, cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_for_server(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/api/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not start")
+
+
+async def load(base_url, total, concurrency, file_blob, prompt_text):
+    """
+    Posts total /api/ocr requests with at most concurrency in flight.
+
+    Returns:
+        dict: Throughput and latency percentiles
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=600) as client:
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/api/ocr", files={"file": ("load.pdf", file_blob)},
+                                             data={"prompt_text": prompt_text, "file_ext": "csv"})
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "seconds": round(elapsed, 2),
+        "requests_per_s": round(total / elapsed, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+    }
+
+
+def run(modes, total, concurrency, latency, url=None):
+    _, prompt_map = load_prompts()
+    prompt_text = next(p['Prompt'] for p in prompt_map.values() if p['id'] == 'ocr')
+    file_blob = make_text_pdf(num_pages=5)
+
+    results = {}
+    for mode in modes:
+        server = None
+        base_url = url
+        if base_url is None:
+            port = free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            server = start_server(mode, port, latency)
+        try:
+            wait_for_server(base_url)
+            results[mode] = asyncio.run(load(base_url, total, concurrency, file_blob, prompt_text))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+        print(f"{mode}: {results[mode]}")
+
+    return results
+
+
+# Example usage (stand-in provider with 1 s latency, no network):
+#   python bench/load_test.py --requests 200 --concurrency 100
+#   python bench/load_test.py --url http://127.0.0.1:8000 --mode asgi
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput of the WSGI vs ASGI API under concurrent load")
+    parser.add_argument("--mode", action="append", choices=list(SERVERS), help="Default: both")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=1.0, help="Stand-in provider latency in seconds")
+    parser.add_argument("--url", help="Load an already running server instead of starting one")
+    args = parser.parse_args()
+
+    results = run(args.mode or list(SERVERS), args.requests, args.concurrency, args.latency, args.url)
+    if "wsgi" in results and "asgi" in results:
+        speedup = results["asgi"]["requests_per_s"] / results["wsgi"]["requests_per_s"]
+        print(f"ASGI throughput is {speedup:.1f}x WSGI")
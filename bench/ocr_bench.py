@@ -0,0 +1,73 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from utils.config import config
+import utils.call_ai as ai
+import utils.call_ai_async as ai_async
+from bench.fixtures import make_mixed_pdf
+from bench.standins import StandinProvider, install_standins
+
+
+def text_only(file_blob, file_name):
+    # No OCR for a PDF that has any text layer: its scanned pages come back empty
+    config['PDF']['SelectiveOcr'] = 'False'
+    try:
+        return ai.extract_document_text(file_blob, file_name, "pdf")
+    finally:
+        config['PDF']['SelectiveOcr'] = 'True'
+
+
+def whole_document(file_blob, file_name):
+    # The only way to get the scanned pages before: OCR every page
+    return ai.mistral_extract_text_ocr(file_blob, file_name)
+
+
+def selective(file_blob, file_name):
+    return ai.extract_document_text(file_blob, file_name, "pdf")
+
+
+def selective_async(file_blob, file_name):
+    return asyncio.run(ai_async.extract_document_text_async(file_blob, file_name, "pdf"))
+
+
+def pages_with_text(text, num_pages):
+    # Pages (of the "--- Page N ---" layout, or OCR pages) that came back with content
+    if "--- Page " not in text:
+        return sum(1 for page in text.split("\n\n") if page.strip())
+    return sum(1 for part in text.split("--- Page ")[1:] if part.split("---\n", 1)[-1].strip())
+
+
+# Every third page of the fixture is a scan. OCR is billed per page, and a
+# stand-in OCR request takes --latency plus --page-latency per page.
+# Example usage:
+#   python bench/ocr_bench.py --pages 20 60 --latency 0.3 --page-latency 0.05
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Whole-document vs per-page OCR on mixed PDFs")
+    parser.add_argument("--pages", type=int, nargs="+", default=[20, 60])
+    parser.add_argument("--latency", type=float, default=0.3, help="Per OCR request (s)")
+    parser.add_argument("--page-latency", type=float, default=0.05, help="Per OCR page (s)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    config['Admission']['Enabled'] = 'False'
+    modes = [("text only", text_only), ("whole document", whole_document),
+             ("selective", selective), ("selective async", selective_async)]
+
+    print(f"{'pages':>6}  {'mode':<16}{'ms':>10}{'OCR pages':>11}{'requests':>10}{'with text':>11}")
+    for num_pages in args.pages:
+        file_name, file_blob = "mixed.pdf", make_mixed_pdf(num_pages)
+        for label, fn in modes:
+            timings = []
+            for _ in range(args.repeat):
+                provider = StandinProvider(latency=args.latency, ocr_page_latency=args.page_latency)
+                install_standins(provider)
+                start = time.perf_counter()
+                text = fn(file_blob, file_name)
+                timings.append((time.perf_counter() - start) * 1000)
+            print(f"{num_pages:>6}  {label:<16}{statistics.median(timings):>10.1f}{provider.ocr_pages:>11}"
+                  f"{provider.calls:>10}{pages_with_text(text, num_pages):>11}")
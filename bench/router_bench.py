@@ -0,0 +1,70 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import statistics
+import time
+
+from utils.config import config
+from utils.call_ai import load_prompts
+from utils.router import ProviderRouter
+from bench.fixtures import build_corpus
+from bench.standins import StandinProvider, install_standins
+import api.app as api
+
+config['Cache']['Enabled'] = 'False'
+config['Admission']['Enabled'] = 'False'
+
+
+def percentile(timings, pct):
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * pct / 100))]
+
+
+def run_requests(model, file_name, file_blob, prompt_text, requests):
+    timings, errors = [], 0
+    for _ in range(requests):
+        start = time.perf_counter()
+        try:
+            api.call_ai(model, file_blob, file_name, prompt_text)
+        except Exception:
+            errors += 1
+            continue
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, errors
+
+
+# Gemini is usually fast with a heavy tail (and, with --fail-every, flaky);
+# OpenAI is slower but steady. Compares pinning Gemini with routing and hedging.
+# Example usage:
+#   python bench/router_bench.py --requests 200 --latency 0.05 --slow-latency 1.0
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fixed provider vs latency routing vs hedging")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="Gemini's usual latency (s)")
+    parser.add_argument("--slow-every", type=int, default=10, help="Every Nth Gemini call is slow")
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    parser.add_argument("--fail-every", type=int, default=0, help="Every Nth Gemini call fails")
+    parser.add_argument("--steady-latency", type=float, default=0.08, help="OpenAI's latency (s)")
+    args = parser.parse_args()
+
+    _, prompt_map = load_prompts()
+    prompt_text = next(p['Prompt'] for p in prompt_map.values() if p['id'] == 'text')
+    file_name, file_blob = build_corpus()["image"]
+
+    scenarios = [("Gemini only", "Gemini", False), ("routed", "Auto", False), ("routed+hedge", "Auto", True)]
+    print(f"{'scenario':<14}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}{'errors':>8}   calls")
+    for label, model, hedge in scenarios:
+        gemini = StandinProvider(latency=args.latency, slow_every=args.slow_every,
+                                 slow_latency=args.slow_latency, fail_every=args.fail_every)
+        openai = StandinProvider(latency=args.steady_latency)
+        install_standins(gemini, {"OpenAI": openai})
+        api.provider_router = ProviderRouter(providers=["Gemini", "OpenAI"], hedge=hedge)
+        # Scale the hedge floor to the stand-in latencies
+        api.provider_router.hedge_min = args.latency
+        api.provider_router.min_samples = 5
+
+        timings, errors = run_requests(model, file_name, file_blob, prompt_text, args.requests)
+        print(f"{label:<14}{percentile(timings, 50):>10.1f}{percentile(timings, 95):>10.1f}"
+              f"{percentile(timings, 99):>10.1f}{statistics.mean(timings):>10.1f}{errors:>8}"
+              f"   Gemini {gemini.calls}, OpenAI {openai.calls}")
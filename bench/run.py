@@ -0,0 +1,151 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+
+from utils.config import config
+import utils.call_ai as ai
+import utils.md_utils as md_utils
+from utils.tables import encode_table
+from utils.eml_extractor import extract_email_chain
+from utils.scraper import extract_site_text
+from bench.fixtures import build_corpus
+from bench.standins import StandinProvider, install_standins
+
+
+def time_runs(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "runs": repeat,
+        "min_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "mean_ms": round(statistics.mean(timings), 3),
+        "max_ms": round(max(timings), 3),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def build_cases(corpus, provider):
+    """
+    Returns:
+        list: (stage, fixture, fn) tuples
+    """
+    from api.app import call_ai, handle_eml
+
+    recordings = provider.recordings
+    _, prompt_map = ai.load_prompts()
+    prompts = {p['id']: p['Prompt'] for p in prompt_map.values()}
+
+    cases = []
+    for fixture, (file_name, file_blob) in corpus.items():
+        cases.append(("get_file_type", fixture, lambda n=file_name: ai.get_file_type(n)))
+
+    for fixture in ("text_pdf", "scanned_pdf", "mixed_pdf", "xlsx"):
+        file_name, file_blob = corpus[fixture]
+        file_type = ai.get_file_type(file_name)
+        cases.append(("handle_pdf_xls", fixture, lambda b=file_blob, t=file_type: ai.handle_pdf_xls(b, t)))
+
+    eml_name, eml_blob = corpus["eml"]
+    cases.append(("extract_email_chain", "eml", lambda: extract_email_chain(eml_blob)))
+    cases.append(("extract_site_text", "html", lambda: extract_site_text(corpus["html"][1])))
+
+    cases.append(("post_process_csv", "ocr_response", lambda: ai.post_process_csv(recordings["ocr"])))
+    csv_output = ai.post_process_csv(recordings["ocr"])
+    for file_ext in ("parquet", "arrow"):
+        cases.append(("encode_table", f"csv_output.{file_ext}", lambda e=file_ext: encode_table(csv_output, e)))
+    cases.append(("create_html_preview", "csv_output", lambda: md_utils.create_html_preview(csv_output, "csv")))
+    cases.append(("create_html_preview", "md_output", lambda: md_utils.create_html_preview(recordings["email"], "md")))
+
+    # Full path through call_ai with the stand-in provider behind the real SDK call sites
+    full_path = {
+        "text_pdf": "ocr", "scanned_pdf": "ocr", "mixed_pdf": "ocr", "xlsx": "ocr",
+        "image": "ocr", "eml": "email", "html": "summary",
+    }
+    for model in config['API']['Models'].split('|'):
+        for fixture, prompt_id in full_path.items():
+            file_name, file_blob = corpus[fixture]
+            if fixture == "eml":
+                fn = lambda n=file_name, b=file_blob, m=model, p=prompts[prompt_id]: call_ai(m, handle_eml(b, n), n, p)
+            elif fixture == "html":
+                fn = lambda n=file_name, b=file_blob, m=model, p=prompts[prompt_id]: call_ai(m, extract_site_text(b), n, p)
+            else:
+                fn = lambda n=file_name, b=file_blob, m=model, p=prompts[prompt_id]: call_ai(m, b, n, p)
+            cases.append((f"call_ai:{model}", fixture, fn))
+
+    return cases
+
+
+def run(repeat=5, latency=0.0, scale=1, stages=None):
+    # Stand-ins have no quota: admission waits would only skew the timings
+    config['Admission']['Enabled'] = 'False'
+    provider = install_standins(StandinProvider(latency=latency))
+    corpus = build_corpus(scale)
+
+    results = {}
+    for stage, fixture, fn in build_cases(corpus, provider):
+        if stages and not any(stage.startswith(s) for s in stages):
+            continue
+        fn()  # warm-up: imports, process pools, first-use caches
+        results.setdefault(stage, {})[fixture] = time_runs(fn, repeat)
+        print(f"{stage:>22} {fixture:<14} median {results[stage][fixture]['median_ms']:10.2f} ms")
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {"repeat": repeat, "latency_s": latency, "scale": scale},
+        "fixtures": {name: {"file_name": n, "bytes": len(b)} for name, (n, b) in corpus.items()},
+        "results": results,
+    }
+
+
+def compare(baseline, current):
+    # Print median change per stage/fixture between two result files
+    for stage, fixtures in current["results"].items():
+        for fixture, stats in fixtures.items():
+            before = baseline.get("results", {}).get(stage, {}).get(fixture)
+            if not before:
+                continue
+            change = (stats["median_ms"] - before["median_ms"]) / before["median_ms"] * 100 if before["median_ms"] else 0
+            print(f"{stage:>22} {fixture:<14} {before['median_ms']:10.2f} -> {stats['median_ms']:10.2f} ms ({change:+.1f}%)")
+
+
+# Example usage:
+#   python -m bench.run --repeat 5 --out bench_output.json
+#   python -m bench.run --compare bench_baseline.json --out bench_output.json
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline micro-benchmarks for the extraction pipeline")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.0, help="Stand-in provider latency in seconds")
+    parser.add_argument("--scale", type=int, default=1, help="Multiply fixture sizes")
+    parser.add_argument("--stage", action="append", help="Only run stages starting with this prefix")
+    parser.add_argument("--out", default="bench_output.json")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    args = parser.parse_args()
+
+    output = run(args.repeat, args.latency, args.scale, args.stage)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2)
+    print(f"Results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), output)
@@ -0,0 +1,14 @@
+import os
+
+from utils.config import config
+from bench.standins import StandinProvider, install_standins
+
+# WSGI and ASGI apps wired to the stand-in provider, for bench.load_test:
+#   gunicorn --workers 3 bench.standin_apps:wsgi_app
+#   uvicorn bench.standin_apps:asgi_app
+# Every request must reach the provider, so the result cache is off.
+config['Cache']['Enabled'] = 'False'
+install_standins(StandinProvider(latency=float(os.environ.get("ARU_STANDIN_LATENCY", "1.0"))))
+
+from api.app import app as wsgi_app  # noqa: E402
+from api.asgi import app as asgi_app  # noqa: E402
@@ -0,0 +1,248 @@
+import asyncio
+import io
+import json
+import os
+import time
+import uuid
+from types import SimpleNamespace
+
+import PyPDF2
+
+from utils.config import config
+from utils.ai_clients import register_client
+from utils.call_ai import load_prompts
+
+RECORDINGS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings.json")
+
+
+def load_recordings(path=RECORDINGS_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class StandinError(RuntimeError):
+    pass
+
+
+class StandinProvider:
+    """
+    Deterministic replacement for the LLM providers: answers every request with
+    the recorded response for the prompt it recognises, after a fixed latency.
+    Streaming splits the same response into fixed-size chunks. Every
+    slow_every-th call takes slow_latency instead, and every fail_every-th call
+    raises, for exercising the provider router. OCR answers one recorded page
+    per page uploaded, taking ocr_page_latency more per page.
+    """
+    def __init__(self, recordings=None, latency=0.0, ttft=None, chunk_chars=40, chunk_latency=0.0,
+                 slow_every=0, slow_latency=0.0, fail_every=0, ocr_page_latency=0.0):
+        self.recordings = recordings or load_recordings()
+        self.latency = latency
+        self.ocr_page_latency = ocr_page_latency
+        self.ocr_pages = 0
+        self.slow_every = slow_every
+        self.slow_latency = slow_latency
+        self.fail_every = fail_every
+        self.ttft = latency if ttft is None else ttft
+        self.chunk_chars = chunk_chars
+        self.chunk_latency = chunk_latency
+        self.calls = 0
+
+        _, prompt_map = load_prompts()
+        self.prompts = {p['id']: p['Prompt'].strip() for p in prompt_map.values()}
+
+    def response_for(self, request_text):
+        for prompt_id, prompt in self.prompts.items():
+            if prompt and prompt[:200] in request_text and prompt_id in self.recordings:
+                return self.recordings[prompt_id]
+        return self.recordings["text"]
+
+    def next_call(self):
+        """
+        Returns:
+            float: This call's latency
+
+        Raises:
+            StandinError: On every fail_every-th call
+        """
+        self.calls += 1
+        if self.fail_every and self.calls % self.fail_every == 0:
+            raise StandinError(f"Stand-in failure on call {self.calls}")
+        if self.slow_every and self.calls % self.slow_every == 0:
+            return self.slow_latency
+        return self.latency
+
+    def complete(self, request_text):
+        time.sleep(self.next_call())
+        return self.response_for(request_text)
+
+    def stream(self, request_text):
+        latency = self.next_call()
+        text = self.response_for(request_text)
+        time.sleep(self.ttft if latency == self.latency else latency)
+        for i in range(0, len(text), self.chunk_chars):
+            if i:
+                time.sleep(self.chunk_latency)
+            yield text[i:i + self.chunk_chars]
+
+    def ocr(self, pages=1):
+        self.calls += 1
+        self.ocr_pages += pages
+        time.sleep(self.latency + pages * self.ocr_page_latency)
+        return [self.recordings["ocr_page"]] * pages
+
+    # Async forms for the ASGI app: same responses, but waiting does not block the loop
+    async def complete_async(self, request_text):
+        await asyncio.sleep(self.next_call())
+        return self.response_for(request_text)
+
+    async def stream_async(self, request_text):
+        latency = self.next_call()
+        text = self.response_for(request_text)
+        await asyncio.sleep(self.ttft if latency == self.latency else latency)
+        for i in range(0, len(text), self.chunk_chars):
+            if i:
+                await asyncio.sleep(self.chunk_latency)
+            yield text[i:i + self.chunk_chars]
+
+    async def ocr_async(self, pages=1):
+        self.calls += 1
+        self.ocr_pages += pages
+        await asyncio.sleep(self.latency + pages * self.ocr_page_latency)
+        return [self.recordings["ocr_page"]] * pages
+
+
+def _request_text(payload):
+    # Flatten OpenAI messages / Gemini contents / Mistral messages into searchable text
+    if isinstance(payload, str):
+        return payload
+    if isinstance(payload, dict):
+        return " ".join(_request_text(v) for k, v in payload.items() if k in ("content", "text", "parts"))
+    if isinstance(payload, (list, tuple)):
+        return " ".join(_request_text(item) for item in payload)
+    return ""
+
+
+def _choice(content=None, delta=None):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content),
+                                                    delta=SimpleNamespace(content=delta))])
+
+
+class StandinOpenAI:
+    def __init__(self, provider):
+        def create(model=None, messages=None, stream=False, **kwargs):
+            text = _request_text(messages)
+            if stream:
+                return (_choice(delta=chunk) for chunk in provider.stream(text))
+            return _choice(content=provider.complete(text))
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=create))
+
+
+class StandinAsyncOpenAI:
+    def __init__(self, provider):
+        async def create(model=None, messages=None, stream=False, **kwargs):
+            text = _request_text(messages)
+            if stream:
+                return _async_map(lambda chunk: _choice(delta=chunk), provider.stream_async(text))
+            return _choice(content=await provider.complete_async(text))
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=create))
+
+
+async def _async_map(fn, chunks):
+    async for chunk in chunks:
+        yield fn(chunk)
+
+
+class StandinGeminiModel:
+    def __init__(self, provider):
+        self.provider = provider
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        text = _request_text(contents)
+        if stream:
+            return (SimpleNamespace(text=chunk, parts=[chunk]) for chunk in self.provider.stream(text))
+        return SimpleNamespace(text=self.provider.complete(text))
+
+    async def generate_content_async(self, contents, stream=False, **kwargs):
+        text = _request_text(contents)
+        if stream:
+            return _async_map(lambda chunk: SimpleNamespace(text=chunk, parts=[chunk]), self.provider.stream_async(text))
+        return SimpleNamespace(text=await self.provider.complete_async(text))
+
+
+def _count_pages(content):
+    # Pages of an uploaded document (bytes or an open file); anything but a PDF is one page
+    try:
+        data = content if isinstance(content, (bytes, str)) else content.read()
+        return len(PyPDF2.PdfReader(io.BytesIO(data)).pages) if data[:5] == b"%PDF-" else 1
+    except Exception:
+        return 1
+
+
+class StandinMistral:
+    def __init__(self, provider):
+        uploaded_pages = {}  # file id -> pages
+
+        def upload(file=None, purpose=None):
+            file_id = uuid.uuid4().hex
+            uploaded_pages[file_id] = _count_pages(file["content"]) if file else 1
+            return SimpleNamespace(id=file_id)
+
+        def get_signed_url(file_id=None, expiry=None):
+            return SimpleNamespace(url=f"https://standin.local/files/{file_id}")
+
+        def document_pages(document):
+            return uploaded_pages.pop(document["document_url"].rsplit("/", 1)[-1], 1)
+
+        def process(model=None, document=None, **kwargs):
+            page_texts = provider.ocr(document_pages(document))
+            return SimpleNamespace(pages=[SimpleNamespace(markdown=text) for text in page_texts])
+
+        def complete(model=None, messages=None):
+            return _choice(content=provider.complete(_request_text(messages)))
+
+        def stream(model=None, messages=None):
+            return (SimpleNamespace(data=_choice(delta=chunk)) for chunk in provider.stream(_request_text(messages)))
+
+        async def upload_async(**kwargs):
+            return upload(**kwargs)
+
+        async def get_signed_url_async(**kwargs):
+            return get_signed_url(**kwargs)
+
+        async def process_async(model=None, document=None, **kwargs):
+            page_texts = await provider.ocr_async(document_pages(document))
+            return SimpleNamespace(pages=[SimpleNamespace(markdown=text) for text in page_texts])
+
+        async def complete_async(model=None, messages=None):
+            return _choice(content=await provider.complete_async(_request_text(messages)))
+
+        async def stream_async(model=None, messages=None):
+            return _async_map(lambda chunk: SimpleNamespace(data=_choice(delta=chunk)),
+                              provider.stream_async(_request_text(messages)))
+
+        self.files = SimpleNamespace(upload=upload, get_signed_url=get_signed_url,
+                                     upload_async=upload_async, get_signed_url_async=get_signed_url_async)
+        self.ocr = SimpleNamespace(process=process, process_async=process_async)
+        self.chat = SimpleNamespace(complete=complete, stream=stream,
+                                    complete_async=complete_async, stream_async=stream_async)
+
+
+def install_standins(provider, providers=None):
+    """
+    Registers stand-in clients for every provider in utils.ai_clients, so the
+    real call_ai code paths run without network access.
+
+    Args:
+        provider (StandinProvider): Answers for every model...
+        providers (dict): ...except those given their own here, e.g. {"OpenAI": slow_provider}
+    """
+    providers = providers or {}
+    openai, mistral, gemini = (providers.get(model, provider) for model in ("OpenAI", "Mistral", "Gemini"))
+    register_client("openai", StandinOpenAI(openai))
+    register_client("openai_async", StandinAsyncOpenAI(openai))
+    register_client("mistral", StandinMistral(mistral))
+    register_client("mistral_async", StandinMistral(mistral))
+    register_client(f"gemini:{config['Gemini']['Model']}", StandinGeminiModel(gemini))
+    return provider
@@ -0,0 +1,79 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import statistics
+import subprocess
+import tempfile
+import time
+
+# Zero provider latency, so only transport and pipeline time is left
+os.environ.setdefault("ARU_STANDIN_LATENCY", "0")
+
+from utils.config import config
+from utils.call_ai import load_prompts
+from bench.fixtures import build_corpus
+from bench.load_test import free_port, wait_for_server, ROOT_DIR
+import bench.standin_apps  # noqa: F401 (stand-in provider and no result cache, in this process too)
+from frontend import api_client
+
+
+def start_api(port, socket_path):
+    # One gunicorn worker listening on both TCP and the Unix socket
+    command = [os.path.join(os.path.dirname(sys.executable), "gunicorn"), "--workers", "1",
+               "--bind", f"127.0.0.1:{port}", "--bind", f"unix:{socket_path}", "bench.standin_apps:wsgi_app"]
+    env = dict(os.environ)
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    return subprocess.Popen(command, cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def time_transport(transport, file_path, data, streaming, repeat):
+    config['API']['Transport'] = transport
+    timings = []
+    for i in range(repeat + 1):
+        start = time.perf_counter()
+        result = api_client.ocr(file_path, data, streaming)
+        if streaming:
+            for event, _ in result.events:
+                pass
+        if result.status_code != 200:
+            raise RuntimeError(f"{transport}: {result.error}")
+        if i:  # first call warms pools and imports
+            timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+# Example usage:
+#   python bench/transport_bench.py --repeat 20
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Frontend -> API latency per transport")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--stream", action="store_true", help="Time the streaming (SSE) path")
+    args = parser.parse_args()
+
+    _, prompt_map = load_prompts()
+    data = {"prompt_text": next(p['Prompt'] for p in prompt_map.values() if p['id'] == 'ocr'),
+            "file_ext": "csv", "model": config['API']['DefaultModel']}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fixtures = {}
+        for name in ("text_pdf", "xlsx", "image", "eml"):
+            file_name, file_blob = build_corpus()[name]
+            fixtures[name] = os.path.join(tmp_dir, file_name)
+            with open(fixtures[name], "wb") as f:
+                f.write(file_blob)
+
+        port = free_port()
+        socket_path = os.path.join(tmp_dir, "api.sock")
+        config['API']['Port'] = str(port)
+        config['API']['UnixSocket'] = socket_path
+        server = start_api(port, socket_path)
+        try:
+            wait_for_server(f"http://127.0.0.1:{port}")
+            print(f"{'fixture':<10}" + "".join(f"{t:>14}" for t in api_client.TRANSPORTS))
+            for name, file_path in fixtures.items():
+                medians = [time_transport(t, file_path, data, args.stream, args.repeat) for t in api_client.TRANSPORTS]
+                print(f"{name:<10}" + "".join(f"{m:>11.2f} ms" for m in medians))
+        finally:
+            server.terminate()
+            server.wait()
@@ -0,0 +1,144 @@
+# frontend/api_client.py
+import os
+
+from werkzeug.utils import secure_filename
+
+from utils.config import config
+from utils.sse import iter_sse
+from utils.http_session import http_post
+from utils.uploads import MultipartStream, open_spooled
+
+# [API] Transport:
+#   http      - loopback TCP to the API on [API] Port
+#   unix      - HTTP over the Unix domain socket at [API] UnixSocket
+#   inprocess - call the api pipeline functions directly, no HTTP hop at all
+TRANSPORTS = ("http", "unix", "inprocess")
+
+
+class ApiResponse:
+    """
+    What the tabs need from an API call, whatever the transport: the output
+    text (or, when streaming, an iterator of SSE (event, data) pairs), the
+    download file name and an error message for non-200 statuses.
+    """
+    def __init__(self, status_code, text=None, file_name=None, events=None, error=None):
+        self.status_code = status_code
+        self.text = text
+        self.file_name = file_name
+        self.events = events
+        self.error = error
+
+
+def get_transport():
+    transport = config['API'].get('Transport', 'http').lower()
+    if transport not in TRANSPORTS:
+        raise ValueError(f"Unknown [API] Transport '{transport}', expected one of {', '.join(TRANSPORTS)}")
+    return transport
+
+
+def api_post(path, **kwargs):
+    # Over the Unix socket the URL's host and port are ignored
+    unix_socket = config['API']['UnixSocket'] if get_transport() == "unix" else None
+    return http_post("api", f'http://localhost:{config["API"]["Port"]}{path}', unix_socket=unix_socket, **kwargs)
+
+
+def from_http(response, streaming):
+    if response.status_code != 200:
+        try:
+            error = response.json().get('error', 'Unknown error')
+        except ValueError:
+            error = f"Error code: {response.status_code}"
+        return ApiResponse(response.status_code, error=error)
+
+    # Extract filename from content-disposition header if present
+    cd_header = response.headers.get('content-disposition', '')
+    file_name = cd_header.split('filename=')[1].strip('"') if 'filename=' in cd_header else None
+    if streaming:
+        events = iter_sse(response.iter_lines(chunk_size=None, decode_unicode=True))
+        return ApiResponse(200, file_name=file_name, events=events)
+    return ApiResponse(200, text=response.text, file_name=file_name)
+
+
+def inprocess_result(model, file_blob, file_name, prompt_text, download_name, streaming):
+    import api.app as api
+
+    if streaming:
+        key, cached_text, _ = api.lookup_cached(model, file_blob, file_name, prompt_text)
+        events = api.stream_events(model, file_blob, file_name, prompt_text, key, cached_text)
+        return ApiResponse(200, file_name=download_name, events=events)
+
+    output_text, _ = api.cached_call_ai(model, file_blob, file_name, prompt_text)
+    return ApiResponse(200, text=output_text, file_name=download_name)
+
+
+def add(a, b):
+    """
+    Returns:
+        ApiResponse: text holds the result
+    """
+    if get_transport() == "inprocess":
+        # Trivial view: run it through Flask's test client rather than duplicate it
+        from api.app import app
+        response = app.test_client().post('/add', json={"a": a, "b": b})
+        data = response.get_json()
+        if response.status_code != 200:
+            return ApiResponse(response.status_code, error=data.get('error', 'Unknown error'))
+        return ApiResponse(200, text=f"{data['result']}")
+
+    response = api_post('/add', json={"a": a, "b": b})
+    if response.status_code != 200:
+        return ApiResponse(response.status_code, error=response.json().get('error', 'Unknown error'))
+    return ApiResponse(200, text=f"{response.json()['result']}")
+
+
+def ocr(file_path, data, streaming):
+    """
+    Runs /ocr on a file that is already on disk (e.g. Gradio's upload).
+
+    Args:
+        file_path (str): Path of the document
+        data (dict): prompt_text, file_ext and model form fields
+        streaming (bool): Return SSE events instead of the final text
+
+    Returns:
+        ApiResponse
+    """
+    if get_transport() != "inprocess":
+        # Stream the multipart body from disk instead of reading the file into memory
+        body = MultipartStream({**data, **({"stream": "true"} if streaming else {})},
+                               "file", os.path.basename(file_path), file_path)
+        response = api_post('/ocr', data=body, headers={"Content-Type": body.content_type}, stream=streaming)
+        return from_http(response, streaming)
+
+    import api.app as api
+    from utils.metrics import track_request
+
+    file_name = secure_filename(os.path.basename(file_path))
+    download_name = f"{os.path.splitext(file_name)[0]}.{data['file_ext']}"
+    with track_request('ocr'):
+        try:
+            # The file is mapped where it lies: no multipart, no copy
+            file_blob = api.prepare_upload(data['model'], open_spooled(file_path), file_name, data['prompt_text'])
+            return inprocess_result(data['model'], file_blob, file_name, data['prompt_text'], download_name, streaming)
+        except Exception as e:
+            return ApiResponse(500, error=str(e))
+
+
+def summary(url, data, streaming):
+    """
+    Runs /summary on url; see ocr for the arguments.
+    """
+    if get_transport() != "inprocess":
+        form = {**data, "url": url, **({"stream": "true"} if streaming else {})}
+        return from_http(api_post('/summary', data=form, stream=streaming), streaming)
+
+    import api.app as api
+    from utils.metrics import track_request
+
+    with track_request('summary'):
+        try:
+            site_text, file_name = api.prepare_site(data['model'], url, data['prompt_text'])
+            return inprocess_result(data['model'], site_text, file_name, data['prompt_text'],
+                                    f"{file_name}.{data['file_ext']}", streaming)
+        except Exception as e:
+            return ApiResponse(500, error=str(e))
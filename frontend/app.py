@@ -1,8 +1,11 @@
 # frontend/app.py
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 import gradio as gr
 import os
 
+from utils.http_session import http_stats
+from utils.metrics import render_metrics
+
 # Import tab modules
 from frontend.tabs.add_tab import create_add_tab
 from frontend.tabs.ocr_tab import create_ocr_tab
@@ -29,6 +32,17 @@ def is_run_by_systemd():
     # systemd sets specific environment variables
     return 'INVOCATION_ID' in os.environ or 'JOURNAL_STREAM' in os.environ
 
+# This process's own calls to the API (retries, latency); registered before
+# the Gradio mount so "/" does not shadow them
+@app.get("/health")
+def health_check():
+    return {"status": "healthy", "http": http_stats.snapshot()}
+
+@app.get("/metrics")
+def metrics():
+    body, content_type = render_metrics()
+    return Response(body, headers={"Content-Type": content_type})
+
 # Mount the Gradio app with explicit root_path
 app = gr.mount_gradio_app(app, demo, path="/", 
                           root_path=("/" if is_run_by_systemd() else "/"))  # ("/ui"
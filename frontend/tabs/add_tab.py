@@ -2,7 +2,7 @@
 import gradio as gr
 import requests
 
-from utils.config import config
+from frontend import api_client
 
 def add_numbers(a, b):
     try:
@@ -10,17 +10,11 @@ def add_numbers(a, b):
         a_val = float(a) if a is not None else 0
         b_val = float(b) if b is not None else 0
         
-        # Use a full URL here to avoid relative path issues
-        response = requests.post(
-            f'http://localhost:{config["API"]["Port"]}/add',
-            json={"a": a_val, "b": b_val}
-        )
-        
-        if response.status_code == 200:
-            result = response.json()["result"]
-            return f"{result}"
+        result = api_client.add(a_val, b_val)
+        if result.status_code == 200:
+            return result.text
         else:
-            return f"Error from API: {response.json().get('error', 'Unknown error')}"
+            return f"Error from API: {result.error}"
     except ValueError:
         return "Please enter valid numbers"
     except requests.exceptions.RequestException as e:
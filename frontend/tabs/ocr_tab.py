@@ -2,10 +2,13 @@
 import gradio as gr
 import os
 import requests
+import time
 
 from utils.config import config
 import utils.md_utils as md_utils
 from utils.call_ai import load_prompts
+from utils.uploads import UploadTooLarge, check_file_size
+from frontend import api_client
 
 
 def create_ocr_tab():
@@ -82,6 +85,8 @@ def create_ocr_tab():
                     label="",
                     value="<div style='height: 300px; overflow-y: auto; padding: 10px; border: 1px solid #ddd;'><p>Processed content will appear here...</p></div>"
                 )
+        # Large text/CSV outputs are previewed a page of rows at a time
+        preview_page = gr.Number(label="Preview page", value=1, precision=0, minimum=1)
         
         # Connect the prompt dropdown to update the prompt text and hidden fields
         prompt_dropdown.change(
@@ -95,7 +100,77 @@ def create_ocr_tab():
             fn=process_file,
             inputs=[file_input, prompt_text, model_value, file_ext_value, model_dropdown, url_input, requires_url],
             outputs=[output_file, status_text, preview_html, preview_text]
+        ).then(
+            fn=lambda: 1,
+            outputs=[preview_page]
         )
+        
+        preview_page.change(
+            fn=show_preview_page,
+            inputs=[output_file, preview_page, file_ext_value],
+            outputs=[preview_html, preview_text]
+        )
+
+
+def preview(text_display, file_ext, page=1, cache=True):
+    # (html, plain text) for the two preview tabs: only the page's rows of a large output
+    window_text = md_utils.preview_window(text_display, file_ext, page)[0]
+    return md_utils.create_html_preview(text_display, file_ext, page, cache), window_text
+
+
+def show_preview_page(output_file, page, file_ext):
+    # Re-reads the downloaded output: the full text is not kept in the browser
+    file_path = getattr(output_file, "name", output_file)
+    if not file_path or not os.path.exists(file_path):
+        return gr.update(), gr.update()
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return preview(f.read(), file_ext, page)
+
+def stream_preview(events, output_file_path, file_ext):
+    """
+    Consumes the API's Server-Sent Events, as (event, data) pairs, yielding
+    incremental preview updates and finally the post-processed result written
+    to output_file_path.
+    """
+    interval = config['UI'].getfloat('PreviewIntervalSeconds', 0.5)
+    start = time.perf_counter()
+    ttft = None
+    last_render = 0
+    parts = []
+    
+    for event, data in events:
+        if event == "chunk":
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            parts.append(data["text"])
+            
+            # Throttle re-rendering: markdown conversion of the whole text on every token is costly
+            now = time.perf_counter()
+            if now - last_render >= interval:
+                last_render = now
+                yield None, f"Streaming... (first token after {ttft:.2f}s)", \
+                    *preview("".join(parts), file_ext, cache=False)
+        
+        elif event == "done":
+            # The final text is post-processed by the API (e.g. '^^' CSV separators)
+            text_display = data["text"]
+            with open(output_file_path, 'w', encoding='utf-8') as f:
+                f.write(text_display)
+            
+            total = time.perf_counter() - start
+            ttft = ttft if ttft is not None else total
+            yield output_file_path, f"Content successfully processed (first token after {ttft:.2f}s, total {total:.2f}s).", \
+                *preview(text_display, file_ext)
+            return
+        
+        elif event == "error":
+            error_html = f"Error from API: {data.get('error', 'Unknown error')}"
+            yield None, error_html, error_html, error_html
+            return
+    
+    error_html = "Error from API: stream ended before the result was complete"
+    yield None, error_html, error_html, error_html
+
 
 def process_file(file, prompt_text, default_model, file_ext, selected_model, url, requires_url_str):
     try:
@@ -104,10 +179,12 @@ def process_file(file, prompt_text, default_model, file_ext, selected_model, url
         
         # Check if appropriate inputs are provided
         if not requires_url and file is None:
-            return None, "Please upload a file to process.", "", ""
+            yield None, "Please upload a file to process.", "", ""
+            return
         
         if requires_url and not url:
-            return None, "URL must be specified for summary.", "", ""
+            yield None, "URL must be specified for summary.", "", ""
+            return
         
         # Determine which model to use
         model = default_model if selected_model == "Default" else selected_model
@@ -116,6 +193,9 @@ def process_file(file, prompt_text, default_model, file_ext, selected_model, url
         dir = config['UI']['ProcessedDir']
         os.makedirs(dir, exist_ok=True)
         
+        # Stream tokens into the preview as they arrive
+        streaming = config['UI'].getboolean('Streaming', True)
+        
         # Call the API to process the content
         try:
             # Prepare data dictionary for the API request
@@ -125,80 +205,47 @@ def process_file(file, prompt_text, default_model, file_ext, selected_model, url
                 "model": model
             }
             
-            # Add URL to the data dictionary if using the summary endpoint
             if requires_url:
-                data["url"] = url
-                
-                # Make the API request without files
-                response = requests.post(
-                    f'http://localhost:{config["API"]["Port"]}/summary',
-                    data=data
-                )
-                
-                # Generate filename from URL (assuming we'll get this from the response headers)
-                if response.status_code == 200:
-                    # Extract filename from content-disposition header if present
-                    cd_header = response.headers.get('content-disposition', '')
-                    output_filename = cd_header.split('filename=')[1].strip('"')
-                else:
-                    # Will be handled in the error section below
-                    output_filename = None
+                # Summary endpoint: no file
+                result = api_client.summary(url, data, streaming)
             else:
-                # For OCR endpoint, include the file
-                original_filename = os.path.basename(file.name)
-                file_name, _ = os.path.splitext(original_filename)
-                output_filename = f"{file_name}.{file_ext}"
-                
-                # Read the file content
-                with open(file.name, "rb") as f:
-                    file_blob = f.read()
+                # Refuse oversized files before uploading anything
+                try:
+                    check_file_size(os.path.getsize(file.name))
+                except UploadTooLarge as e:
+                    yield None, str(e), "", ""
+                    return
                 
-                # Make the API request with file
-                response = requests.post(
-                    f'http://localhost:{config["API"]["Port"]}/ocr',
-                    files={"file": (original_filename, file_blob)},
-                    data=data
-                )
+                # OCR endpoint: the transport reads the file from where Gradio saved it
+                result = api_client.ocr(file.name, data, streaming)
             
             # Process the response
-            if response.status_code == 200:
-                # Get the text content directly from the response
-                text_content = response.content
+            if result.status_code == 200 and streaming:
+                yield from stream_preview(result.events, os.path.join(dir, result.file_name), file_ext)
+            elif result.status_code == 200:
+                text_display = result.text
                 
                 # Full path for the output file
-                output_file_path = os.path.join(dir, output_filename)
+                output_file_path = os.path.join(dir, result.file_name)
                 
                 # Write the content to the file
-                with open(output_file_path, 'wb') as f:
-                    f.write(text_content)
-                
-                # Get the content as text for display
-                try:
-                    text_display = text_content.decode('utf-8')
-                except UnicodeDecodeError:
-                    text_display = "Binary content cannot be displayed as text."
+                with open(output_file_path, 'w', encoding='utf-8') as f:
+                    f.write(text_display)
                 
-                # Use the utility function to create the HTML preview
-                html_preview = md_utils.create_html_preview(text_display, file_ext)
+                # Use the utility function to create the HTML preview (first page of a large output)
+                html_preview, window_text = preview(text_display, file_ext)
                 
                 # Return the path to the file, success message, and preview content
-                return output_file_path, f"Content successfully processed.", html_preview, text_display
+                yield output_file_path, f"Content successfully processed.", html_preview, window_text
             else:
                 # Handle error response
-                error_msg = "Unknown error"
-                try:
-                    error_data = response.json()
-                    error_msg = error_data.get('error', 'Unknown error')
-                except:
-                    error_msg = f"Error code: {response.status_code}"
-                
-                error_html = f"Error from API: {error_msg}"
-                return None, error_html, error_html, f"Error from API: {error_msg}"
+                error_html = f"Error from API: {result.error}"
+                yield None, error_html, error_html, f"Error from API: {result.error}"
                 
         except requests.exceptions.RequestException as e:
             error_html = f"Failed to connect to API: {str(e)}"
-            return None, error_html, error_html, f"Failed to connect to API: {str(e)}"
+            yield None, error_html, error_html, f"Failed to connect to API: {str(e)}"
     
     except Exception as e:
         error_html = f"Error processing content: {str(e)}"
-        return None, error_html, error_html, f"Error processing content: {str(e)}"
\ No newline at end of file
+        yield None, error_html, error_html, f"Error processing content: {str(e)}"
\ No newline at end of file
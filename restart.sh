@@ -1,3 +1,4 @@
 sudo systemctl restart aru-api
+sudo systemctl restart aru-worker
 sudo systemctl restart aru-frontend
 sudo systemctl restart nginx
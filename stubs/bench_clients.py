@@ -0,0 +1,59 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import statistics
+import time
+
+import httpx
+
+from utils.ai_clients import create_http_client
+
+# Provider hosts we talk to; an unauthenticated GET returns 401 quickly, which is
+# enough to measure connection setup (DNS + TCP + TLS) versus a reused connection.
+PROVIDER_URLS = {
+    "OpenAI": "https://api.openai.com/v1/models",
+    "Mistral": "https://api.mistral.ai/v1/models",
+    "Gemini": "https://generativelanguage.googleapis.com/v1beta/models",
+}
+
+
+def time_request(client, url):
+    start = time.perf_counter()
+    client.get(url)
+    return (time.perf_counter() - start) * 1000
+
+
+def bench_fresh(url, rounds):
+    # Old behaviour: a new client (and connection) on every request
+    timings = []
+    for _ in range(rounds):
+        with httpx.Client() as client:
+            timings.append(time_request(client, url))
+    return timings
+
+
+def bench_pooled(url, rounds):
+    # Registry behaviour: one long-lived client with keep-alive
+    client = create_http_client()
+    try:
+        return [time_request(client, url) for _ in range(rounds)]
+    finally:
+        client.close()
+
+
+# Example usage
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    for provider, url in PROVIDER_URLS.items():
+        try:
+            fresh = bench_fresh(url, rounds)
+            pooled = bench_pooled(url, rounds)
+        except httpx.HTTPError as e:
+            print(f"{provider}: failed to connect ({str(e)})")
+            continue
+
+        print(f"{provider}:")
+        print(f"  fresh client   median {statistics.median(fresh):8.1f} ms")
+        print(f"  pooled client  first  {pooled[0]:8.1f} ms, "
+              f"median of rest {statistics.median(pooled[1:] or pooled):8.1f} ms")
@@ -0,0 +1,63 @@
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import io
+import time
+import tracemalloc
+
+import openpyxl
+import pandas as pd
+
+import utils.call_ai as ai
+
+
+def make_workbook(sheets=4, rows=20000):
+    # Loss-run shaped workbook: dates, names, currency amounts and percentages
+    workbook = openpyxl.Workbook(write_only=True)
+    for s in range(sheets):
+        worksheet = workbook.create_sheet(f"Year {2020 + s}")
+        worksheet.append(["Claim #", "Date of Loss", "Claimant", "Paid", "Reserve", "Incurred", "Pct"])
+        for r in range(rows):
+            worksheet.append([f"C{s}-{r:06d}", f"2024-01-{r % 28 + 1:02d}", f"Claimant {r}",
+                              r * 10.5, r * 2.25, r * 12.75, (r % 100) / 100])
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+def previous_extract(file_blob):
+    # The extraction path before ExcelTextExtractor, kept here for comparison
+    excel_file = io.BytesIO(file_blob)
+    xls = pd.ExcelFile(excel_file)
+    all_sheets_content = []
+    for sheet_name in xls.sheet_names:
+        df = pd.read_excel(excel_file, sheet_name=sheet_name)
+        all_sheets_content.append(f"--- Sheet: {sheet_name} ---\n{df.to_string()}")
+    return ai.limit_text("\n\n".join(all_sheets_content))
+
+
+def current_extract(file_blob):
+    return ai.limit_text(ai.handle_pdf_xls(file_blob, "excel"))
+
+
+def measure(fn, file_blob):
+    tracemalloc.start()
+    start = time.perf_counter()
+    text = fn(file_blob)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, len(text)
+
+
+# Example usage
+if __name__ == "__main__":
+    sheets = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+    file_blob = make_workbook(sheets, rows)
+    print(f"Workbook: {sheets} sheets x {rows} rows, {len(file_blob) / 1e6:.1f} MB")
+
+    for name, fn in [("previous", previous_extract), ("current", current_extract)]:
+        elapsed, peak, text_len = measure(fn, file_blob)
+        print(f"{name:>9}: {elapsed:7.2f} s, peak {peak / 1e6:8.1f} MB, {text_len} chars")
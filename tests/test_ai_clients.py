@@ -0,0 +1,28 @@
+import sys
+import threading
+import types
+
+import utils.ai_clients as ai_clients
+from utils.config import config
+
+
+def test_gemini_model_created_without_register_client(monkeypatch):
+    # Stand-in google.generativeai: the real factory path runs, nothing is pre-registered
+    genai = types.ModuleType("google.generativeai")
+    genai.configure = lambda api_key: None
+    genai.GenerativeModel = lambda model_name: ("model", model_name)
+    google = types.ModuleType("google")
+    google.generativeai = genai
+    monkeypatch.setitem(sys.modules, "google", google)
+    monkeypatch.setitem(sys.modules, "google.generativeai", genai)
+    monkeypatch.setattr(ai_clients, "_clients", {})
+    monkeypatch.setitem(config['Gemini'], "API_KEY", "test")
+
+    result = []
+    thread = threading.Thread(target=lambda: result.append(ai_clients.get_gemini_model("gemini-test")), daemon=True)
+    thread.start()
+    thread.join(5)
+
+    assert not thread.is_alive(), "get_gemini_model deadlocked"
+    assert result == [("model", "gemini-test")]
+    assert ai_clients.get_gemini_model("gemini-test") is result[0]
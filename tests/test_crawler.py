@@ -0,0 +1,141 @@
+import asyncio
+import http.server
+import threading
+
+import pytest
+
+import utils.crawler as crawler
+from utils.crawl_cache import CrawlCache
+
+
+def page(title, links=()):
+    # Distinct words per page so that no two pages look like near-duplicates
+    words = " ".join(f"{title}{i}" for i in range(60))
+    anchors = "".join(f'<a href="{link}">{link}</a>' for link in links)
+    return f"<html><body><h1>{title}</h1><p>{words}</p>{anchors}</body></html>"
+
+
+@pytest.fixture
+def site(monkeypatch, tmp_path):
+    """
+    Serves a dict of path -> html on 127.0.0.1 and records every GET path.
+    The crawl cache is swapped for an empty one under tmp_path.
+    """
+    pages, requests = {}, []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(self.path)
+            path = self.path.split("?")[0]
+            if path not in pages:
+                self.send_error(404)
+                return
+            body = pages[path].encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(crawler, "crawl_cache", CrawlCache(str(tmp_path)))
+    monkeypatch.setenv("NO_PROXY", "127.0.0.1,localhost")
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}", pages, requests
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def crawl(url, **kwargs):
+    kwargs.setdefault("min_chars", 1)
+    return asyncio.run(crawler.SiteCrawler(fetch="direct", **kwargs).crawl(url))
+
+
+def test_max_pages_limits_fetches(site):
+    base, pages, requests = site
+    pages["/"] = page("home", [f"/p{i}" for i in range(10)])
+    for i in range(10):
+        pages[f"/p{i}"] = page(f"p{i}")
+
+    status_code, result = crawl(base + "/", max_pages=4)
+
+    assert status_code == 200
+    assert len(requests) == 4
+    assert len(result) == 4
+
+
+def test_max_depth_stops_following_links(site):
+    base, pages, requests = site
+    pages["/"] = page("home", ["/d1"])
+    pages["/d1"] = page("one", ["/d2"])
+    pages["/d2"] = page("two", ["/d3"])
+    pages["/d3"] = page("three")
+
+    status_code, result = crawl(base + "/", max_depth=2)
+
+    assert status_code == 200
+    assert sorted(requests) == ["/", "/d1", "/d2"]
+    assert len(result) == 3
+
+
+def test_off_host_and_skipped_extension_links_ignored(site):
+    base, pages, requests = site
+    port = base.rsplit(":", 1)[1]
+    pages["/"] = page("home", [f"http://localhost:{port}/other", "/report.pdf", "/logo.png", "/about"])
+    pages["/about"] = page("about")
+    pages["/other"] = page("other")
+
+    status_code, result = crawl(base + "/")
+
+    assert status_code == 200
+    assert sorted(requests) == ["/", "/about"]
+    assert len(result) == 2
+
+
+def test_query_and_fragment_spellings_fetched_once(site):
+    base, pages, requests = site
+    pages["/"] = page("home", ["/about?ref=nav", "/about#team", "/about/", "/about", "/#top"])
+    pages["/about"] = page("about")
+
+    status_code, result = crawl(base + "/")
+
+    assert status_code == 200
+    assert len(requests) == 2
+    assert sum(path.startswith("/about") for path in requests) == 1
+    assert len(result) == 2
+
+
+def test_near_duplicate_pages_dropped(site):
+    base, pages, requests = site
+    pages["/"] = page("home", ["/a", "/b"])
+    pages["/a"] = page("same")
+    # Same text plus one extra word: well above the similarity threshold
+    pages["/b"] = page("same").replace("</p>", " extra</p>")
+
+    status_code, result = crawl(base + "/")
+
+    assert status_code == 200
+    assert len(requests) == 3
+    host = base.split("//", 1)[1]
+    assert [key for key, _ in result] == [host, f"{host}/a"]
+
+
+def test_second_crawl_served_from_cache(site):
+    base, pages, requests = site
+    pages["/"] = page("home", ["/a", "/b"])
+    pages["/a"] = page("a")
+    pages["/b"] = page("b")
+
+    first = crawl(base + "/")
+    fetched = len(requests)
+    second = crawl(base + "/")
+
+    assert fetched == 3
+    assert len(requests) == fetched
+    assert second == first
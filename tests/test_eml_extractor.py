@@ -0,0 +1,120 @@
+import io
+from email import policy
+from email.parser import BytesParser
+
+import pytest
+
+from utils.eml_extractor import extract_email_body, extract_email_body_lazy, extract_email_chain
+
+PLAIN = b"""From: a@example.com
+To: b@example.com
+Subject: Hi
+Content-Type: text/plain; charset=utf-8
+
+Hello there.
+"""
+
+ALTERNATIVE = b"""From: a@example.com
+Subject: Alt
+MIME-Version: 1.0
+Content-Type: multipart/alternative; boundary="b1"
+
+--b1
+Content-Type: text/plain; charset=utf-8
+Content-Transfer-Encoding: quoted-printable
+
+Caf=C3=A9 menu
+--b1
+Content-Type: text/html; charset=utf-8
+
+<p>Caf&eacute; <b>menu</b></p>
+--b1--
+"""
+
+NESTED_WITH_ATTACHMENT = b"""From: a@example.com
+Subject: Nested
+MIME-Version: 1.0
+Content-Type: multipart/mixed; boundary="outer"
+
+--outer
+Content-Type: multipart/related; boundary="inner"
+
+--inner
+Content-Type: text/plain
+
+Inner text.
+--inner--
+--outer
+Content-Type: application/pdf
+Content-Disposition: attachment; filename="x.pdf"
+Content-Transfer-Encoding: base64
+
+JVBERi0xLjQK
+--outer--
+"""
+
+FORWARDED = b"""From: a@example.com
+Subject: Fwd: Report
+MIME-Version: 1.0
+Content-Type: multipart/mixed; boundary="fwd"
+
+--fwd
+Content-Type: text/plain
+
+See below.
+--fwd
+Content-Type: message/rfc822
+
+From: c@example.com
+Subject: Report
+Content-Type: multipart/alternative; boundary="alt"
+
+--alt
+Content-Type: text/plain
+
+Forwarded body text.
+--alt
+Content-Type: text/html
+
+<p>Forwarded body text.</p>
+--alt--
+--fwd--
+"""
+
+@pytest.mark.parametrize("eml_blob", [PLAIN, ALTERNATIVE, NESTED_WITH_ATTACHMENT, FORWARDED,
+                                      FORWARDED.replace(b"\n", b"\r\n")],
+                         ids=["plain", "alternative", "nested", "forwarded", "forwarded-crlf"])
+def test_lazy_parse_matches_full_parse(eml_blob):
+    msg = BytesParser(policy=policy.default).parse(io.BytesIO(eml_blob))
+    assert extract_email_body_lazy(eml_blob)[1] == extract_email_body(msg)
+
+
+def test_forwarded_message_body_is_kept():
+    body_parts = extract_email_body_lazy(FORWARDED)[1]
+    assert body_parts[0].strip() == "See below."
+    assert any("Forwarded body text." in part for part in body_parts[1:])
+
+
+SHORT_ALTERNATIVE = b"""From: a@example.com
+Subject: Quick one
+MIME-Version: 1.0
+Content-Type: multipart/alternative; boundary="s"
+
+--s
+Content-Type: text/plain
+
+Sounds good.
+
+Thanks!
+--s
+Content-Type: text/html
+
+<p>Sounds good.</p><p>Thanks!</p>
+--s--
+"""
+
+
+def test_short_message_body_survives_dedup():
+    text = extract_email_chain(SHORT_ALTERNATIVE)
+    assert "Sounds good." in text
+    assert text.count("Sounds good.") == 1
@@ -0,0 +1,377 @@
+import asyncio
+import contextvars
+import fcntl
+import heapq
+import itertools
+import math
+import os
+import re
+import struct
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+
+from utils.config import config
+from utils.metrics import stage_timer, count_admission_rejected
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+# Requests from the UI/API are interactive unless a caller (e.g. batch jobs) says otherwise
+_priority = contextvars.ContextVar("admission_priority", default=PRIORITY_INTERACTIVE)
+
+# Bucket state file: request level, token level, last refill (epoch seconds)
+_STATE = struct.Struct("<ddd")
+
+# Page objects of a PDF ("/Type /Page", not the "/Type /Pages" tree nodes)
+PDF_PAGE_PATTERN = re.compile(rb"/Type\s*/Page(?![a-z])")
+
+
+class AdmissionRejected(RuntimeError):
+    """
+    The provider's quota cannot take the request now: the wait queue is full,
+    the wait ran out, or the provider itself answered with a rate limit.
+    Served as 429 with Retry-After.
+    """
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+def set_priority(priority):
+    _priority.set(priority)
+
+
+def get_priority():
+    return _priority.get()
+
+
+def parse_limits(spec):
+    # "Gemini:2000|OpenAI:500" -> {"Gemini": 2000.0, "OpenAI": 500.0}
+    limits = {}
+    for item in (spec or "").split('|'):
+        if ':' in item:
+            name, value = item.split(':', 1)
+            limits[name.strip()] = float(value)
+    return limits
+
+
+def estimate_pdf_pages(data, bytes_per_page):
+    # Page objects when they are visible, else the file size: PDF 1.5+ may
+    # keep them in compressed object streams, where a byte scan cannot see them
+    pages = len(PDF_PAGE_PATTERN.findall(data))
+    return pages if pages else max(1, math.ceil(len(data) / bytes_per_page))
+
+
+def estimate_tokens(payload):
+    """
+    Rough token count of a provider request: text at [Admission] CharsPerToken,
+    PDF parts at PDFPageTokens per page (Gemini bills 258 tokens a page),
+    other image/document parts at a flat BinaryPartTokens, plus OutputTokens
+    for the answer.
+
+    Pages are counted from the PDF's page objects, or estimated from its size
+    at PDFBytesPerPage when they are compressed. Parts sent by URL (Mistral
+    documents, OpenAI images) cannot be sized and count as BinaryPartTokens.
+
+    Args:
+        payload: OpenAI/Mistral messages, Gemini contents or plain text
+    """
+    settings = config['Admission']
+    chars_per_token = settings.getfloat('CharsPerToken', 4)
+    binary_tokens = settings.getint('BinaryPartTokens', 1500)
+    page_tokens = settings.getint('PDFPageTokens', 258)
+    bytes_per_page = settings.getint('PDFBytesPerPage', 100000)
+
+    def walk(item):
+        if isinstance(item, str):
+            return len(item) / chars_per_token
+        if isinstance(item, dict):
+            if item.get("mime_type") == "application/pdf" and isinstance(item.get("data"), (bytes, bytearray)):
+                return page_tokens * estimate_pdf_pages(item["data"], bytes_per_page)
+            if "data" in item or "image_url" in item or "document_url" in item:
+                return binary_tokens
+            return sum(walk(value) for value in item.values())
+        if isinstance(item, (list, tuple)):
+            return sum(walk(value) for value in item)
+        return binary_tokens if item is not None else 0
+
+    return int(walk(payload)) + settings.getint('OutputTokens', 1000)
+
+
+class TokenBuckets:
+    """
+    Per-provider token buckets, in requests/min and tokens/min, kept in small
+    files under [Admission] Dir and updated under flock, so every gunicorn
+    worker draws on the same quota.
+    """
+    def __init__(self, state_dir, requests_per_minute, tokens_per_minute, burst_seconds=15):
+        self.state_dir = state_dir
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.burst_seconds = burst_seconds
+        self._dir_ready = False
+
+    def is_limited(self, provider):
+        return provider in self.requests_per_minute or provider in self.tokens_per_minute
+
+    def rates(self, provider):
+        # Per-minute rates (None = unlimited), in _STATE order
+        return self.requests_per_minute.get(provider), self.tokens_per_minute.get(provider)
+
+    def capacity(self, rate):
+        # Burst allowance: burst_seconds worth of the per-minute rate
+        return rate * self.burst_seconds / 60
+
+    @contextmanager
+    def _locked_levels(self, provider):
+        if not self._dir_ready:
+            os.makedirs(self.state_dir, exist_ok=True)
+            self._dir_ready = True
+        # Opened per call: a descriptor shared across fork would share the flock too
+        fd = os.open(os.path.join(self.state_dir, f"{provider}.bucket"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            data = os.pread(fd, _STATE.size, 0)
+            now = time.time()
+            rates = self.rates(provider)
+            if len(data) == _STATE.size:
+                *levels, updated = _STATE.unpack(data)
+                elapsed = max(0.0, now - updated)
+                levels = [min(self.capacity(rate), level + elapsed * rate / 60) if rate else 0.0
+                          for level, rate in zip(levels, rates)]
+            else:
+                levels = [self.capacity(rate) if rate else 0.0 for rate in rates]
+
+            yield levels
+            os.pwrite(fd, _STATE.pack(*levels, now), 0)
+        finally:
+            os.close(fd)
+
+    def try_take(self, provider, tokens, reserve=0.0):
+        """
+        Takes one request and tokens from the provider's buckets if both keep
+        reserve (a fraction of capacity held back, e.g. for interactive
+        requests) afterwards.
+
+        Returns:
+            float: 0 if taken, otherwise the seconds until it could be
+        """
+        if not self.is_limited(provider):
+            return 0.0
+
+        with self._locked_levels(provider) as levels:
+            needs, waits = [], []
+            for i, (rate, need) in enumerate(zip(self.rates(provider), (1, tokens))):
+                if not rate:
+                    needs.append(0)
+                    continue
+                capacity = self.capacity(rate)
+                # A request bigger than the bucket could never fit: let it take a full bucket
+                need = min(need, capacity * (1 - reserve))
+                shortfall = need + capacity * reserve - levels[i]
+                if shortfall > 0:
+                    waits.append(shortfall * 60 / rate)
+                needs.append(need)
+
+            if waits:
+                return max(waits)
+            for i, need in enumerate(needs):
+                levels[i] -= need
+            return 0.0
+
+    def drain(self, provider, seconds):
+        # The provider said slow down: empty its buckets so all workers back off for seconds
+        if not self.is_limited(provider):
+            return
+        with self._locked_levels(provider) as levels:
+            for i, rate in enumerate(self.rates(provider)):
+                if rate:
+                    levels[i] = -seconds * rate / 60
+
+
+class AdmissionController:
+    """
+    Admits provider calls against the shared token buckets. Calls that do not
+    fit wait in a bounded per-worker queue, interactive ahead of batch; batch
+    calls also leave BatchReserve of each bucket for interactive ones, which
+    is what gives interactive calls priority across workers.
+    """
+    def __init__(self, buckets, max_queue=64, max_wait=30, batch_max_wait=600, batch_reserve=0.2,
+                 poll_seconds=0.05):
+        self.buckets = buckets
+        self.max_queue = max_queue
+        self.max_wait = {PRIORITY_INTERACTIVE: max_wait, PRIORITY_BATCH: batch_max_wait}
+        self.reserve = {PRIORITY_INTERACTIVE: 0.0, PRIORITY_BATCH: batch_reserve}
+        self.poll_seconds = poll_seconds
+
+        self._queues = {}  # provider -> heap of (priority, seq)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def queue_depth(self, provider):
+        with self._cond:
+            return len(self._queues.get(provider, []))
+
+    def _enqueue(self, provider, priority):
+        with self._cond:
+            queue = self._queues.setdefault(provider, [])
+            if len(queue) >= self.max_queue:
+                # Roughly how long until the queue ahead has drained
+                rpm = self.buckets.requests_per_minute.get(provider, math.inf)
+                raise AdmissionRejected(f"{provider} admission queue is full ({len(queue)} waiting)",
+                                        len(queue) * 60 / rpm)
+            entry = (priority, next(self._seq))
+            heapq.heappush(queue, entry)
+            return entry
+
+    def _dequeue(self, provider, entry):
+        with self._cond:
+            queue = self._queues[provider]
+            queue.remove(entry)
+            heapq.heapify(queue)
+            self._cond.notify_all()
+
+    def _try(self, provider, entry, tokens):
+        """
+        Returns:
+            float: 0 if admitted, otherwise how long to wait before trying again
+        """
+        with self._cond:
+            if self._queues[provider][0] != entry:
+                return self.poll_seconds  # Not our turn yet
+        return self.buckets.try_take(provider, tokens, self.reserve[entry[0]])
+
+    def _timed_out(self, provider, start, entry, wait):
+        if time.monotonic() - start + min(wait, self.poll_seconds) > self.max_wait[entry[0]]:
+            count_admission_rejected(provider, "timeout")
+            raise AdmissionRejected(f"{provider} quota: no capacity within {self.max_wait[entry[0]]:g} s", wait)
+
+    def acquire(self, provider, tokens, priority=None):
+        """
+        Blocks until the provider's quota can take a call of about tokens tokens.
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait would exceed the
+                               priority's maximum
+        """
+        if not self.buckets.is_limited(provider):
+            return
+        entry = self._enqueue_counted(provider, get_priority() if priority is None else priority)
+        start = time.monotonic()
+        try:
+            with stage_timer("admission"):
+                while True:
+                    wait = self._try(provider, entry, tokens)
+                    if wait == 0:
+                        return
+                    self._timed_out(provider, start, entry, wait)
+                    with self._cond:
+                        self._cond.wait(min(wait, 1.0))
+        finally:
+            self._dequeue(provider, entry)
+
+    async def acquire_async(self, provider, tokens, priority=None):
+        # Async form of acquire: waits on the event loop instead of a condition
+        if not self.buckets.is_limited(provider):
+            return
+        entry = self._enqueue_counted(provider, get_priority() if priority is None else priority)
+        start = time.monotonic()
+        try:
+            with stage_timer("admission"):
+                while True:
+                    wait = await asyncio.to_thread(self._try, provider, entry, tokens)
+                    if wait == 0:
+                        return
+                    self._timed_out(provider, start, entry, wait)
+                    await asyncio.sleep(min(wait, self.poll_seconds * 4))
+        finally:
+            self._dequeue(provider, entry)
+
+    def _enqueue_counted(self, provider, priority):
+        try:
+            return self._enqueue(provider, priority)
+        except AdmissionRejected:
+            count_admission_rejected(provider, "queue_full")
+            raise
+
+    def rate_limited(self, provider, error):
+        """
+        Converts a provider's own rate-limit error into AdmissionRejected and
+        drains the provider's buckets for its Retry-After.
+        """
+        retry_after = retry_after_seconds(error) or config['Admission'].getfloat('RetryAfterSeconds', 10)
+        self.buckets.drain(provider, retry_after)
+        count_admission_rejected(provider, "provider")
+        return AdmissionRejected(f"{provider} rate limit: {error}", retry_after)
+
+
+def is_rate_limit_error(error):
+    # openai.RateLimitError, google ResourceExhausted, Mistral SDKError with status 429, ...
+    if getattr(error, "status_code", None) == 429 or getattr(error, "code", None) == 429:
+        return True
+    return type(error).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests")
+
+
+def retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def create_admission_controller():
+    settings = config['Admission']
+    buckets = TokenBuckets(settings.get('Dir', 'data/admission'),
+                           parse_limits(settings.get('RequestsPerMinute', '')),
+                           parse_limits(settings.get('TokensPerMinute', '')),
+                           settings.getfloat('BurstSeconds', 15))
+    return AdmissionController(buckets,
+                               max_queue=settings.getint('MaxQueue', 64),
+                               max_wait=settings.getfloat('MaxWaitSeconds', 30),
+                               batch_max_wait=settings.getfloat('BatchMaxWaitSeconds', 600),
+                               batch_reserve=settings.getfloat('BatchReserve', 0.2))
+
+
+admission = create_admission_controller()
+
+
+@contextmanager
+def admitted(provider, payload):
+    """
+    Waits for quota before a provider call, and turns the provider's own 429s
+    into AdmissionRejected.
+
+    Args:
+        provider (str): Bucket name, e.g. "Gemini"
+        payload: The request (messages/contents) to estimate tokens from
+    """
+    if not config['Admission'].getboolean('Enabled', True):
+        yield
+        return
+
+    admission.acquire(provider, estimate_tokens(payload))
+    try:
+        yield
+    except Exception as e:
+        if is_rate_limit_error(e):
+            raise admission.rate_limited(provider, e) from e
+        raise
+
+
+@asynccontextmanager
+async def admitted_async(provider, payload):
+    # Async form of admitted
+    if not config['Admission'].getboolean('Enabled', True):
+        yield
+        return
+
+    await admission.acquire_async(provider, estimate_tokens(payload))
+    try:
+        yield
+    except Exception as e:
+        if is_rate_limit_error(e):
+            raise admission.rate_limited(provider, e) from e
+        raise
@@ -0,0 +1,151 @@
+import inspect
+import os
+import threading
+
+import httpx
+
+from utils.config import config
+
+# Provider registry: one long-lived client per provider per worker process
+_clients = {}
+_clients_pid = os.getpid()
+# Reentrant: a factory may create another client first (Gemini models configure genai)
+_lock = threading.RLock()
+
+
+def _reset_after_fork():
+    """
+    Drops every client inherited from the parent process. Sockets, TLS state and
+    gRPC channels must not be shared across a gunicorn fork, so the child builds
+    its own on first use.
+    """
+    global _clients, _clients_pid, _lock
+    _clients = {}
+    _clients_pid = os.getpid()
+    _lock = threading.RLock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _get_or_create(name, factory):
+    # Belt and braces for fork paths that skip the at-fork hook (e.g. os.fork from C)
+    if _clients_pid != os.getpid():
+        _reset_after_fork()
+
+    client = _clients.get(name)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(name)
+        if client is None:
+            client = factory()
+            _clients[name] = client
+    return client
+
+
+def create_http_client(asynchronous=False):
+    """
+    Creates an httpx client with a tuned connection pool and keep-alive so that
+    TLS sessions to the provider are reused between requests.
+    """
+    client_config = config['Clients']
+    # One async worker multiplexes many requests, so it gets a larger pool
+    prefix = 'Async' if asynchronous else ''
+    limits = httpx.Limits(
+        max_connections=client_config.getint(f'{prefix}MaxConnections', 200 if asynchronous else 20),
+        max_keepalive_connections=client_config.getint(f'{prefix}MaxKeepAlive', 50 if asynchronous else 10),
+        keepalive_expiry=client_config.getfloat('KeepAliveSeconds', 120)
+    )
+    timeout = httpx.Timeout(
+        client_config.getfloat('TimeoutSeconds', 300),
+        connect=client_config.getfloat('ConnectTimeoutSeconds', 10)
+    )
+    client_class = httpx.AsyncClient if asynchronous else httpx.Client
+    return client_class(limits=limits, timeout=timeout, http2=False)
+
+
+def get_openai_client():
+    def factory():
+        from openai import OpenAI
+        return OpenAI(api_key=config['OpenAI']['API_KEY'], http_client=create_http_client())
+
+    return _get_or_create("openai", factory)
+
+
+def get_mistral_client():
+    def factory():
+        from mistralai import Mistral
+        return Mistral(api_key=config['Mistral']['API_KEY'], client=create_http_client())
+
+    return _get_or_create("mistral", factory)
+
+
+def get_async_openai_client():
+    # Used by the ASGI app; must only be awaited from the worker's event loop
+    def factory():
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key=config['OpenAI']['API_KEY'], http_client=create_http_client(asynchronous=True))
+
+    return _get_or_create("openai_async", factory)
+
+
+def get_async_mistral_client():
+    # Mistral exposes *_async methods that use the async_client
+    def factory():
+        from mistralai import Mistral
+        return Mistral(api_key=config['Mistral']['API_KEY'], async_client=create_http_client(asynchronous=True))
+
+    return _get_or_create("mistral_async", factory)
+
+
+def get_gemini_model(model_name=None):
+    model_name = model_name or config['Gemini']['Model']
+
+    def configure():
+        import google.generativeai as genai
+        genai.configure(api_key=config['Gemini']['API_KEY'])
+        return genai
+
+    def factory():
+        genai = _get_or_create("gemini", configure)
+        return genai.GenerativeModel(model_name=model_name)
+
+    return _get_or_create(f"gemini:{model_name}", factory)
+
+
+def get_gemini_cached_model(cached_content):
+    # A model bound to a cached prompt template (see utils/prompt_cache.py)
+    def factory():
+        import google.generativeai as genai
+        return genai.GenerativeModel.from_cached_content(cached_content=cached_content)
+
+    return _get_or_create(f"gemini-cache:{cached_content.name}", factory)
+
+
+def register_client(name, client):
+    """
+    Installs a client under a registry name ("openai", "openai_async", "mistral",
+    "mistral_async" or "gemini:<model>"), e.g. a local stand-in for benchmarks.
+    """
+    with _lock:
+        _clients[name] = client
+
+
+def close_clients():
+    """
+    Closes pooled connections, e.g. from a gunicorn worker_exit hook.
+    """
+    with _lock:
+        for name, client in list(_clients.items()):
+            close = getattr(client, "close", None)
+            if callable(close):
+                try:
+                    result = close()
+                    if inspect.isawaitable(result):
+                        # Async clients die with the worker's event loop; drop the coroutine
+                        result.close()
+                except Exception as e:
+                    print(f"Error closing {name} client: {str(e)}")
+        _clients.clear()
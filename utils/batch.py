@@ -0,0 +1,354 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.utils import secure_filename
+
+from utils.config import config
+from utils.uploads import (UploadTooLarge, check_file_size, claim_spooled, max_file_bytes, open_spooled,
+                           remove_spooled, spool_stream)
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_ERROR = "error"
+
+
+def parse_concurrency(spec, default=4):
+    """
+    Parses a "Gemini:8|OpenAI:4" style setting into a dict.
+    """
+    limits = {}
+    for item in (spec or "").split('|'):
+        if ':' not in item:
+            continue
+        name, value = item.split(':', 1)
+        limits[name.strip()] = int(value)
+    limits.setdefault("Default", default)
+    return limits
+
+
+def max_expanded_bytes():
+    # Ceiling for all of a batch's files together, after zips are expanded
+    return config['Batch'].getint('MaxExpandedMB', 2048) << 20
+
+
+def expand_uploads(uploads):
+    """
+    Flattens spooled uploads into spooled files, expanding any .zip archives
+    into their members. The uploads' files are taken over: moved to the
+    result or removed, also when this fails.
+
+    Args:
+        uploads (list): List of (file_name, path) tuples
+
+    Returns:
+        list: List of (file_name, path) tuples with zips expanded
+
+    Raises:
+        UploadTooLarge: If a zip member is over [Uploads] MaxFileMB, or the
+                        files together are over [Batch] MaxExpandedMB
+    """
+    max_bytes = max_file_bytes()
+    max_total = max_expanded_bytes()
+    files = []
+    total = 0
+    try:
+        for file_name, path in uploads:
+            if not file_name.lower().endswith('.zip'):
+                files.append((secure_filename(file_name), claim_spooled(path)))
+                total += os.path.getsize(files[-1][1])
+                continue
+
+            with zipfile.ZipFile(path) as archive:
+                for info in archive.infolist():
+                    base_name = os.path.basename(info.filename)
+                    # Skip directories and macOS resource forks
+                    if info.is_dir() or not base_name or base_name.startswith('.') or '__MACOSX' in info.filename:
+                        continue
+                    # Checked before anything is decompressed, so a zip bomb is refused up front
+                    check_file_size(info.file_size, max_bytes)
+                    if total + info.file_size > max_total:
+                        raise UploadTooLarge(f"Expanded files are over {max_total >> 20} MB")
+                    # The sizes in the zip's headers can lie: spooling stops at the limit too
+                    with archive.open(info) as member:
+                        files.append((secure_filename(base_name), spool_stream(member, max_bytes)))
+                    total += os.path.getsize(files[-1][1])
+            remove_spooled(path)
+        if total > max_total:
+            raise UploadTooLarge(f"Expanded files are over {max_total >> 20} MB")
+    except BaseException:
+        for _, path in files + list(uploads):
+            remove_spooled(path)
+        raise
+    return files
+
+
+class BatchStore:
+    """
+    Keeps batch job state on disk so that any gunicorn worker can answer a
+    status poll, not just the one running the job. Each file's state lives in
+    its own JSON file so concurrent threads never write the same file.
+
+    The worker running a job touches its heartbeat file while files are left.
+    An unfinished job whose heartbeat is older than stale_seconds has lost its
+    worker (e.g. to a restart) and is reported as failed. Finished and failed
+    jobs are swept retention_seconds after their last activity.
+
+    Layout:
+        <dir>/<job_id>/job.json           job metadata
+        <dir>/<job_id>/heartbeat          touched while the job runs
+        <dir>/<job_id>/state/<index>.json per-file status
+        <dir>/<job_id>/results/<index>    per-file output text
+    """
+    def __init__(self, jobs_dir, stale_seconds=120, retention_seconds=7 * 24 * 3600):
+        self.jobs_dir = jobs_dir
+        self.stale_seconds = stale_seconds
+        self.retention_seconds = retention_seconds
+
+    def _job_dir(self, job_id):
+        # Job IDs are generated by us; reject anything else to avoid path traversal
+        if not job_id or secure_filename(job_id) != job_id:
+            raise KeyError(job_id)
+        return os.path.join(self.jobs_dir, job_id)
+
+    @staticmethod
+    def _write_json(file_path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix=".tmp")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, file_path)
+
+    @staticmethod
+    def _read_json(file_path):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def create(self, file_names, meta):
+        job_id = uuid.uuid4().hex
+        job_dir = self._job_dir(job_id)
+        os.makedirs(os.path.join(job_dir, "state"))
+        os.makedirs(os.path.join(job_dir, "results"))
+
+        self._write_json(os.path.join(job_dir, "job.json"), {
+            "job_id": job_id,
+            "created": time.time(),
+            "file_count": len(file_names),
+            **meta
+        })
+        for index, file_name in enumerate(file_names):
+            self.set_file_state(job_id, index, {"file_name": file_name, "status": STATUS_PENDING})
+        self.touch(job_id)
+        return job_id
+
+    def touch(self, job_id):
+        file_path = os.path.join(self._job_dir(job_id), "heartbeat")
+        with open(file_path, 'a'):
+            os.utime(file_path)
+
+    def set_file_state(self, job_id, index, state):
+        state = {"index": index, **state}
+        self._write_json(os.path.join(self._job_dir(job_id), "state", f"{index}.json"), state)
+
+    def save_result(self, job_id, index, output_text):
+        file_path = os.path.join(self._job_dir(job_id), "results", str(index))
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(output_text)
+
+    def read_result(self, job_id, index):
+        file_path = os.path.join(self._job_dir(job_id), "results", str(int(index)))
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def get(self, job_id):
+        """
+        Returns the job with the current state of every file, or None if unknown.
+        """
+        try:
+            job_dir = self._job_dir(job_id)
+            job = self._read_json(os.path.join(job_dir, "job.json"))
+        except (KeyError, FileNotFoundError):
+            return None
+
+        files = []
+        for index in range(job["file_count"]):
+            try:
+                files.append(self._read_json(os.path.join(job_dir, "state", f"{index}.json")))
+            except (FileNotFoundError, json.JSONDecodeError):
+                files.append({"index": index, "status": STATUS_PENDING})
+
+        counts = {}
+        for file_state in files:
+            counts[file_state["status"]] = counts.get(file_state["status"], 0) + 1
+
+        try:
+            heartbeat = os.path.getmtime(os.path.join(job_dir, "heartbeat"))
+        except FileNotFoundError:
+            heartbeat = job["created"]
+
+        finished = counts.get(STATUS_DONE, 0) + counts.get(STATUS_ERROR, 0)
+        if finished == len(files):
+            job["status"] = STATUS_DONE
+        elif time.time() - heartbeat > self.stale_seconds:
+            job["status"] = STATUS_ERROR
+            job["error"] = "The worker running this job stopped; submit the unfinished files again"
+        elif counts.get(STATUS_PENDING, 0) == len(files):
+            job["status"] = STATUS_PENDING
+        else:
+            job["status"] = STATUS_RUNNING
+
+        job["counts"] = counts
+        job["files"] = files
+        return job
+
+    def sweep(self):
+        """
+        Deletes the directories of finished or failed jobs whose last activity
+        (heartbeat or file state) is older than the retention period.
+
+        Returns:
+            int: Jobs deleted
+        """
+        if not os.path.isdir(self.jobs_dir):
+            return 0
+        cutoff = time.time() - self.retention_seconds
+        deleted = 0
+        for job_id in os.listdir(self.jobs_dir):
+            job_dir = os.path.join(self.jobs_dir, job_id)
+            if not os.path.isdir(job_dir):
+                continue
+            try:
+                job = self.get(job_id)
+                # A directory without a job.json was left by a create that failed
+                if job is not None and job["status"] not in (STATUS_DONE, STATUS_ERROR):
+                    continue
+                paths = [job_dir, os.path.join(job_dir, "heartbeat")]
+                state_dir = os.path.join(job_dir, "state")
+                if os.path.isdir(state_dir):
+                    paths += [os.path.join(state_dir, name) for name in os.listdir(state_dir)]
+                last_activity = max(os.path.getmtime(path) for path in paths if os.path.exists(path))
+                if last_activity < cutoff:
+                    shutil.rmtree(job_dir, ignore_errors=True)
+                    deleted += 1
+            except (OSError, ValueError) as e:
+                print(f"Batch sweep of {job_id} failed: {e}")
+        return deleted
+
+
+class BatchRunner:
+    """
+    Runs the per-file AI calls of a batch concurrently, with a separate limit on
+    concurrent calls for each provider, and keeps the heartbeat of its
+    unfinished jobs fresh. The heartbeat thread also sweeps old jobs out of
+    the store every sweep_seconds.
+    """
+    def __init__(self, store, concurrency, heartbeat_seconds=15, sweep_seconds=600):
+        self.store = store
+        self.concurrency = concurrency
+        self.heartbeat_seconds = heartbeat_seconds
+        self.sweep_seconds = sweep_seconds
+        self._semaphores = {}
+        self._remaining = {}  # job_id -> files not finished yet
+        self._heartbeat = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, sum(concurrency.values())),
+                                            thread_name_prefix="batch")
+
+    def _semaphore(self, model):
+        with self._lock:
+            if model not in self._semaphores:
+                limit = self.concurrency.get(model, self.concurrency["Default"])
+                self._semaphores[model] = threading.BoundedSemaphore(limit)
+            return self._semaphores[model]
+
+    def submit(self, files, model, prompt_text, file_ext, call_fn):
+        """
+        Creates a job and schedules its files.
+
+        Args:
+            files (list): List of (file_name, path) tuples of spooled files,
+                          each removed once it has been processed
+            model (str): Provider name
+            prompt_text (str): Prompt applied to every file
+            file_ext (str): Output file extension
+            call_fn (callable): call_fn(model, file_blob, file_name, prompt_text, slot) -> str,
+                                holding slot(provider) around each provider call, so
+                                that model=Auto counts against the provider it is routed to
+
+        Returns:
+            str: The job ID
+        """
+        job_id = self.store.create([name for name, _ in files],
+                                   {"model": model, "file_ext": file_ext})
+        with self._lock:
+            self._remaining[job_id] = len(files)
+            if self._heartbeat is None:
+                # Started on first use, so it runs in the worker process rather than before a fork
+                self._heartbeat = threading.Thread(target=self._beat, name="batch-heartbeat", daemon=True)
+                self._heartbeat.start()
+        for index, (file_name, path) in enumerate(files):
+            self._executor.submit(self._run_file, job_id, index, file_name, path,
+                                  model, prompt_text, call_fn)
+        return job_id
+
+    def _beat(self):
+        last_sweep = 0.0
+        while True:
+            time.sleep(self.heartbeat_seconds)
+            with self._lock:
+                job_ids = list(self._remaining)
+            for job_id in job_ids:
+                try:
+                    self.store.touch(job_id)
+                except Exception as e:
+                    print(f"Batch heartbeat for {job_id} failed: {e}")
+
+            if time.monotonic() - last_sweep > self.sweep_seconds:
+                last_sweep = time.monotonic()
+                try:
+                    deleted = self.store.sweep()
+                    if deleted:
+                        print(f"Swept {deleted} finished batch jobs")
+                except Exception as e:
+                    print(f"Batch sweep failed: {e}")
+
+    def _run_file(self, job_id, index, file_name, path, model, prompt_text, call_fn):
+        try:
+            self.store.set_file_state(job_id, index, {"file_name": file_name, "status": STATUS_RUNNING})
+            start = time.perf_counter()
+            try:
+                # The per-provider slot is taken inside call_fn, after routing
+                output_text = call_fn(model, open_spooled(path), file_name, prompt_text, self._semaphore)
+                self.store.save_result(job_id, index, output_text)
+                state = {"status": STATUS_DONE}
+            except Exception as e:
+                state = {"status": STATUS_ERROR, "error": str(e)}
+
+            state["elapsed"] = round(time.perf_counter() - start, 3)
+            self.store.set_file_state(job_id, index, {"file_name": file_name, **state})
+        finally:
+            remove_spooled(path)
+            with self._lock:
+                self._remaining[job_id] -= 1
+                if not self._remaining[job_id]:
+                    del self._remaining[job_id]
+
+
+def create_batch_runner():
+    batch_config = config['Batch']
+    store = BatchStore(batch_config.get('Dir', 'data/jobs'),
+                       stale_seconds=batch_config.getint('StaleSeconds', 120),
+                       retention_seconds=int(batch_config.getfloat('RetentionHours', 168) * 3600))
+    concurrency = parse_concurrency(batch_config.get('MaxConcurrent', ''),
+                                    batch_config.getint('DefaultConcurrent', 4))
+    return BatchRunner(store, concurrency, heartbeat_seconds=batch_config.getint('HeartbeatSeconds', 15))
+
+
+# Batch runner (one thread pool per worker process, sharing the job store)
+batch_runner = create_batch_runner()
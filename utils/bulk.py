@@ -0,0 +1,320 @@
+import argparse
+import csv
+import fnmatch
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from utils.config import config
+from utils.admission import PRIORITY_BATCH, set_priority
+from utils.batch import parse_concurrency
+from utils.router import provider_router, is_routed
+from utils.tables import is_table_format, encode_table
+import utils.call_ai as ai
+
+MANIFEST_NAME = ".aru-manifest.jsonl"
+REPORT_FIELDS = ["file", "status", "seconds", "attempts", "output", "error"]
+
+OUTCOME_DONE = "done"
+OUTCOME_SKIPPED = "skipped"
+OUTCOME_ERROR = "error"
+
+
+def sha256_file(file_path):
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def find_inputs(input_dir, patterns, recursive=False):
+    """
+    Returns:
+        list: Paths relative to input_dir of the files matching any of
+              patterns (e.g. "*.pdf"), sorted
+    """
+    found = []
+    for root, dirs, files in os.walk(input_dir):
+        # Skip hidden directories (and, unless recursive, all subdirectories)
+        dirs[:] = sorted(d for d in dirs if recursive and not d.startswith('.'))
+        for name in files:
+            if not name.startswith('.') and any(fnmatch.fnmatch(name.lower(), p.lower()) for p in patterns):
+                found.append(os.path.relpath(os.path.join(root, name), input_dir))
+    return sorted(found)
+
+
+def settings_digest(model, prompt_text, file_ext):
+    # Everything besides the input that changes the output: a new prompt or model redoes every file
+    h = hashlib.sha256()
+    for part in (model, ai.get_model_version(model), file_ext, prompt_text):
+        part = (part or "").encode('utf-8')
+        h.update(len(part).to_bytes(8, 'big'))
+        h.update(part)
+    return h.hexdigest()
+
+
+class Manifest:
+    """
+    Append-only JSON Lines record of finished files, kept in the output
+    directory: one line per file, written (and fsynced) after its output, so
+    a run that crashes or is interrupted resumes where it stopped. The last
+    line for a path wins.
+
+    A file is skipped when its input hash and the run's settings (model,
+    prompt, output format) match its entry and the output is still there
+    with the hash it was written with. Input hashes are reused while a file's
+    size and mtime are unchanged.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # A line cut off by a crash
+                    self.entries[entry["file"]] = entry
+
+    def input_digest(self, rel_path, file_path):
+        st = os.stat(file_path)
+        entry = self.entries.get(rel_path)
+        if entry and entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+            return entry["input_sha256"], st
+        return sha256_file(file_path), st
+
+    def is_current(self, rel_path, input_sha256, settings, output_path):
+        entry = self.entries.get(rel_path)
+        if not entry or entry["input_sha256"] != input_sha256 or entry["settings"] != settings:
+            return False
+        return os.path.exists(output_path) and sha256_file(output_path) == entry["output_sha256"]
+
+    def record(self, entry):
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.entries[entry["file"]] = entry
+
+
+class Progress:
+    """
+    One status line with counts, throughput and ETA: redrawn in place on a
+    terminal, printed every log_seconds otherwise (e.g. under cron).
+    """
+    def __init__(self, total, stream=sys.stderr, log_seconds=30):
+        self.total = total
+        self.stream = stream
+        self.log_seconds = log_seconds
+        self.counts = {OUTCOME_DONE: 0, OUTCOME_SKIPPED: 0, OUTCOME_ERROR: 0}
+        self.start = time.monotonic()
+        self._last_log = 0.0
+        self._tty = stream.isatty()
+        self._lock = threading.Lock()
+
+    def line(self):
+        finished = sum(self.counts.values())
+        elapsed = time.monotonic() - self.start
+        # Rate and ETA from the files that were actually processed: skips are nearly free
+        processed = self.counts[OUTCOME_DONE] + self.counts[OUTCOME_ERROR]
+        rate = processed / elapsed if elapsed > 0 else 0
+        eta = format_seconds((self.total - finished) / rate) if rate else "--"
+        return (f"[{finished}/{self.total}] {100 * finished / max(1, self.total):5.1f}%  "
+                f"done {self.counts[OUTCOME_DONE]}  skipped {self.counts[OUTCOME_SKIPPED]}  "
+                f"errors {self.counts[OUTCOME_ERROR]}  {rate * 60:.1f} files/min  "
+                f"elapsed {format_seconds(elapsed)}  ETA {eta}")
+
+    def update(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+            now = time.monotonic()
+            if self._tty:
+                self.stream.write("\r" + self.line() + "\033[K")
+                self.stream.flush()
+            elif now - self._last_log >= self.log_seconds or sum(self.counts.values()) == self.total:
+                self._last_log = now
+                print(self.line(), file=self.stream, flush=True)
+
+    def finish(self):
+        if self._tty:
+            self.stream.write("\n")
+            self.stream.flush()
+
+
+def format_seconds(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}h{rest // 60:02d}m" if hours else f"{rest // 60}m{rest % 60:02d}s"
+
+
+class BulkRunner:
+    """
+    Runs one prompt over many files with at most concurrency[provider] calls
+    in flight per provider (model=Auto holds the slot of whichever provider
+    the router picks). Calls queue behind interactive API traffic for quota.
+    A failed file is retried `retries` times with backoff, then reported and
+    left for the next run.
+    """
+    def __init__(self, model, prompt_text, file_ext, concurrency, retries=2, backoff_seconds=5):
+        self.model = model
+        self.prompt_text = prompt_text
+        self.file_ext = file_ext
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.settings = settings_digest(model, prompt_text, file_ext)
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, provider):
+        with self._lock:
+            if provider not in self._semaphores:
+                limit = self.concurrency.get(provider, self.concurrency["Default"])
+                self._semaphores[provider] = threading.BoundedSemaphore(limit)
+            return self._semaphores[provider]
+
+    def max_workers(self):
+        providers = provider_router.providers if is_routed(self.model) else [self.model]
+        return max(1, sum(self.concurrency.get(p, self.concurrency["Default"]) for p in providers))
+
+    def call_ai(self, provider, file_blob, file_name):
+        if is_routed(provider):
+            return provider_router.route(lambda routed: self.call_ai(routed, file_blob, file_name))
+
+        with self._semaphore(provider):
+            return ai.provider_extract_text(provider, file_blob, file_name, self.prompt_text)
+
+    def output_path(self, output_dir, rel_path):
+        return os.path.join(output_dir, os.path.splitext(rel_path)[0] + f".{self.file_ext}")
+
+    def process(self, input_dir, output_dir, rel_path, manifest):
+        """
+        Returns:
+            dict: The file's report row
+        """
+        set_priority(PRIORITY_BATCH)
+        file_path = os.path.join(input_dir, rel_path)
+        output_path = self.output_path(output_dir, rel_path)
+        row = {"file": rel_path, "output": os.path.relpath(output_path, output_dir), "attempts": 0, "error": ""}
+        start = time.perf_counter()
+
+        try:
+            input_sha256, st = manifest.input_digest(rel_path, file_path)
+            if manifest.is_current(rel_path, input_sha256, self.settings, output_path):
+                return {**row, "status": OUTCOME_SKIPPED, "seconds": 0}
+
+            file_name = os.path.basename(rel_path)
+            file_blob = ai.handle_eml(ai.read_file(file_path), file_name)
+
+            for attempt in range(self.retries + 1):
+                row["attempts"] = attempt + 1
+                try:
+                    output_text = self.call_ai(self.model, file_blob, file_name)
+                    break
+                except Exception as e:
+                    if attempt == self.retries:
+                        raise
+                    print(f"{rel_path}: attempt {attempt + 1} failed ({e}), retrying", file=sys.stderr)
+                    time.sleep(self.backoff_seconds * 2 ** attempt)
+
+            body = encode_table(output_text, self.file_ext) if is_table_format(self.file_ext) \
+                else output_text.encode('utf-8')
+            write_atomic(output_path, body)
+            manifest.record({"file": rel_path, "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                             "input_sha256": input_sha256, "settings": self.settings,
+                             "output": row["output"], "output_sha256": hashlib.sha256(body).hexdigest(),
+                             "finished": time.time()})
+            return {**row, "status": OUTCOME_DONE, "seconds": round(time.perf_counter() - start, 2)}
+        except Exception as e:
+            return {**row, "status": OUTCOME_ERROR, "seconds": round(time.perf_counter() - start, 2),
+                    "error": str(e)}
+
+    def run(self, input_dir, rel_paths, output_dir, manifest, report_path):
+        """
+        Processes rel_paths, writing each file's row to the CSV report as it
+        finishes.
+
+        Returns:
+            dict: Counts by outcome
+        """
+        progress = Progress(len(rel_paths))
+        with open(report_path, "w", newline="", encoding="utf-8") as report_file, \
+                ThreadPoolExecutor(max_workers=self.max_workers(), thread_name_prefix="bulk") as executor:
+            report = csv.DictWriter(report_file, fieldnames=REPORT_FIELDS)
+            report.writeheader()
+            futures = [executor.submit(self.process, input_dir, output_dir, rel_path, manifest)
+                       for rel_path in rel_paths]
+            try:
+                for future in as_completed(futures):
+                    row = future.result()
+                    report.writerow(row)
+                    report_file.flush()
+                    progress.update(row["status"])
+            except KeyboardInterrupt:
+                # Finished files are in the manifest: the next run picks up the rest
+                executor.shutdown(wait=False, cancel_futures=True)
+                progress.finish()
+                raise
+        progress.finish()
+        return progress.counts
+
+
+def write_atomic(file_path, body):
+    # A crash never leaves a half-written output that the manifest could vouch for
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path) or ".", suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(body)
+    os.replace(tmp_path, file_path)
+
+
+def main(argv=None, input_dir=None):
+    parser = argparse.ArgumentParser(description="Run a prompt over every matching file in a directory")
+    parser.add_argument("input_dir", nargs="?" if input_dir else None, default=input_dir)
+    parser.add_argument("--output-dir", help="Defaults to input_dir")
+    parser.add_argument("--glob", nargs="+", default=["*.pdf"], help="Input file patterns")
+    parser.add_argument("--recursive", action="store_true")
+    parser.add_argument("--prompt", default="ocr", help="[prompt:<id>] section; sets the defaults below")
+    parser.add_argument("--prompt-text", help="Overrides the section's prompt")
+    parser.add_argument("--model", help="Gemini, OpenAI, Mistral or Auto")
+    parser.add_argument("--file-ext", help="csv, txt, md, parquet, arrow, ...")
+    parser.add_argument("--concurrency", default=config['Batch'].get('MaxConcurrent', ''),
+                        help='Calls in flight per provider, e.g. "Gemini:8|OpenAI:4"')
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--report", help="Per-file CSV report (default: <output_dir>/bulk-report-<time>.csv)")
+    args = parser.parse_args(argv)
+
+    prompt = config[f"prompt:{args.prompt}"]
+    output_dir = args.output_dir or args.input_dir
+    os.makedirs(output_dir, exist_ok=True)
+    runner = BulkRunner(args.model or prompt['Model'], args.prompt_text or prompt['Prompt'],
+                        args.file_ext or prompt['FileExt'],
+                        parse_concurrency(args.concurrency, config['Batch'].getint('DefaultConcurrent', 4)),
+                        retries=args.retries)
+
+    rel_paths = find_inputs(args.input_dir, args.glob, args.recursive)
+    manifest = Manifest(os.path.join(output_dir, MANIFEST_NAME))
+    report_path = args.report or os.path.join(output_dir, f"bulk-report-{time.strftime('%Y%m%d-%H%M%S')}.csv")
+    print(f"{len(rel_paths)} files, {runner.model} x {runner.max_workers()} workers -> {output_dir}",
+          file=sys.stderr)
+
+    counts = runner.run(args.input_dir, rel_paths, output_dir, manifest, report_path)
+    print(f"Done: {counts[OUTCOME_DONE]} processed, {counts[OUTCOME_SKIPPED]} unchanged, "
+          f"{counts[OUTCOME_ERROR]} failed. Report: {report_path}", file=sys.stderr)
+    return 1 if counts[OUTCOME_ERROR] else 0
+
+
+# Example usage (from the repo root):
+#   python -m utils.bulk "data/Loss Run" --model Gemini --concurrency "Gemini:8"
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,31 @@
 import base64
+import csv
 import io
 import mimetypes
-import PyPDF2
+import os
 import re
 
 from utils.config import config
+from utils.pdf_extract import create_pdf_extractor, split_pdf_pages
+from utils.chunking import map_reduce_text
+from utils.excel_extract import ExcelTextExtractor
+from utils.ai_clients import get_openai_client, get_mistral_client
+from utils.metrics import stage_timer, provider_call, count_ocr_fallback, count_ocr_pages
+from utils.uploads import upload_source, as_bytes
+from utils.admission import admitted
+from utils.eml_extractor import extract_email_chain
+from utils.router import provider_router, is_routed
+from utils.prompt_cache import (DOCUMENT_HEADER, canonical_prompt, openai_cache_args, record_usage,
+                                 gemini_request)
 
 MIN_PDF_TEXT_LEN = 100
 MAX_TEXT_LEN = 100000
+# Read this far past MAX_TEXT_LEN first, to tell a document cut off at the budget from one that fits
+CUTOFF_MARGIN = 64
 OCR_TAG = "OCR!"
+TEXT_NOT_FOUND = "Text NOT FOUND in pdf/xlsx"
+# A number with thousands separators, e.g. "$1,234.50", "(1,000)", "12.5%"
+NUMBER_CELL_PATTERN = re.compile(r"^\s*\(?-?\s*[$€£¥]?\s*\d[\d,]*(\.\d+)?\s*\)?%?\s*$")
 
 
 def read_file(file_path):
@@ -52,6 +69,11 @@ def get_file_type(file_name):
 
 
 def post_process_csv(input_text):
+    with stage_timer("post_process"):
+        return _post_process_csv(input_text)
+
+
+def _post_process_csv(input_text):
     # Step 1: Extract content between triple backticks if present
     code_block_pattern = r"```(?:csv)?\s*([\s\S]*?)\s*```"
     code_match = re.search(code_block_pattern, input_text)
@@ -61,56 +83,43 @@ def post_process_csv(input_text):
     else:
         csv_content = input_text
     
-    # Step 2: remove commas + replace bars with commas
+    # Step 2: '^^'-separated rows -> CSV
     if "^^" in csv_content:
-        return csv_content.replace(',', '').replace('^^', ',')
+        output = io.StringIO()
+        csv.writer(output, lineterminator="\n").writerows(split_csv_rows(csv_content))
+        return output.getvalue().rstrip("\n")
     
     return csv_content
 
+
+def split_csv_rows(csv_content):
+    """
+    Splits '^^'-separated model output into rows of cells. Thousands
+    separators are dropped from numbers ("$1,234.50" -> "$1234.50"); commas in
+    other cells ("Smith, John") are kept, and the CSV writer quotes those cells.
+    """
+    return [[cell.replace(',', '') if NUMBER_CELL_PATTERN.match(cell) else cell for cell in line.split('^^')]
+            for line in csv_content.split('\n')]
+
   
-def handle_pdf_xls(file_blob, file_type):
+def handle_pdf_xls(file_blob, file_type, max_text_len=MAX_TEXT_LEN, ocr_pages_fn=None, defer_ocr=False):
     # if type "unknown", and small in size, try treating it as "text"
     if file_type == "text" or file_type == "unknown":
         return file_blob  # text
     
-    # Handle PDF files using PyPDF2
+    # Handle PDF files using PyPDF2 (sampled, parallel, stops at max_text_len);
+    # ocr_pages_fn/defer_ocr: see PdfTextExtractor.extract
     if file_type == "pdf":
-        reader = PyPDF2.PdfReader(io.BytesIO(file_blob))
-        
-        # Extract text with page numbers
-        text_parts = []
-        text_len = 0
-        for i, page in enumerate(reader.pages):
-            page_text = page.extract_text()
-            text_len += len(page_text)
-            text_parts.append(f"--- Page {i+1} ---\n{page_text}")
-            
-        if text_len < MIN_PDF_TEXT_LEN:
+        text, is_scanned = create_pdf_extractor(MIN_PDF_TEXT_LEN, max_text_len).extract(
+            file_blob, ocr_pages_fn, defer_ocr)
+        if is_scanned:
             return OCR_TAG
         
-        text = "\n\n".join(text_parts)
         return text
 
-    # Handle Excel files (.xlsx and .xls)
+    # Handle Excel files (.xlsx and .xls): one parse, stops at max_text_len
     elif file_type == "excel":
-        import pandas as pd
-        
-        # Read Excel file with all sheets
-        excel_file = io.BytesIO(file_blob)
-        # Get all sheet names
-        xls = pd.ExcelFile(excel_file)
-        sheet_names = xls.sheet_names
-        
-        # Process each sheet
-        all_sheets_content = []
-        for sheet_name in sheet_names:
-            df = pd.read_excel(excel_file, sheet_name=sheet_name)
-            sheet_content = f"--- Sheet: {sheet_name} ---\n{df.to_string()}"
-            all_sheets_content.append(sheet_content)
-        
-        # Combine all sheets' content
-        text = "\n\n".join(all_sheets_content)
-        return text
+        return ExcelTextExtractor(max_text_len).extract(file_blob)
     
     return ""
 
@@ -141,162 +150,381 @@ def load_prompts():
     return sorted_names, prompt_map
 
 
-def mistral_extract_text(file_blob, file_name, prompt_text):
-    from mistralai import Mistral
-
-    api_key = config['Mistral']['API_KEY']
-    model = config['Mistral']['Model']
-    
-    # Initialize the Mistral client
-    client = Mistral(api_key=api_key)
-    
+def mistral_build_messages(client, file_blob, file_name, prompt_text):
     if get_file_type(file_name) in ['text', 'unknown']:
-        if isinstance(file_blob, bytes):
-            file_blob = file_blob.decode('utf-8')
+        if not isinstance(file_blob, str):
+            file_blob = str(file_blob, 'utf-8')
     
-    # Upload the document and get a signed URL
-    uploaded_file = client.files.upload(
-        file={
-            "file_name": file_name,
-            "content": file_blob,
-        },
-        purpose="batch"
-    )
+    # Upload the document and get a signed URL (spooled uploads stream from disk)
+    with upload_source(file_blob) as content:
+        uploaded_file = client.files.upload(
+            file={
+                "file_name": file_name,
+                "content": content,
+            },
+            purpose="batch"
+        )
     
     signed_url = client.files.get_signed_url(file_id=uploaded_file.id, expiry=1)
     
     # Define the chat message including the prompt and document
-    messages = [
+    return [
         {
             "role": "user",
             "content": [
-                {"type": "text", "text": prompt_text},
+                {"type": "text", "text": canonical_prompt(prompt_text)},
                 {"type": "document_url", "document_url": signed_url.url}
             ]
         }
     ]
+
+
+def mistral_extract_text(file_blob, file_name, prompt_text):
+    model = config['Mistral']['Model']
+    
+    # Reuse the pooled Mistral client
+    client = get_mistral_client()
+    messages = mistral_build_messages(client, file_blob, file_name, prompt_text)
     
     # Get the chat response
-    chat_response = client.chat.complete(
-        model=model,
-        messages=messages
-    )
+    with admitted("Mistral", messages), provider_call("Mistral"):
+        chat_response = client.chat.complete(
+            model=model,
+            messages=messages
+        )
     
     # Return the content of the response
     return post_process_csv(chat_response.choices[0].message.content)
 
 
-def mistral_extract_text_ocr(file_blob, file_name):
-    from mistralai import Mistral
+def mistral_stream_text(file_blob, file_name, prompt_text):
+    client = get_mistral_client()
+    messages = mistral_build_messages(client, file_blob, file_name, prompt_text)
+    
+    # Yield raw chunks; the caller runs post_process_csv on the joined text
+    with admitted("Mistral", messages):
+        for event in client.chat.stream(model=config['Mistral']['Model'], messages=messages):
+            if event.data.choices and event.data.choices[0].delta.content:
+                yield event.data.choices[0].delta.content
 
-    api_key = config['Mistral']['API_KEY']
-    client = Mistral(api_key=api_key)
+
+def mistral_ocr_pages(file_blob, file_name):
+    """
+    Returns:
+        list: Markdown of each page of the document
+    """
+    client = get_mistral_client()
     
     # Upload document and get signed URL
-    uploaded_file = client.files.upload(
-        file={"file_name": file_name, "content": file_blob},
-        purpose="ocr"
-    )
+    with upload_source(file_blob) as content:
+        uploaded_file = client.files.upload(
+            file={"file_name": file_name, "content": content},
+            purpose="ocr"
+        )
     signed_url = client.files.get_signed_url(file_id=uploaded_file.id, expiry=1)
    
     # Process document with explicit type definitions
-    ocr_response = client.ocr.process(
-        model="mistral-ocr-latest",
-        document={
-            "type": "document_url",
-            "document_url": signed_url.url  # Pass URL directly as string
-        }
-    )
+    document = {
+        "type": "document_url",
+        "document_url": signed_url.url  # Pass URL directly as string
+    }
+    with admitted("MistralOCR", document), provider_call("MistralOCR"):
+        ocr_response = client.ocr.process(
+            model="mistral-ocr-latest",
+            document=document
+        )
     
-    return "\n\n".join(page.markdown for page in ocr_response.pages)
+    return [page.markdown for page in ocr_response.pages]
 
 
-def openai_extract_text(file_blob, file_name, prompt_text):
-    from openai import OpenAI
+def mistral_extract_text_ocr(file_blob, file_name):
+    page_texts = mistral_ocr_pages(file_blob, file_name)
+    count_ocr_pages("document", len(page_texts))
+    return "\n\n".join(page_texts)
+
+
+def ocr_file_name(file_name, page_indexes):
+    # e.g. "claims.pdf" -> "claims-p3-9.pdf"
+    return f"{os.path.splitext(file_name)[0]}-p{page_indexes[0] + 1}-{page_indexes[-1] + 1}.pdf"
+
+
+def mistral_ocr_selected_pages(file_blob, file_name, page_indexes):
+    """
+    OCRs only the given pages of a PDF, copied into a small PDF of their own.
+
+    Returns:
+        list: Text of each page, in page_indexes order
+    """
+    with stage_timer("page_ocr"):
+        pages_blob = split_pdf_pages(file_blob, page_indexes)
+        page_texts = mistral_ocr_pages(pages_blob, ocr_file_name(file_name, page_indexes))
+    count_ocr_pages("pages", len(page_indexes))
+    return page_texts
+
+
+def extract_document_text(file_blob, file_name, file_type, max_text_len=MAX_TEXT_LEN, full_text_len=None):
+    """
+    Local text extraction with the Mistral OCR fallback for scanned PDFs; scanned
+    pages of a mostly digital PDF are OCRed on their own while the rest is extracted.
+
+    Reading stops at max_text_len characters. With full_text_len (map-reduce
+    is on, see max_document_len), a document that runs past max_text_len is
+    read again up to full_text_len: only documents that will be chunked are
+    read in full.
+    """
+    ocr_texts = {}  # page index -> OCR text, so a second read OCRs no page again
+
+    def ocr_pages(page_indexes):
+        missing = [i for i in page_indexes if i not in ocr_texts]
+        if missing:
+            ocr_texts.update(zip(missing, mistral_ocr_selected_pages(file_blob, file_name, missing)))
+        return [ocr_texts[i] for i in page_indexes]
+
+    def read(text_len):
+        with stage_timer("extract"):
+            text = handle_pdf_xls(file_blob, file_type, text_len, ocr_pages_fn=ocr_pages)
+        if text != OCR_TAG and not isinstance(text, str):
+            # Text files come back as the raw upload (bytes or a spooled map); decode only the budget
+            text = str(text[:text_len * 4], 'utf-8', errors='replace')[:text_len]
+        return text
+
+    text = read(max_text_len + CUTOFF_MARGIN if full_text_len else max_text_len)
+    if full_text_len and text != OCR_TAG and len(text) > max_text_len:
+        text = read(full_text_len)
+
+    if text == OCR_TAG:
+        count_ocr_fallback()
+        with stage_timer("ocr_fallback"):
+            text = mistral_extract_text_ocr(file_blob, file_name)
+    
+    return text
+
+
+def is_chunking_enabled():
+    return config['Chunking'].getboolean('Enabled', False)
+
+
+def max_document_len():
+    # With chunking on, documents longer than MAX_TEXT_LEN are read up to this for map-reduce
+    return config['Chunking'].getint('MaxDocumentLen', 2000000) if is_chunking_enabled() else None
+
+
+def document_part(text):
+    # Follows the prompt template, which always comes first and byte for byte the
+    # same, so provider-side caches can reuse it (see utils/prompt_cache.py)
+    return f"{DOCUMENT_HEADER}{limit_text(text)}"
+
+
+def openai_image_messages(file_blob, file_type, prompt_text):
+    base64_blob = base64.b64encode(file_blob).decode('utf-8')
+    return [{
+        "role": "user",
+        "content": [
+            {"type": "text", "text": canonical_prompt(prompt_text)},
+            {
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:image/{file_type};base64,{base64_blob}"
+                }
+            }
+        ]
+    }]
+
+
+def openai_text_messages(prompt_text, text):
+    # Template and document as separate parts: the template part is the stable prefix
+    return [{
+        "role": "user",
+        "content": [
+            {"type": "text", "text": canonical_prompt(prompt_text)},
+            {"type": "text", "text": document_part(text)}
+        ]
+    }]
 
-    api_key = config['OpenAI']['API_KEY']
-    model = config['OpenAI']['Model']
-    client = OpenAI(api_key=api_key)
 
+def openai_prompt(messages):
+    # The template part of openai_image_messages/openai_text_messages
+    return messages[0]["content"][0]["text"]
+
+
+def openai_build_messages(file_blob, file_name, prompt_text):
+    """
+    Builds the chat messages for OpenAI, or None if no text could be extracted.
+    """
     # Determine file type
     file_type = get_file_type(file_name)
  
     if file_type == "image":
-        base64_blob = base64.b64encode(file_blob).decode('utf-8')
-        messages = [{
-            "role": "user",
-            "content": [
-                {"type": "text", "text": prompt_text},
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/{file_type};base64,{base64_blob}"
-                    }
-                }
-            ]
-        }]
-    else:
-        text = handle_pdf_xls(file_blob, file_type)
+        return openai_image_messages(file_blob, file_type, prompt_text)
 
-        if text == OCR_TAG:
-            text = mistral_extract_text_ocr(file_blob, file_name)
-        elif len(text) == 0:
-            return "Text NOT FOUND in pdf/xlsx"
-        
-        messages = [{
-            "role": "user",
-            "content": f"{prompt_text}\n\nDocument content:\n{limit_text(text)}"
-        }]
+    text = extract_document_text(file_blob, file_name, file_type)
+    if len(text) == 0:
+        return None
+    
+    return openai_text_messages(prompt_text, text)
 
-    response = client.chat.completions.create(
-        model=model,
-        messages=messages,
-        temperature=0.1
-    )    
 
-    return post_process_csv(response.choices[0].message.content)
+def openai_complete(messages):
+    prompt_text = openai_prompt(messages)
+    with admitted("OpenAI", messages), provider_call("OpenAI"):
+        response = get_openai_client().chat.completions.create(
+            model=config['OpenAI']['Model'],
+            messages=messages,
+            temperature=0.1,
+            **openai_cache_args(prompt_text)
+        )    
 
+    record_usage("OpenAI", response, prompt_text)
+    return response.choices[0].message.content
 
-def gemini_extract_text(file_blob, file_name, prompt_text):
-    import google.generativeai as genai
 
-    api_key = config['Gemini']['API_KEY']
-    model = config['Gemini']['Model']
-    genai.configure(api_key=api_key)
-     
-    model_instance = genai.GenerativeModel(model_name=model)
+def openai_extract_text(file_blob, file_name, prompt_text):
+    file_type = get_file_type(file_name)
+    if file_type == "image":
+        return post_process_csv(openai_complete(openai_image_messages(file_blob, file_type, prompt_text)))
+
+    text = extract_document_text(file_blob, file_name, file_type, full_text_len=max_document_len())
+    if len(text) == 0:
+        return TEXT_NOT_FOUND
     
+    # Documents over MAX_TEXT_LEN: send page-aligned chunks concurrently and merge
+    if len(text) > MAX_TEXT_LEN and is_chunking_enabled():
+        return map_reduce_text(text, lambda chunk: openai_complete(openai_text_messages(prompt_text, chunk)),
+                               post_process_csv)
+
+    return post_process_csv(openai_complete(openai_text_messages(prompt_text, text)))
+
+
+def openai_stream_text(file_blob, file_name, prompt_text):
+    messages = openai_build_messages(file_blob, file_name, prompt_text)
+    if messages is None:
+        yield TEXT_NOT_FOUND
+        return
+
+    prompt_text = openai_prompt(messages)
+    with admitted("OpenAI", messages):
+        stream = get_openai_client().chat.completions.create(
+            model=config['OpenAI']['Model'],
+            messages=messages,
+            temperature=0.1,
+            stream=True,
+            stream_options={"include_usage": True},
+            **openai_cache_args(prompt_text)
+        )
+        
+        # Yield raw chunks; the caller runs post_process_csv on the joined text.
+        # The last chunk carries only the usage.
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if getattr(chunk, "usage", None) is not None:
+                record_usage("OpenAI", chunk, prompt_text)
+
+
+def gemini_build_contents(file_blob, file_name, prompt_text):
+    """
+    Builds the Gemini request contents, or None if no text could be extracted.
+    """
     file_type = get_file_type(file_name)
     if file_type == "image":
         # For image files, send the image directly to Gemini
-        contents = [
-            prompt_text,
-            {"mime_type": f"image/{file_type.split('.')[-1]}", "data": file_blob}
+        return [
+            canonical_prompt(prompt_text),
+            {"mime_type": f"image/{file_type.split('.')[-1]}", "data": as_bytes(file_blob)}
         ]
-        
-        response = model_instance.generate_content(contents)
-        return post_process_csv(response.text)
     
     elif file_type == "pdf":
         # Gemini can handle PDFs directly
-        contents = [
-            prompt_text,
-            {"mime_type": "application/pdf", "data": file_blob}
+        return [
+            canonical_prompt(prompt_text),
+            {"mime_type": "application/pdf", "data": as_bytes(file_blob)}
         ]
-        
-        response = model_instance.generate_content(contents)
-        return post_process_csv(response.text)
     
-    else:
-        # For other file types, use the same approach as in openai_extract_text
-        text = handle_pdf_xls(file_blob, file_type)
-        
-        if text == OCR_TAG:
-            text = mistral_extract_text_ocr(file_blob, file_name)
-        elif len(text) == 0:
-            return "Text NOT FOUND in pdf/xlsx"
-        
-        contents = [f"{prompt_text}\n\nDocument content:\n{limit_text(text)}"]
-        
-        response = model_instance.generate_content(contents)
-        return post_process_csv(response.text)
+    # For other file types, use the same approach as in openai_extract_text
+    text = extract_document_text(file_blob, file_name, file_type)
+    if len(text) == 0:
+        return None
+    
+    return gemini_text_contents(prompt_text, text)
+
+
+def gemini_text_contents(prompt_text, text):
+    # [template, document]: gemini_request can swap the template for its cached content
+    return [canonical_prompt(prompt_text), document_part(text)]
+
+
+def gemini_complete(contents):
+    model, request = gemini_request(contents)
+    with admitted("Gemini", request), provider_call("Gemini"):
+        response = model.generate_content(request)
+    record_usage("Gemini", response, contents[0])
+    return response.text
+
+
+def gemini_extract_text(file_blob, file_name, prompt_text):
+    file_type = get_file_type(file_name)
+    if file_type in ["image", "pdf"]:
+        return post_process_csv(gemini_complete(gemini_build_contents(file_blob, file_name, prompt_text)))
+    
+    text = extract_document_text(file_blob, file_name, file_type, full_text_len=max_document_len())
+    if len(text) == 0:
+        return TEXT_NOT_FOUND
+    
+    # Documents over MAX_TEXT_LEN: send page-aligned chunks concurrently and merge
+    if len(text) > MAX_TEXT_LEN and is_chunking_enabled():
+        return map_reduce_text(text, lambda chunk: gemini_complete(gemini_text_contents(prompt_text, chunk)),
+                               post_process_csv)
+    
+    return post_process_csv(gemini_complete(gemini_text_contents(prompt_text, text)))
+
+
+def gemini_stream_text(file_blob, file_name, prompt_text):
+    contents = gemini_build_contents(file_blob, file_name, prompt_text)
+    if contents is None:
+        yield TEXT_NOT_FOUND
+        return
+    
+    # Yield raw chunks; the caller runs post_process_csv on the joined text
+    model, request = gemini_request(contents)
+    chunk = None
+    with admitted("Gemini", request):
+        for chunk in model.generate_content(request, stream=True):
+            if chunk.parts:
+                yield chunk.text
+    # The last chunk carries the usage of the whole response
+    record_usage("Gemini", chunk, contents[0])
+
+
+def provider_extract_text(provider, file_blob, file_name, prompt_text):
+    # One provider's call: provider is "OpenAI", "Mistral" or (anything else) Gemini
+    if provider == "OpenAI":
+        return openai_extract_text(file_blob, file_name, prompt_text)
+    elif provider == "Mistral":
+        return mistral_extract_text(file_blob, file_name, prompt_text)
+    return gemini_extract_text(file_blob, file_name, prompt_text)
+
+
+def get_model_version(model):
+    # Provider sections in config.ini are named after the model, e.g. [Gemini]
+    if is_routed(model):
+        # Any of the routed providers may answer
+        return "|".join(get_model_version(provider) for provider in provider_router.providers)
+    if model not in ("OpenAI", "Mistral"):
+        model = "Gemini"
+    return config[model]['Model']
+
+
+def handle_eml(file_blob, file_name):
+    # If it's an email file (.eml), extract its content
+    if not file_name.lower().endswith('.eml'):
+        return file_blob
+
+    try:
+        # Use the extract_email_chain function to get readable text
+        extracted_text = extract_email_chain(file_blob)
+        return extracted_text.encode('utf-8') if isinstance(extracted_text, str) else extracted_text
+    except Exception as email_err:
+        # Log the error but continue with the original content if extraction fails
+        print(f"Email extraction error: {str(email_err)}")
+
+    return file_blob
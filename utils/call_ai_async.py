@@ -0,0 +1,334 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.config import config
+from utils.chunking import map_reduce_text_async
+from utils.eml_extractor import extract_email_chain
+from utils.ai_clients import get_async_openai_client, get_async_mistral_client
+from utils.metrics import stage_timer, provider_call, count_ocr_fallback, count_ocr_pages
+from utils.pdf_extract import split_pdf_pages, pending_ocr_pages, splice_ocr_pages
+from utils.uploads import upload_source
+from utils.router import provider_router, is_routed
+from utils.admission import admitted_async
+from utils.prompt_cache import canonical_prompt, openai_cache_args, record_usage, gemini_request
+import utils.call_ai as ai
+
+# Parsing pool shared by all requests in this worker, created on first use
+_cpu_pool = None
+_cpu_pool_pid = None
+_cpu_pool_lock = threading.Lock()
+
+
+def get_cpu_pool():
+    global _cpu_pool, _cpu_pool_pid
+    with _cpu_pool_lock:
+        if _cpu_pool is None or _cpu_pool_pid != os.getpid():
+            # forkserver: never fork a process with a running event loop
+            context = multiprocessing.get_context("forkserver")
+            _cpu_pool = ProcessPoolExecutor(max_workers=config['ASGI'].getint('CpuWorkers', 4), mp_context=context)
+            _cpu_pool_pid = os.getpid()
+    return _cpu_pool
+
+
+async def run_cpu(fn, *args):
+    # fn and args must be picklable: module-level functions and bytes/str
+    return await asyncio.get_running_loop().run_in_executor(get_cpu_pool(), fn, *args)
+
+
+async def handle_eml_async(file_blob, file_name):
+    # Same contract as utils.call_ai.handle_eml, with the MIME parsing off the event loop
+    if not file_name.lower().endswith('.eml'):
+        return file_blob
+
+    try:
+        extracted_text = await run_cpu(extract_email_chain, file_blob)
+        return extracted_text.encode('utf-8') if isinstance(extracted_text, str) else extracted_text
+    except Exception as email_err:
+        print(f"Email extraction error: {str(email_err)}")
+
+    return file_blob
+
+
+async def mistral_upload(client, file_blob, file_name, purpose):
+    with upload_source(file_blob) as content:
+        uploaded_file = await client.files.upload_async(
+            file={"file_name": file_name, "content": content},
+            purpose=purpose
+        )
+    signed_url = await client.files.get_signed_url_async(file_id=uploaded_file.id, expiry=1)
+    return signed_url.url
+
+
+async def mistral_build_messages_async(client, file_blob, file_name, prompt_text):
+    if ai.get_file_type(file_name) in ['text', 'unknown']:
+        if not isinstance(file_blob, str):
+            file_blob = str(file_blob, 'utf-8')
+
+    document_url = await mistral_upload(client, file_blob, file_name, "batch")
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": canonical_prompt(prompt_text)},
+                {"type": "document_url", "document_url": document_url}
+            ]
+        }
+    ]
+
+
+async def mistral_extract_text_async(file_blob, file_name, prompt_text):
+    client = get_async_mistral_client()
+    messages = await mistral_build_messages_async(client, file_blob, file_name, prompt_text)
+
+    async with admitted_async("Mistral", messages):
+        with provider_call("Mistral"):
+            chat_response = await client.chat.complete_async(
+                model=config['Mistral']['Model'],
+                messages=messages
+            )
+
+    return ai.post_process_csv(chat_response.choices[0].message.content)
+
+
+async def mistral_stream_text_async(file_blob, file_name, prompt_text):
+    client = get_async_mistral_client()
+    messages = await mistral_build_messages_async(client, file_blob, file_name, prompt_text)
+
+    async with admitted_async("Mistral", messages):
+        stream = await client.chat.stream_async(model=config['Mistral']['Model'], messages=messages)
+        async for event in stream:
+            if event.data.choices and event.data.choices[0].delta.content:
+                yield event.data.choices[0].delta.content
+
+
+async def mistral_ocr_pages_async(file_blob, file_name):
+    client = get_async_mistral_client()
+    document_url = await mistral_upload(client, file_blob, file_name, "ocr")
+
+    document = {"type": "document_url", "document_url": document_url}
+    async with admitted_async("MistralOCR", document):
+        with provider_call("MistralOCR"):
+            ocr_response = await client.ocr.process_async(model="mistral-ocr-latest", document=document)
+
+    return [page.markdown for page in ocr_response.pages]
+
+
+async def mistral_extract_text_ocr_async(file_blob, file_name):
+    page_texts = await mistral_ocr_pages_async(file_blob, file_name)
+    count_ocr_pages("document", len(page_texts))
+    return "\n\n".join(page_texts)
+
+
+async def mistral_ocr_selected_pages_async(file_blob, file_name, page_indexes):
+    with stage_timer("page_ocr"):
+        pages_blob = await run_cpu(split_pdf_pages, file_blob, page_indexes)
+        page_texts = await mistral_ocr_pages_async(pages_blob, ai.ocr_file_name(file_name, page_indexes))
+    count_ocr_pages("pages", len(page_indexes))
+    return page_texts
+
+
+async def ocr_pending_pages_async(text, file_blob, file_name):
+    """
+    OCRs the pages that extraction left as OCR_PENDING, one request per
+    [PDF] OcrPagesPerRequest pages, all at once, and puts them in place.
+    """
+    page_indexes = pending_ocr_pages(text)
+    per_request = max(1, config['PDF'].getint('OcrPagesPerRequest', 8))
+    batches = [page_indexes[i:i + per_request] for i in range(0, len(page_indexes), per_request)]
+    results = await asyncio.gather(*(mistral_ocr_selected_pages_async(file_blob, file_name, batch)
+                                     for batch in batches), return_exceptions=True)
+
+    ocr_texts = {}
+    for batch, page_texts in zip(batches, results):
+        if isinstance(page_texts, BaseException):
+            print(f"Page OCR failed: {page_texts}")
+            continue
+        ocr_texts.update(zip(batch, page_texts))
+    return splice_ocr_pages(text, ocr_texts)
+
+
+async def extract_document_text_async(file_blob, file_name, file_type, max_text_len=ai.MAX_TEXT_LEN,
+                                      full_text_len=None):
+    # Async extract_document_text: PDF/Excel parsing runs in the CPU pool, and the
+    # scanned pages of a mostly digital PDF are OCRed afterwards (after a second
+    # read, if any), concurrently
+    async def read(text_len):
+        if file_type in ("pdf", "excel"):
+            text = await run_cpu(ai.handle_pdf_xls, file_blob, file_type, text_len, None, True)
+        else:
+            text = ai.handle_pdf_xls(file_blob, file_type, text_len)
+        if text != ai.OCR_TAG and not isinstance(text, str):
+            text = str(text[:text_len * 4], 'utf-8', errors='replace')[:text_len]
+        return text
+
+    with stage_timer("extract"):
+        text = await read(max_text_len + ai.CUTOFF_MARGIN if full_text_len else max_text_len)
+        if full_text_len and text != ai.OCR_TAG and len(text) > max_text_len:
+            text = await read(full_text_len)
+        if file_type == "pdf" and text != ai.OCR_TAG:
+            text = await ocr_pending_pages_async(text, file_blob, file_name)
+
+    if text == ai.OCR_TAG:
+        count_ocr_fallback()
+        with stage_timer("ocr_fallback"):
+            text = await mistral_extract_text_ocr_async(file_blob, file_name)
+
+    return text
+
+
+async def openai_build_messages_async(file_blob, file_name, prompt_text):
+    file_type = ai.get_file_type(file_name)
+    if file_type == "image":
+        # base64 of the whole image: off the event loop
+        return await asyncio.to_thread(ai.openai_image_messages, file_blob, file_type, prompt_text)
+
+    text = await extract_document_text_async(file_blob, file_name, file_type)
+    if len(text) == 0:
+        return None
+
+    return ai.openai_text_messages(prompt_text, text)
+
+
+async def openai_complete_async(messages):
+    prompt_text = ai.openai_prompt(messages)
+    async with admitted_async("OpenAI", messages):
+        with provider_call("OpenAI"):
+            response = await get_async_openai_client().chat.completions.create(
+                model=config['OpenAI']['Model'],
+                messages=messages,
+                temperature=0.1,
+                **openai_cache_args(prompt_text)
+            )
+
+    record_usage("OpenAI", response, prompt_text)
+    return response.choices[0].message.content
+
+
+async def openai_extract_text_async(file_blob, file_name, prompt_text):
+    file_type = ai.get_file_type(file_name)
+    if file_type == "image":
+        messages = await asyncio.to_thread(ai.openai_image_messages, file_blob, file_type, prompt_text)
+        return ai.post_process_csv(await openai_complete_async(messages))
+
+    text = await extract_document_text_async(file_blob, file_name, file_type,
+                                            full_text_len=ai.max_document_len())
+    if len(text) == 0:
+        return ai.TEXT_NOT_FOUND
+
+    if len(text) > ai.MAX_TEXT_LEN and ai.is_chunking_enabled():
+        return await map_reduce_text_async(
+            text, lambda chunk: openai_complete_async(ai.openai_text_messages(prompt_text, chunk)),
+            ai.post_process_csv)
+
+    return ai.post_process_csv(await openai_complete_async(ai.openai_text_messages(prompt_text, text)))
+
+
+async def openai_stream_text_async(file_blob, file_name, prompt_text):
+    messages = await openai_build_messages_async(file_blob, file_name, prompt_text)
+    if messages is None:
+        yield ai.TEXT_NOT_FOUND
+        return
+
+    prompt_text = ai.openai_prompt(messages)
+    async with admitted_async("OpenAI", messages):
+        stream = await get_async_openai_client().chat.completions.create(
+            model=config['OpenAI']['Model'],
+            messages=messages,
+            temperature=0.1,
+            stream=True,
+            stream_options={"include_usage": True},
+            **openai_cache_args(prompt_text)
+        )
+
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if getattr(chunk, "usage", None) is not None:
+                record_usage("OpenAI", chunk, prompt_text)
+
+
+async def gemini_build_contents_async(file_blob, file_name, prompt_text):
+    file_type = ai.get_file_type(file_name)
+    if file_type in ["image", "pdf"]:
+        # Sent to Gemini inline: copying a spooled upload into bytes blocks, so off the event loop
+        return await asyncio.to_thread(ai.gemini_build_contents, file_blob, file_name, prompt_text)
+
+    text = await extract_document_text_async(file_blob, file_name, file_type)
+    if len(text) == 0:
+        return None
+
+    return ai.gemini_text_contents(prompt_text, text)
+
+
+async def gemini_complete_async(contents):
+    # Creating or refreshing the template's cached content is a blocking call
+    model, request = await asyncio.to_thread(gemini_request, contents)
+    async with admitted_async("Gemini", request):
+        with provider_call("Gemini"):
+            response = await model.generate_content_async(request)
+    record_usage("Gemini", response, contents[0])
+    return response.text
+
+
+async def gemini_extract_text_async(file_blob, file_name, prompt_text):
+    file_type = ai.get_file_type(file_name)
+    if file_type in ["image", "pdf"]:
+        contents = await asyncio.to_thread(ai.gemini_build_contents, file_blob, file_name, prompt_text)
+        return ai.post_process_csv(await gemini_complete_async(contents))
+
+    text = await extract_document_text_async(file_blob, file_name, file_type,
+                                            full_text_len=ai.max_document_len())
+    if len(text) == 0:
+        return ai.TEXT_NOT_FOUND
+
+    if len(text) > ai.MAX_TEXT_LEN and ai.is_chunking_enabled():
+        return await map_reduce_text_async(
+            text, lambda chunk: gemini_complete_async(ai.gemini_text_contents(prompt_text, chunk)),
+            ai.post_process_csv)
+
+    return ai.post_process_csv(await gemini_complete_async(ai.gemini_text_contents(prompt_text, text)))
+
+
+async def gemini_stream_text_async(file_blob, file_name, prompt_text):
+    contents = await gemini_build_contents_async(file_blob, file_name, prompt_text)
+    if contents is None:
+        yield ai.TEXT_NOT_FOUND
+        return
+
+    model, request = await asyncio.to_thread(gemini_request, contents)
+    chunk = None
+    async with admitted_async("Gemini", request):
+        response = await model.generate_content_async(request, stream=True)
+        async for chunk in response:
+            if chunk.parts:
+                yield chunk.text
+    record_usage("Gemini", chunk, contents[0])
+
+
+async def call_ai_async(model, file_blob, file_name, prompt_text):
+    # Async counterpart of api.app.call_ai
+    if is_routed(model):
+        return await provider_router.route_async(
+            lambda provider: call_ai_async(provider, file_blob, file_name, prompt_text))
+    elif model == "OpenAI":
+        return await openai_extract_text_async(file_blob, file_name, prompt_text)
+    elif model == "Mistral":
+        return await mistral_extract_text_async(file_blob, file_name, prompt_text)
+    else:
+        return await gemini_extract_text_async(file_blob, file_name, prompt_text)
+
+
+def stream_ai_async(model, file_blob, file_name, prompt_text):
+    # Async counterpart of api.app.stream_ai: an async generator of raw chunks
+    if is_routed(model):
+        return provider_router.route_stream_async(
+            lambda provider: stream_ai_async(provider, file_blob, file_name, prompt_text))
+    elif model == "OpenAI":
+        return openai_stream_text_async(file_blob, file_name, prompt_text)
+    elif model == "Mistral":
+        return mistral_stream_text_async(file_blob, file_name, prompt_text)
+    else:
+        return gemini_stream_text_async(file_blob, file_name, prompt_text)
@@ -0,0 +1,169 @@
+import asyncio
+import contextvars
+import csv
+import io
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.config import config
+
+# Page markers written by handle_pdf_xls, e.g. "--- Page 12 ---" or "--- Sheet: Claims ---"
+PAGE_BOUNDARY_PATTERN = re.compile(r'\n\n(?=--- (?:Page \d+|Sheet: .*) ---\n)')
+
+
+def split_text_chunks(text, chunk_len):
+    """
+    Splits extracted document text into chunks of at most chunk_len characters,
+    breaking on page boundaries. A single page longer than chunk_len is split on
+    line boundaries instead.
+
+    Args:
+        text (str): Text with "--- Page N ---" markers
+        chunk_len (int): Maximum characters per chunk
+
+    Returns:
+        list: List of chunk strings, in document order
+    """
+    pages = PAGE_BOUNDARY_PATTERN.split(text)
+
+    pieces = []
+    for page in pages:
+        if len(page) <= chunk_len:
+            pieces.append(page)
+            continue
+
+        # Oversized page: fall back to lines (and hard cuts for giant lines)
+        current = ""
+        for line in page.splitlines(keepends=True):
+            while len(line) > chunk_len:
+                pieces.append(line[:chunk_len])
+                line = line[chunk_len:]
+            if len(current) + len(line) > chunk_len:
+                pieces.append(current)
+                current = ""
+            current += line
+        if current:
+            pieces.append(current)
+
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 2 > chunk_len:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+
+    return chunks
+
+
+def parse_csv_rows(csv_text):
+    return [row for row in csv.reader(io.StringIO(csv_text.strip())) if any(cell.strip() for cell in row)]
+
+
+def normalize_header(row):
+    return [cell.strip().lower() for cell in row]
+
+
+def merge_csv_outputs(csv_texts):
+    """
+    Merges partial CSV tables (one per chunk) into a single table with a single
+    header row.
+
+    Args:
+        csv_texts (list): Post-processed CSV strings, in document order
+
+    Returns:
+        str: The merged CSV
+
+    Raises:
+        ValueError: If a chunk's header or any of its rows (short or long) does not match
+                    the first header's column count
+    """
+    header = None
+    merged_rows = []
+
+    for chunk_index, csv_text in enumerate(csv_texts):
+        rows = parse_csv_rows(csv_text)
+        if not rows:
+            continue
+
+        if header is None:
+            header = rows[0]
+            rows = rows[1:]
+        elif normalize_header(rows[0]) == normalize_header(header):
+            rows = rows[1:]
+        elif len(rows[0]) != len(header):
+            raise ValueError(f"Chunk {chunk_index+1} has {len(rows[0])} columns, expected {len(header)}")
+
+        for row in rows:
+            # A short row lost cells anywhere, not just at the end: padding would misalign its columns
+            if len(row) != len(header):
+                raise ValueError(f"Chunk {chunk_index+1} has a row with {len(row)} cells, expected {len(header)}")
+            merged_rows.append(row)
+
+    if header is None:
+        return ""
+
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\n')
+    writer.writerow(header)
+    writer.writerows(merged_rows)
+    return output.getvalue().rstrip('\n')
+
+
+def map_reduce_text(text, complete_fn, post_process_fn, chunk_len=None, max_concurrent=None):
+    """
+    Sends a document that is too large for one call as page-aligned chunks,
+    concurrently, and merges the outputs.
+
+    Args:
+        text (str): Extracted document text
+        complete_fn (callable): complete_fn(chunk_text) -> raw model output
+        post_process_fn (callable): e.g. post_process_csv
+        chunk_len (int): Maximum characters per chunk (defaults to [Chunking] ChunkLen)
+        max_concurrent (int): Concurrent model calls (defaults to [Chunking] MaxConcurrent)
+
+    Returns:
+        str: Merged, post-processed output
+    """
+    chunk_config = config['Chunking']
+    chunk_len = chunk_len or chunk_config.getint('ChunkLen', 50000)
+    max_concurrent = max_concurrent or chunk_config.getint('MaxConcurrent', 4)
+
+    chunks = split_text_chunks(text, chunk_len)
+    with ThreadPoolExecutor(max_workers=min(max_concurrent, len(chunks))) as executor:
+        # Run each chunk in a copy of the caller's context so metric labels carry over
+        futures = [executor.submit(contextvars.copy_context().run, complete_fn, chunk) for chunk in chunks]
+        raw_outputs = [future.result() for future in futures]
+
+    return reduce_outputs(raw_outputs, post_process_fn)
+
+
+async def map_reduce_text_async(text, complete_fn, post_process_fn, chunk_len=None, max_concurrent=None):
+    """
+    Async form of map_reduce_text: complete_fn is a coroutine function and the
+    chunks are awaited concurrently on the event loop.
+    """
+    chunk_config = config['Chunking']
+    chunk_len = chunk_len or chunk_config.getint('ChunkLen', 50000)
+    semaphore = asyncio.Semaphore(max_concurrent or chunk_config.getint('MaxConcurrent', 4))
+
+    async def complete(chunk):
+        async with semaphore:
+            return await complete_fn(chunk)
+
+    raw_outputs = await asyncio.gather(*(complete(chunk) for chunk in split_text_chunks(text, chunk_len)))
+    return reduce_outputs(raw_outputs, post_process_fn)
+
+
+def reduce_outputs(raw_outputs, post_process_fn):
+    outputs = [post_process_fn(raw) for raw in raw_outputs]
+
+    # '^^' separated output means the prompt asked for a table: merge into one CSV
+    if all("^^" in raw for raw in raw_outputs if raw.strip()):
+        return merge_csv_outputs(outputs)
+
+    return "\n\n".join(output.strip() for output in outputs if output.strip())
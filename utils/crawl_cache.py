@@ -0,0 +1,137 @@
+import fcntl
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from utils.config import config
+
+
+class CrawlCache:
+    """
+    Scraped page text stored zlib-compressed in SQLite, shared by all gunicorn
+    workers. Writes are single transactions (atomic), entries are evicted least
+    recently used once the store exceeds max_bytes, and a file lock per URL
+    (hashed into lock_stripes lock files) gives single-flight fetching across
+    processes.
+    """
+    def __init__(self, cache_dir, max_bytes=256 << 20, lock_stripes=256):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock_stripes = lock_stripes
+        self.db_path = os.path.join(cache_dir, "crawler.db")
+        self.lock_dir = os.path.join(cache_dir, "locks")
+        self._local = threading.local()
+
+        os.makedirs(self.lock_dir, exist_ok=True)
+        self._remove_url_locks()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    url TEXT PRIMARY KEY,
+                    body BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at)")
+
+    def _connect(self):
+        # One connection per thread (and per process: reconnect after fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return _Transaction(conn)
+
+    def get(self, url):
+        """
+        Returns:
+            tuple: (text, fetched_at) or (None, None) if not cached
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT body, fetched_at FROM pages WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None, None
+            conn.execute("UPDATE pages SET accessed_at = ? WHERE url = ?", (time.time(), url))
+
+        return zlib.decompress(row[0]).decode('utf-8'), row[1]
+
+    def put(self, url, text):
+        body = zlib.compress(text.encode('utf-8'), 6)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO pages (url, body, size, fetched_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                         (url, body, len(body), now, now))
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total_bytes <= self.max_bytes:
+            return
+
+        for url, size in conn.execute("SELECT url, size FROM pages ORDER BY accessed_at").fetchall():
+            if total_bytes <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+            total_bytes -= size
+
+    def _remove_url_locks(self):
+        # Older versions left one <sha1>.lock file per URL ever fetched
+        for name in os.listdir(self.lock_dir):
+            if name.endswith(".lock") and len(name) == 45:
+                try:
+                    os.remove(os.path.join(self.lock_dir, name))
+                except OSError:
+                    pass
+
+    @contextmanager
+    def lock(self, url, blocking=True):
+        """
+        Cross-process lock for one URL. Yields True if acquired; with
+        blocking=False yields False right away when another process holds it.
+        URLs share lock_stripes lock files, so an unrelated URL on the same
+        stripe can make a caller wait (or skip, with blocking=False).
+        """
+        stripe = int(hashlib.sha1(url.encode('utf-8')).hexdigest(), 16) % self.lock_stripes
+        lock_path = os.path.join(self.lock_dir, f"{stripe}.lock")
+        with open(lock_path, "a") as lock_file:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(lock_file, flags)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class _Transaction:
+    # BEGIN IMMEDIATE ... COMMIT/ROLLBACK around a block, on an autocommit connection
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+def create_crawl_cache():
+    return CrawlCache(config['UI']['CrawlerDir'],
+                      max_bytes=config['Crawler'].getint('MaxCacheMB', 256) << 20)
+
+
+# Crawler cache (one connection per thread, sharing the database file)
+crawl_cache = create_crawl_cache()
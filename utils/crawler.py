@@ -0,0 +1,261 @@
+import asyncio
+import random
+import re
+import time
+from urllib.parse import urljoin, urldefrag, urlsplit, urlunsplit
+
+import httpx
+
+from utils.config import config
+from utils.crawl_cache import crawl_cache
+from utils.http_session import http_stats, DEFAULT_RETRY_STATUSES
+from utils.metrics import observe_crawl_pages
+from utils.scraper import normalize_url, page_key
+
+# Links that are never pages worth summarizing
+SKIP_EXTENSIONS = re.compile(r"\.(pdf|jpe?g|png|gif|svg|webp|ico|css|js|json|xml|zip|gz|mp4|mp3|docx?|xlsx?|pptx?)$",
+                             re.IGNORECASE)
+SHINGLE_WORDS = 5
+
+
+def scraper_setting(key, default):
+    # [HTTP:scraper] falling back to [HTTP], as for the scraper's pooled session
+    for name in ("HTTP:scraper", "HTTP"):
+        if name in config.config and key in config[name]:
+            return config[name][key]
+    return default
+
+
+def extract_page(html_content, page_url):
+    """
+    Parses a page once for its text and the absolute http(s) links on it.
+
+    Returns:
+        tuple: (text, links)
+    """
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html_content, 'html.parser')
+    links = []
+    for anchor in soup.find_all('a', href=True):
+        link = urldefrag(urljoin(page_url, anchor['href'].strip()))[0]
+        if link.startswith(('http://', 'https://')):
+            links.append(link)
+    return soup.get_text(separator=' ', strip=True), links
+
+
+def site_host(url):
+    # "www.example.com" and "example.com" are the same site
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def canonical_url(url):
+    # The spelling of a linked page that is fetched: no query string or fragment, so the
+    # many spellings of one page are fetched once
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path or '/', '', ''))
+
+
+def shingles(text):
+    # Hashed 5-word windows: two pages are near-identical when most of their windows match
+    words = text.lower().split()
+    if len(words) <= SHINGLE_WORDS:
+        return {hash(" ".join(words))}
+    return {hash(" ".join(words[i:i + SHINGLE_WORDS])) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def is_near_duplicate(page_shingles, seen_shingles, threshold):
+    for other in seen_shingles:
+        overlap = len(page_shingles & other) / max(1, len(page_shingles | other))
+        if overlap >= threshold:
+            return True
+    return False
+
+
+def rank_links(links, priority_words):
+    # About/product/service pages first (they are what a summary needs), then shallow paths
+    def sort_key(link):
+        path = urlsplit(link).path.lower()
+        return (not any(word in path for word in priority_words), path.count('/'))
+    return sorted(links, key=sort_key)
+
+
+class SiteCrawler:
+    """
+    Crawls one site with asyncio, starting from a URL and following
+    same-site links breadth first: at most max_pages fetches, max_depth links
+    away from the start, with per_host fetches in flight per host. URLs are
+    deduplicated (fragment, query string and trailing slash ignored) and pages
+    whose text nearly repeats an earlier page's are dropped.
+
+    Pages are read from and written to the crawler cache (text under the page
+    key, its links under "links:<key>"), so single-page /summary calls and
+    later crawls reuse them while they are fresh.
+    """
+    def __init__(self, max_pages=8, max_depth=2, per_host=4, fetch="ScrapingFish", min_chars=200,
+                 duplicate_similarity=0.9, priority_words=(), fresh_seconds=7 * 86400):
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.per_host = per_host
+        self.fetch = fetch
+        self.min_chars = min_chars
+        self.duplicate_similarity = duplicate_similarity
+        self.priority_words = priority_words
+        self.fresh_seconds = fresh_seconds
+
+    def fetch_url(self, target_url):
+        if self.fetch.lower() == "direct":
+            return target_url
+        settings = config["ScrapingFish"]
+        return settings["API_URL"].format(api_key=settings["API_KEY"], target_url=target_url)
+
+    async def fetch_html(self, client, target_url):
+        """
+        GETs a page (through ScrapingFish unless [Crawler] Fetch=direct),
+        retrying throttling and gateway errors with jittered backoff like the
+        pooled sessions do.
+
+        Returns:
+            tuple: (status_code, html)
+        """
+        retries = int(scraper_setting('Retries', 3))
+        backoff = float(scraper_setting('BackoffSeconds', 0.5))
+        statuses = {int(status) for status in scraper_setting('RetryStatuses', DEFAULT_RETRY_STATUSES).split('|')}
+
+        start = time.perf_counter()
+        response, attempt = None, 0
+        try:
+            while True:
+                response = await client.get(self.fetch_url(target_url))
+                if response.status_code not in statuses or attempt >= retries:
+                    return response.status_code, response.text
+                attempt += 1
+                await asyncio.sleep(random.uniform(0, backoff * 2 ** attempt))
+        finally:
+            http_stats.record("crawler", (time.perf_counter() - start) * 1000, attempt,
+                              response is None or response.status_code >= 500)
+
+    async def load_page(self, client, semaphore, url):
+        """
+        Returns:
+            tuple: (status_code, text, links), from the cache when fresh
+        """
+        key = page_key(url)
+        (text, fetched_at), (links, _) = await asyncio.gather(asyncio.to_thread(crawl_cache.get, key),
+                                                              asyncio.to_thread(crawl_cache.get, f"links:{key}"))
+        if text is not None and links is not None and time.time() - fetched_at < self.fresh_seconds:
+            return 200, text, links.split("\n") if links else []
+
+        async with semaphore:
+            status_code, html = await self.fetch_html(client, url)
+        if status_code != 200:
+            return status_code, f"Failed to read specified page (Error: {status_code})", []
+
+        # Parsing is CPU work: keep it off the event loop
+        text, links = await asyncio.to_thread(extract_page, html, url)
+        if "enable JavaScript" in text:
+            return 500, "You need to enable JavaScript to run this app.", []
+
+        await asyncio.to_thread(crawl_cache.put, key, text)
+        await asyncio.to_thread(crawl_cache.put, f"links:{key}", "\n".join(links))
+        return 200, text, links
+
+    async def crawl(self, url):
+        """
+        Returns:
+            tuple: (status_code, pages) where pages is a list of (page key, text)
+                   in discovery order; if the start page failed, its status
+                   code and error text
+        """
+        start_url = normalize_url(url)[1]
+        host = site_host(start_url)
+        semaphores = {}
+        # The start page is keyed as site_scraper keys it (query string included)
+        seen = {page_key(start_url), page_key(canonical_url(start_url))}
+        results = {}  # order scheduled -> (key, depth, status_code, text, links)
+
+        async def visit(order, page_url, depth):
+            page_host = urlsplit(page_url).hostname
+            semaphore = semaphores.setdefault(page_host, asyncio.Semaphore(self.per_host))
+            try:
+                results[order] = (page_key(page_url), depth, *await self.load_page(client, semaphore, page_url))
+            except Exception as e:
+                print(f"Crawl of {page_url} failed: {str(e)}")
+                results[order] = (page_key(page_url), depth, 500, str(e), [])
+            return order
+
+        timeout = httpx.Timeout(float(scraper_setting('ReadTimeoutSeconds', 60)),
+                                connect=float(scraper_setting('ConnectTimeoutSeconds', 5)))
+        async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
+            tasks = {asyncio.create_task(visit(0, start_url, 0))}
+            scheduled = 1
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    key, depth, status_code, text, links = results[task.result()]
+                    if status_code != 200 or depth >= self.max_depth:
+                        continue
+                    for link in rank_links(links, self.priority_words):
+                        if scheduled >= self.max_pages:
+                            break
+                        link_key = page_key(canonical_url(link))
+                        if link_key in seen or site_host(link) != host or SKIP_EXTENSIONS.search(urlsplit(link).path):
+                            continue
+                        seen.add(link_key)
+                        tasks.add(asyncio.create_task(visit(scheduled, canonical_url(link), depth + 1)))
+                        scheduled += 1
+
+        start_status, start_text = results[0][2], results[0][3]
+        if start_status != 200:
+            return start_status, start_text
+
+        pages, seen_shingles = [], []
+        for order in sorted(results):
+            key, _, status_code, text, _ = results[order]
+            if status_code != 200 or (order > 0 and len(text) < self.min_chars):
+                continue
+            page_shingles = shingles(text)
+            if is_near_duplicate(page_shingles, seen_shingles, self.duplicate_similarity):
+                continue
+            seen_shingles.append(page_shingles)
+            pages.append((key, text))
+        return 200, pages
+
+
+def combine_pages(pages):
+    # One document for the summary prompt, each page under its own header
+    return "\n\n".join(f"--- Page: {key} ---\n{text}" for key, text in pages)
+
+
+def create_site_crawler():
+    settings = config['Crawler']
+    return SiteCrawler(max_pages=settings.getint('MaxPages', 8),
+                       max_depth=settings.getint('MaxDepth', 2),
+                       per_host=settings.getint('PerHostConcurrency', 4),
+                       fetch=settings.get('Fetch', 'ScrapingFish'),
+                       min_chars=settings.getint('MinPageChars', 200),
+                       duplicate_similarity=settings.getfloat('DuplicateSimilarity', 0.9),
+                       priority_words=tuple(w for w in settings.get('PriorityPaths', '').split('|') if w),
+                       fresh_seconds=settings.getfloat('FreshDays', 7) * 86400)
+
+
+site_crawler = create_site_crawler()
+
+
+async def crawl_site_async(url):
+    """
+    Crawls url's site (see SiteCrawler) into one text for /summary.
+
+    Returns:
+        tuple: (return_code, text, file_name), like site_scraper
+    """
+    status_code, pages = await site_crawler.crawl(url)
+    if status_code != 200:
+        return status_code, pages, "bad.com"
+    observe_crawl_pages(len(pages))
+    return 200, combine_pages(pages), normalize_url(url)[0]
+
+
+def crawl_site(url):
+    # For the WSGI app, the job worker and the frontend: runs the crawl on its own event loop
+    return asyncio.run(crawl_site_async(url))
@@ -1,6 +1,6 @@
 import email
 from email import policy
-from email.parser import BytesParser, Parser
+from email.parser import BytesParser, BytesHeaderParser, Parser
 import html2text
 import io
 from bs4 import BeautifulSoup
@@ -9,6 +9,50 @@ from datetime import datetime
 from email.utils import parsedate_to_datetime
 # import pytz
 from dateutil import parser as date_parser
+import hashlib
+
+from utils.config import config
+from utils.metrics import count_email_dedup
+
+# Quote markers at the start of a line: "> ", "> > ", ">>"
+QUOTE_PREFIX_PATTERN = re.compile(r'^(?:[ \t]*>)+[ \t]?')
+# Outlook/forward separators carry no content (the From:/Sent: lines after them are kept)
+SEPARATOR_PATTERN = re.compile(r'^\s*(?:-{2,}\s*(?:Original Message|Forwarded message)\s*-{2,}|_{10,})\s*$',
+                               re.IGNORECASE)
+# Attribution lines such as "On Mon, 4 Mar 2024 at 10:00, Bob <bob@x.com> wrote:"
+ATTRIBUTION_PATTERN = re.compile(r'^On\b.{0,300}\bwrote:$', re.DOTALL)
+HEADER_LINE_PATTERN = re.compile(r'^(?:From|Sent|Date|To|Cc|Bcc|Subject):', re.IGNORECASE)
+# Compared without whitespace/markdown emphasis and without <addresses>, which html2text drops
+NORMALIZE_PATTERN = re.compile(r'(?:<[^<>\s]+>|[\s*_])+')
+
+# clean_text steps, compiled once: (pattern, replacement)
+CLEAN_TEXT_STEPS = [
+    # 1. Remove <https://...> links
+    (re.compile(r'<https?://[^>]+>'), ''),
+    # 2. Clean up square brackets with links [text](url)
+    (re.compile(r'\[([^\]]+)\]\([^)]+\)'), r'\1'),
+    # 3. Remove any remaining URLs
+    (re.compile(r'https?://\S+'), ''),
+    # 4. Clean up excessive whitespace
+    (re.compile(r'\n{3,}'), '\n\n'),
+    (re.compile(r' {2,}'), ' '),
+    # 5. Remove empty lines consisting only of whitespace
+    (re.compile(r'^\s*$\n', re.MULTILINE), ''),
+]
+
+# Options for every HTML part
+HTML2TEXT_OPTIONS = {
+    "ignore_links": False,  # Still process links but we'll clean them later
+    "ignore_images": True,
+    "ignore_tables": False,
+    "unicode_snob": True,
+}
+
+# End of a header block: the first empty line
+HEADER_END_PATTERN = re.compile(rb'\r?\n\r?\n')
+
+_parser = BytesParser(policy=policy.default)
+_header_parser = BytesHeaderParser(policy=policy.default)
 
 def clean_text(text):
     """
@@ -20,21 +64,8 @@ def clean_text(text):
     Returns:
         str: The cleaned text
     """
-    # 1. Remove <https://...> links
-    text = re.sub(r'<https?://[^>]+>', '', text)
-    
-    # 2. Clean up square brackets with links [text](url)
-    text = re.sub(r'\[([^\]]+)\]\([^)]+\)', r'\1', text)
-    
-    # 3. Remove any remaining URLs
-    text = re.sub(r'https?://\S+', '', text)
-    
-    # 4. Clean up excessive whitespace
-    text = re.sub(r'\n{3,}', '\n\n', text)
-    text = re.sub(r' {2,}', ' ', text)
-    
-    # 5. Remove empty lines consisting only of whitespace
-    text = re.sub(r'^\s*$\n', '', text, flags=re.MULTILINE)
+    for pattern, replacement in CLEAN_TEXT_STEPS:
+        text = pattern.sub(replacement, text)
     
     return text
 
@@ -90,6 +121,14 @@ def extract_email_headers(msg):
     headers.append(f"Subject:\t{msg.get('Subject', '')}")
     return headers
 
+def html_to_text(html_content):
+    # A fresh converter per part (~10 us): HTML2Text carries open lists/blockquotes
+    # over from one handle() call to the next, so one instance cannot be shared
+    converter = html2text.HTML2Text()
+    for name, value in HTML2TEXT_OPTIONS.items():
+        setattr(converter, name, value)
+    return converter.handle(html_content)
+
 def extract_email_body(msg):
     """
     Extract the body content from an email message
@@ -116,28 +155,180 @@ def extract_email_body(msg):
         elif content_type == 'text/plain':
             extracted_text.append(part.get_content())
         elif content_type == 'text/html':
-            html_content = part.get_content()
-            
-            # Use html2text for HTML parsing
-            h = html2text.HTML2Text()
-            h.ignore_links = False  # Still process links but we'll clean them later
-            h.ignore_images = True
-            h.ignore_tables = False
-            h.unicode_snob = True
-            text_content = h.handle(html_content)
-            
-            extracted_text.append(text_content)
+            extracted_text.append(html_to_text(part.get_content()))
     
     # Extract content from all parts of the email
     extract_part(msg)
     return extracted_text
 
+def split_headers(eml_blob, start, end):
+    """
+    Parses only the header block of the message or part at eml_blob[start:end].
+    
+    Returns:
+        tuple: (headers as an email.message.EmailMessage with no body, body start offset)
+    """
+    if eml_blob[start:start + 1] == b'\n' or eml_blob[start:start + 2] == b'\r\n':
+        # No headers: the body starts after the empty line
+        return _header_parser.parsebytes(b''), eml_blob.find(b'\n', start, end) + 1
+    match = HEADER_END_PATTERN.search(eml_blob, start, end)
+    body_start = match.end() if match else end
+    return _header_parser.parsebytes(eml_blob[start:body_start]), body_start
+
+def iter_multipart(eml_blob, boundary, start, end):
+    """
+    Yields the (start, end) offsets of each part of a multipart body by
+    searching for the boundary lines; part contents are never scanned line by
+    line, let alone decoded.
+    """
+    delimiter = b'--' + boundary.encode('ascii', errors='replace')
+    part_start = None
+    pos = eml_blob.find(delimiter, start, end)
+    while pos != -1:
+        if pos == start or eml_blob[pos - 1:pos] == b'\n':
+            if part_start is not None:
+                # The line break before a delimiter belongs to the delimiter
+                part_end = pos - (2 if eml_blob[pos - 2:pos] == b'\r\n' else 1)
+                yield part_start, max(part_start, part_end)
+            
+            after = pos + len(delimiter)
+            if eml_blob[after:after + 2] == b'--':
+                return
+            line_end = eml_blob.find(b'\n', after, end)
+            part_start = end if line_end == -1 else line_end + 1
+        pos = eml_blob.find(delimiter, pos + len(delimiter), end)
+    
+    # No closing delimiter: the last part runs to the end
+    if part_start is not None and part_start < end:
+        yield part_start, end
+
+def extract_email_body_lazy(eml_blob):
+    """
+    Same result as extract_email_body(BytesParser().parse(...)), but reads the
+    MIME structure from the raw bytes: only headers and the text/plain and
+    text/html parts are parsed, and attachments are skipped over without being
+    split into lines or base64-decoded.
+    
+    Args:
+        eml_blob (bytes or mmap): The raw message
+        
+    Returns:
+        tuple: (top-level headers, list of text content from each part)
+    """
+    extracted_text = []
+    
+    def extract_part(headers, start, body_start, end):
+        # Skip attachments
+        if "attachment" in str(headers.get("Content-Disposition", "")):
+            return
+        
+        content_type = headers.get_content_type()
+        if headers.get_content_maintype() == 'multipart':
+            boundary = headers.get_boundary()
+            if not boundary:
+                return
+            for part_start, part_end in iter_multipart(eml_blob, boundary, body_start, end):
+                part_headers, part_body_start = split_headers(eml_blob, part_start, part_end)
+                extract_part(part_headers, part_start, part_body_start, part_end)
+        elif content_type == 'message/rfc822':
+            # A forwarded message: its body is a whole message, headers first
+            inner_headers, inner_body_start = split_headers(eml_blob, body_start, end)
+            extract_part(inner_headers, body_start, inner_body_start, end)
+        elif content_type in ('text/plain', 'text/html'):
+            # Only text parts are fully parsed, for their transfer encoding and charset
+            # (parse, unlike parsebytes, reads universal newlines like the full parser)
+            content = _parser.parse(io.BytesIO(eml_blob[start:end])).get_content()
+            extracted_text.append(content if content_type == 'text/plain' else html_to_text(content))
+    
+    headers, body_start = split_headers(eml_blob, 0, len(eml_blob))
+    extract_part(headers, 0, body_start, len(eml_blob))
+    return headers, extracted_text
+
+def split_paragraphs(text):
+    """
+    Splits a body part into paragraphs with the quote markers removed, so a
+    paragraph reads the same at any quoting depth. An "On ... wrote:" line
+    followed directly by its quote also ends a paragraph.
+    """
+    paragraphs = []
+    current = []
+    current_depth = 0
+    for line in text.splitlines():
+        prefix = QUOTE_PREFIX_PATTERN.match(line)
+        depth = prefix.group(0).count('>') if prefix else 0
+        line = line[prefix.end():].rstrip() if prefix else line.rstrip()
+        if SEPARATOR_PATTERN.match(line):
+            line = ''
+        # Depth alone is unreliable: html2text wraps quoted lines without their markers
+        if current and (not line or (depth != current_depth and current[-1].endswith("wrote:"))):
+            paragraphs.append("\n".join(current))
+            current = []
+        if line:
+            current.append(line)
+            current_depth = depth
+    if current:
+        paragraphs.append("\n".join(current))
+    return paragraphs
+
+
+def is_header_paragraph(paragraph):
+    # Who wrote/received what: needed for the people/role tables, never dropped unless identical
+    lines = paragraph.splitlines()
+    return ATTRIBUTION_PATTERN.match(" ".join(lines)) is not None or all(HEADER_LINE_PATTERN.match(line) for line in lines)
+
+
+def dedupe_email_parts(body_parts, min_chars=None):
+    """
+    Reduces the body parts of a thread before the LLM call: strips quote
+    markers and drops every paragraph already seen earlier in the thread
+    (quoted history, the HTML twin of the text part, repeated signatures and
+    disclaimers). Paragraphs are compared by a hash of their normalized text.
+    Header and "On ... wrote:" paragraphs are only dropped if identical.
+
+    Args:
+        body_parts (list): Texts from extract_email_body
+        min_chars (int): Paragraphs shorter than this (normalized) are always kept,
+                         e.g. "Thanks," (defaults to [Email] DedupMinChars)
+
+    Returns:
+        list: The reduced parts
+    """
+    if min_chars is None:
+        min_chars = config['Email'].getint('DedupMinChars', 20)
+
+    seen = set()
+    seen_parts = set()
+    reduced_parts = []
+    for part in body_parts:
+        kept = []
+        adds_content = False
+        repeats = False
+        for paragraph in split_paragraphs(part):
+            normalized = NORMALIZE_PATTERN.sub(' ', paragraph).strip().lower()
+            if len(normalized) >= min_chars or is_header_paragraph(paragraph):
+                digest = hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).digest()
+                if digest in seen:
+                    repeats = True
+                    continue
+                seen.add(digest)
+                adds_content = True
+            kept.append(paragraph)
+        # A part with nothing new but greetings/sign-offs (e.g. the HTML twin) is dropped whole,
+        # but a short message made only of such paragraphs is kept the first time it appears
+        part_digest = hashlib.blake2b(NORMALIZE_PATTERN.sub(' ', part).strip().lower().encode('utf-8'),
+                                      digest_size=16).digest()
+        if adds_content or not (repeats or part_digest in seen_parts):
+            reduced_parts.append("\n\n".join(kept))
+        seen_parts.add(part_digest)
+    return reduced_parts
+
+
 def extract_email_chain(eml_blob):
     """
     Extract text content from an email blob (string or bytes) and clean up links.
     
     Args:
-        eml_blob (str or bytes): The email content as a string or bytes
+        eml_blob (str, bytes or mmap): The email content, e.g. a spooled upload
         
     Returns:
         str: The extracted readable text content with cleaned up links
@@ -146,14 +337,23 @@ def extract_email_chain(eml_blob):
     if isinstance(eml_blob, str):
         eml_blob = eml_blob.encode('utf-8')
     
-    # Parse the email
-    msg = BytesParser(policy=policy.default).parse(io.BytesIO(eml_blob))
+    try:
+        # Parse the headers and text parts only, straight from the bytes (or spooled map)
+        msg, body_content = extract_email_body_lazy(eml_blob)
+    except Exception as e:
+        # Malformed MIME: fall back to the full parser
+        print(f"Lazy email parsing failed ({e}), parsing the whole message")
+        msg = BytesParser(policy=policy.default).parse(io.BytesIO(eml_blob))
+        body_content = extract_email_body(msg)
     
     # Extract headers
     headers = extract_email_headers(msg)
     
-    # Extract body content
-    body_content = extract_email_body(msg)
+    # Drop quoted history and other repeated paragraphs
+    if config['Email'].getboolean('DedupQuoted', True):
+        original_len = sum(len(part) for part in body_content)
+        body_content = dedupe_email_parts(body_content)
+        count_email_dedup(original_len, sum(len(part) for part in body_content))
     
     # Combine all extracted content
     all_content = "\n".join(headers) + "\n\n" + "\n\n".join(body_content)
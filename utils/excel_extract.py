@@ -0,0 +1,99 @@
+import datetime
+import zipfile
+
+from utils.uploads import open_stream
+
+BATCH_ROWS = 1000
+
+
+def format_cell(value):
+    # Compact cell text: no padding, no NaN/None, no trailing ".0" on whole numbers
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        if value != value:  # NaN
+            return ""
+        if value.is_integer():
+            return str(int(value))
+    if isinstance(value, datetime.datetime) and value.time() == datetime.time():
+        return value.date().isoformat()
+    return str(value).strip()
+
+
+def format_row(values):
+    cells = [format_cell(v) for v in values]
+    # Trailing empty cells carry nothing but separators
+    while cells and cells[-1] == "":
+        cells.pop()
+    return "\t".join(cells)
+
+
+class ExcelTextExtractor:
+    """
+    Renders a workbook as compact tab-separated text, one "--- Sheet: name ---"
+    block per sheet. The workbook is parsed once, rows are read in batches and
+    reading stops as soon as max_text_len characters have been produced.
+    """
+    def __init__(self, max_text_len, batch_rows=BATCH_ROWS):
+        self.max_text_len = max_text_len
+        self.batch_rows = batch_rows
+
+    def extract(self, file_blob):
+        if zipfile.is_zipfile(open_stream(file_blob)):
+            sheets = self._iter_xlsx(file_blob)
+        else:
+            sheets = self._iter_xls(file_blob)
+
+        sheet_blocks = []
+        text_len = 0
+        for sheet_name, rows in sheets:
+            header = f"--- Sheet: {sheet_name} ---"
+            lines = [header]
+            text_len += len(header) + 2
+
+            for batch in self._batches(rows):
+                for line in batch:
+                    lines.append(line)
+                    text_len += len(line) + 1
+                if text_len >= self.max_text_len:
+                    break
+
+            sheet_blocks.append("\n".join(lines))
+            if text_len >= self.max_text_len:
+                break
+
+        sheets.close()
+        return "\n\n".join(sheet_blocks)
+
+    def _batches(self, rows):
+        batch = []
+        for values in rows:
+            line = format_row(values)
+            if not line:
+                continue
+            batch.append(line)
+            if len(batch) >= self.batch_rows:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _iter_xlsx(self, file_blob):
+        # read_only streams rows from the sheet XML instead of building every cell object
+        import openpyxl
+
+        workbook = openpyxl.load_workbook(open_stream(file_blob), read_only=True, data_only=True)
+        try:
+            for worksheet in workbook.worksheets:
+                yield worksheet.title, worksheet.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+
+    def _iter_xls(self, file_blob):
+        # Legacy .xls: xlrd loads the whole book once; sheets are then parsed from memory
+        import pandas as pd
+
+        with pd.ExcelFile(open_stream(file_blob)) as excel_file:
+            for sheet_name in excel_file.sheet_names:
+                df = excel_file.parse(sheet_name, header=None)
+                yield sheet_name, df.itertuples(index=False, name=None)
@@ -0,0 +1,190 @@
+import os
+import random
+import socket
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.util.retry import Retry
+
+from utils.config import config
+from utils.metrics import observe_http_call
+
+# 500 is left out on purpose: a POST that failed inside the handler may already
+# have spent an LLM call, so only throttling and proxy/availability errors retry
+DEFAULT_RETRY_STATUSES = "429|502|503|504"
+
+
+class JitteredRetry(Retry):
+    """
+    Exponential backoff with full jitter, so retries from several workers
+    do not hit a recovering service in lockstep.
+    """
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff > 0 else 0
+
+
+class UnixHTTPConnection(HTTPConnection):
+    def __init__(self, *args, socket_path=None, **kwargs):
+        self.socket_path = socket_path
+        super().__init__(*args, **kwargs)
+
+    def _new_conn(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if isinstance(self.timeout, (int, float)):
+            sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+
+class UnixHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = UnixHTTPConnection
+
+
+class UnixSocketAdapter(HTTPAdapter):
+    """
+    Sends every request on the session to a Unix domain socket (the URL's host
+    is ignored), e.g. to gunicorn bound to unix:/run/aru/api.sock. Keep-alive,
+    pooling and retries work as for TCP.
+    """
+    def __init__(self, socket_path, pool_size=10, max_retries=0):
+        super().__init__(pool_connections=1, pool_maxsize=pool_size, max_retries=max_retries)
+        self.unix_pool = UnixHTTPConnectionPool("localhost", maxsize=pool_size, socket_path=socket_path)
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        return self.unix_pool
+
+    def get_connection(self, url, proxies=None):
+        return self.unix_pool
+
+    def close(self):
+        super().close()
+        self.unix_pool.close()
+
+
+class HttpStats:
+    """
+    Per-session call counts, retries and latency for this process, also
+    exported as Prometheus metrics (for processes without a /health of their
+    own, such as the frontend's calls to the API).
+    """
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, elapsed_ms, retries, error):
+        with self._lock:
+            stats = self._stats.setdefault(name, {"calls": 0, "errors": 0, "retries": 0,
+                                                  "total_ms": 0.0, "max_ms": 0.0})
+            stats["calls"] += 1
+            stats["errors"] += 1 if error else 0
+            stats["retries"] += retries
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        observe_http_call(name, elapsed_ms / 1000, retries, error)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: {**stats, "avg_ms": round(stats["total_ms"] / stats["calls"], 1)}
+                    for name, stats in self._stats.items()}
+
+
+http_stats = HttpStats()
+
+_sessions = {}
+_sessions_pid = None
+_lock = threading.Lock()
+
+
+def create_session(name, unix_socket=None):
+    """
+    Creates a pooled session configured from the [HTTP:<name>] section
+    (falling back to [HTTP]). With unix_socket, requests go to that socket
+    instead of over TCP.
+    """
+    sections = [config[s] for s in (f"HTTP:{name}", "HTTP") if s in config.config]
+
+    def setting(key, default):
+        # First section that defines the key wins
+        for section in sections:
+            if key in section:
+                return section[key]
+        return default
+
+    retries = int(setting('Retries', 3))
+    statuses = [int(status) for status in setting('RetryStatuses', DEFAULT_RETRY_STATUSES).split('|')]
+    retry = JitteredRetry(
+        total=retries,
+        connect=retries,
+        read=0,  # never resend after the server may have started work
+        backoff_factor=float(setting('BackoffSeconds', 0.5)),
+        status_forcelist=statuses,
+        allowed_methods=None,  # POST too: statuses above mean the request was not processed
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+
+    pool_size = int(setting('PoolSize', 10))
+    if unix_socket:
+        adapter = UnixSocketAdapter(unix_socket, pool_size=pool_size, max_retries=retry)
+    else:
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.timeout = (float(setting('ConnectTimeoutSeconds', 5)),
+                       float(setting('ReadTimeoutSeconds', 60)))
+    return session
+
+
+def get_session(name, unix_socket=None):
+    # One session per name (and socket) per process; connections are not shared across forks
+    global _sessions, _sessions_pid
+    with _lock:
+        if _sessions_pid != os.getpid():
+            _sessions = {}
+            _sessions_pid = os.getpid()
+        key = (name, unix_socket)
+        if key not in _sessions:
+            _sessions[key] = create_session(name, unix_socket)
+        return _sessions[key]
+
+
+def http_request(name, method, url, unix_socket=None, **kwargs):
+    """
+    Sends a request on the named pooled session with its default timeouts and
+    retry policy, and records latency and retry counts in http_stats.
+
+    Returns:
+        requests.Response
+    """
+    session = get_session(name, unix_socket)
+    kwargs.setdefault("timeout", session.timeout)
+
+    start = time.perf_counter()
+    response = None
+    try:
+        response = session.request(method, url, **kwargs)
+        return response
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        retry_state = response.raw.retries if response is not None else None
+        retries = len(retry_state.history) if retry_state else 0
+        http_stats.record(name, elapsed_ms, retries, response is None or response.status_code >= 500)
+
+
+def http_get(name, url, **kwargs):
+    return http_request(name, "GET", url, **kwargs)
+
+
+def http_post(name, url, **kwargs):
+    return http_request(name, "POST", url, **kwargs)
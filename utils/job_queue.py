@@ -0,0 +1,301 @@
+import os
+import random
+import shutil
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+
+from utils.config import config
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_ERROR = "error"
+
+KIND_OCR = "ocr"
+KIND_SUMMARY = "summary"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_text TEXT NOT NULL,
+    file_ext TEXT NOT NULL,
+    file_name TEXT,
+    input_path TEXT,
+    url TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_after REAL NOT NULL,
+    lease_token TEXT,
+    lease_expires REAL,
+    worker TEXT,
+    error TEXT,
+    result TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, run_after);
+"""
+
+# Everything but the result, for status polls
+STATUS_COLUMNS = ("id, kind, status, model, file_ext, file_name, url, attempts, max_attempts, run_after, "
+                  "worker, error, created, started, finished")
+
+
+class JobQueue:
+    """
+    Durable queue of /ocr/jobs and /summary/jobs work in one SQLite file (WAL
+    mode), shared by the API workers that enqueue and poll and the job worker
+    processes that run them (api/job_worker.py). Uploads are kept under
+    input_dir until their job finishes.
+
+    A worker claims a job with a lease and renews it while the job runs. A job
+    whose lease runs out (its worker was killed or restarted) is claimed
+    again, so every job runs at least once. Failures are retried with
+    exponential backoff up to max_attempts.
+    """
+    def __init__(self, db_path, input_dir, lease_seconds=120, max_attempts=3, backoff_seconds=10,
+                 max_backoff_seconds=600, retention_seconds=7 * 24 * 3600):
+        self.db_path = db_path
+        self.input_dir = input_dir
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.retention_seconds = retention_seconds
+        self._ready = False
+
+    def connect(self):
+        # One connection per call: connections must not cross threads or forks
+        if not self._ready:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            os.makedirs(self.input_dir, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._ready = True
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _input_path(self, job_id):
+        return os.path.join(self.input_dir, job_id)
+
+    def enqueue(self, kind, model, prompt_text, file_ext, file_name=None, input_path=None, url=None):
+        """
+        Adds a job. input_path (e.g. a spooled upload) is moved into the
+        queue's input directory, so the caller must not remove it.
+
+        Returns:
+            str: The job ID
+        """
+        job_id = uuid.uuid4().hex
+        stored_path = None
+        if input_path is not None:
+            stored_path = self._input_path(job_id)
+            os.makedirs(self.input_dir, exist_ok=True)
+            shutil.move(input_path, stored_path)
+
+        now = time.time()
+        try:
+            with closing(self.connect()) as conn:
+                conn.execute(
+                    "INSERT INTO jobs (id, kind, status, model, prompt_text, file_ext, file_name, input_path, url, "
+                    "max_attempts, run_after, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, kind, JOB_PENDING, model, prompt_text, file_ext, file_name, stored_path, url,
+                     self.max_attempts, now, now))
+        except Exception:
+            if stored_path:
+                self._remove_input(stored_path)
+            raise
+        return job_id
+
+    def claim(self, worker):
+        """
+        Leases the next runnable job: a pending one that is due, or a running
+        one whose lease has run out (its input is kept until the job finishes).
+
+        Returns:
+            dict or None: The job, with the lease_token that complete/fail/renew need
+        """
+        now = time.time()
+        token = uuid.uuid4().hex
+        with closing(self.connect()) as conn:
+            # IMMEDIATE takes the write lock up front, so two workers never pick the same row
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # A job whose worker died on its last attempt is not run again
+                conn.execute("UPDATE jobs SET status = ?, error = ?, lease_token = NULL, finished = ? "
+                             "WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts",
+                             (JOB_ERROR, "Worker stopped during the last attempt", now, JOB_RUNNING, now))
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE (status = ? AND run_after <= ?) OR (status = ? AND lease_expires < ?) "
+                    "ORDER BY run_after LIMIT 1", (JOB_PENDING, now, JOB_RUNNING, now)).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_token = ?, lease_expires = ?, "
+                    "worker = ?, started = ? WHERE id = ?",
+                    (JOB_RUNNING, token, now + self.lease_seconds, worker, now, row["id"]))
+                job = dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return job
+
+    def renew(self, job_id, lease_token):
+        """
+        Extends a running job's lease.
+
+        Returns:
+            bool: False if the lease was lost (it ran out and another worker took the job)
+        """
+        with closing(self.connect()) as conn:
+            cursor = conn.execute("UPDATE jobs SET lease_expires = ? WHERE id = ? AND lease_token = ? AND status = ?",
+                                  (time.time() + self.lease_seconds, job_id, lease_token, JOB_RUNNING))
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, lease_token, result):
+        """
+        Stores a job's result. Ignored if the lease was lost, so a late worker
+        never overwrites the job's current run.
+
+        Returns:
+            bool: Whether the result was stored
+        """
+        with closing(self.connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, lease_token = NULL, finished = ? "
+                "WHERE id = ? AND lease_token = ? AND status = ?",
+                (JOB_DONE, result, time.time(), job_id, lease_token, JOB_RUNNING))
+            stored = cursor.rowcount == 1
+        if stored:
+            self._remove_input(self._input_path(job_id))
+        return stored
+
+    def backoff(self, attempts):
+        # 10 s, 20 s, 40 s, ... capped, with jitter so failed jobs do not retry in lockstep
+        delay = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** max(0, attempts - 1))
+        return delay * random.uniform(0.75, 1.25)
+
+    def fail(self, job_id, lease_token, error, retry_after=None, count_attempt=True):
+        """
+        Records a failed attempt: the job is retried after a backoff (or
+        retry_after seconds, e.g. from a provider rate limit) until it has used
+        max_attempts, then it fails for good. count_attempt=False retries
+        without using up an attempt.
+
+        Returns:
+            str or None: The job's new status, or None if the lease was lost
+        """
+        now = time.time()
+        with closing(self.connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ? AND lease_token = ? "
+                                   "AND status = ?", (job_id, lease_token, JOB_RUNNING)).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+
+                attempts = row["attempts"] if count_attempt else row["attempts"] - 1
+                if attempts < row["max_attempts"]:
+                    status = JOB_PENDING
+                    delay = retry_after if retry_after is not None else self.backoff(attempts)
+                    conn.execute("UPDATE jobs SET status = ?, attempts = ?, run_after = ?, error = ?, "
+                                 "lease_token = NULL WHERE id = ?", (status, attempts, now + delay, error, job_id))
+                else:
+                    status = JOB_ERROR
+                    conn.execute("UPDATE jobs SET status = ?, error = ?, lease_token = NULL, finished = ? "
+                                 "WHERE id = ?", (status, error, now, job_id))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        if status == JOB_ERROR:
+            self._remove_input(self._input_path(job_id))
+        return status
+
+    def get(self, job_id):
+        """
+        Returns the job's status (without its result), or None if unknown.
+        """
+        with closing(self.connect()) as conn:
+            row = conn.execute(f"SELECT {STATUS_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["job_id"] = job.pop("id")
+        if job["status"] != JOB_PENDING:
+            job.pop("run_after")
+        return job
+
+    def read_result(self, job_id):
+        with closing(self.connect()) as conn:
+            row = conn.execute("SELECT result FROM jobs WHERE id = ? AND status = ?", (job_id, JOB_DONE)).fetchone()
+        return None if row is None else row["result"]
+
+    def stats(self):
+        """
+        Returns:
+            dict: Job counts by status, and the age in seconds of the oldest due pending job
+        """
+        now = time.time()
+        with closing(self.connect()) as conn:
+            counts = {row["status"]: row["n"] for row in
+                      conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
+            oldest = conn.execute("SELECT MIN(run_after) AS t FROM jobs WHERE status = ? AND run_after <= ?",
+                                  (JOB_PENDING, now)).fetchone()["t"]
+        return {"counts": counts, "oldest_pending_seconds": round(now - oldest, 1) if oldest else 0}
+
+    def sweep(self):
+        """
+        Deletes finished jobs older than the retention period, and input files
+        whose job is gone.
+
+        Returns:
+            int: Jobs deleted
+        """
+        with closing(self.connect()) as conn:
+            cursor = conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND finished < ?",
+                                  (JOB_DONE, JOB_ERROR, time.time() - self.retention_seconds))
+            deleted = cursor.rowcount
+            waiting = {row["id"] for row in conn.execute("SELECT id FROM jobs WHERE status IN (?, ?)",
+                                                         (JOB_PENDING, JOB_RUNNING))}
+
+        for name in os.listdir(self.input_dir):
+            file_path = os.path.join(self.input_dir, name)
+            # Skip inputs being moved in by an enqueue that has not inserted its row yet
+            if name not in waiting and time.time() - os.path.getmtime(file_path) > 3600:
+                self._remove_input(file_path)
+        return deleted
+
+    @staticmethod
+    def _remove_input(file_path):
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+
+def create_job_queue():
+    settings = config['Jobs']
+    return JobQueue(settings.get('Path', 'data/queue/jobs.db'),
+                    settings.get('InputDir', 'data/queue/inputs'),
+                    lease_seconds=settings.getint('LeaseSeconds', 120),
+                    max_attempts=settings.getint('MaxAttempts', 3),
+                    backoff_seconds=settings.getfloat('BackoffSeconds', 10),
+                    max_backoff_seconds=settings.getfloat('MaxBackoffSeconds', 600),
+                    retention_seconds=int(settings.getfloat('RetentionHours', 168) * 3600))
+
+
+# Job queue (a handle on the shared SQLite file; safe to use from any process or thread)
+job_queue = create_job_queue()
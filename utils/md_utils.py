@@ -1,6 +1,25 @@
 # For RenderedView and markdown processing
+import hashlib
+import html
+import re
+import threading
+from collections import OrderedDict
+
 import markdown
 
+from utils.config import config
+
+# Rendered previews by content hash: re-showing an output (or flipping back to
+# a page) does not run markdown again
+_render_cache = OrderedDict()
+_render_cache_lock = threading.Lock()
+
+# An existing header separator row, with or without alignment: |---|:--|--:|
+TABLE_SEPARATOR_PATTERN = re.compile(r"^\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)+\|?$")
+CODE_FENCE_PATTERN = re.compile(r"^\s*(```|~~~)")
+
+PREVIEW_CONTAINER = "<div style='height: 300px; overflow-y: auto; padding: 10px; border: 1px solid #ddd; font-size: 14px;'>"
+
 def fix_markdown_tables(markdown_text):
     """
     Fixes improperly formatted markdown tables by adding missing separators
@@ -15,9 +34,20 @@ def fix_markdown_tables(markdown_text):
     lines = markdown_text.split('\n')
     processed_lines = []
     in_table = False
+    in_fence = False
     header_row_index = -1
     
     for i, line in enumerate(lines):
+        # Leave fenced code blocks alone: pipes in code are not tables
+        if CODE_FENCE_PATTERN.match(line):
+            in_fence = not in_fence
+            in_table = False
+            processed_lines.append(line)
+            continue
+        if in_fence:
+            processed_lines.append(line)
+            continue
+        
         # Check if this could be a table row (has multiple pipe characters)
         if line.count('|') > 2:
             if not in_table:
@@ -27,7 +57,7 @@ def fix_markdown_tables(markdown_text):
                 processed_lines.append(line.strip())
                 
                 # Add a separator row if it's missing
-                if i+1 < len(lines) and '---' not in lines[i+1]:
+                if i+1 < len(lines) and not TABLE_SEPARATOR_PATTERN.match(lines[i+1].strip()):
                     # Count columns and create separator
                     cols = max(1, line.count('|') - 1)
                     separator = '|' + '|'.join(['---'] * cols) + '|'
@@ -112,63 +142,117 @@ def render_markdown_to_html(markdown_text):
     # Get available extensions
     extensions = get_markdown_extensions()
     
-    # Try rendering with standard markdown
+    # Repair tables up front (one pass over the lines) so markdown runs only once
+    if '|' in markdown_text:
+        markdown_text = fix_markdown_tables(markdown_text)
+    
     try:
-        html_content = markdown.markdown(markdown_text, extensions=extensions)
-        
-        # If there are no tables rendered but there should be, try fixing the markdown
-        if '<table>' not in html_content and '|' in markdown_text and '---' in markdown_text:
-            fixed_text = fix_markdown_tables(markdown_text)
-            html_content = markdown.markdown(fixed_text, extensions=extensions)
-            
-        return html_content
+        return markdown.markdown(markdown_text, extensions=extensions)
     except Exception as e:
-        # Fallback attempt with table fixing if regular rendering fails
+        # Fallback attempt with only the tables extension
         try:
-            fixed_text = fix_markdown_tables(markdown_text)
-            html_content = markdown.markdown(fixed_text, extensions=['tables'])
-            return html_content
+            return markdown.markdown(markdown_text, extensions=['tables'])
         except:
             # If all else fails, return the error and raw text
-            return f"<p>Error rendering markdown: {str(e)}</p><pre>{markdown_text}</pre>"
+            return f"<p>Error rendering markdown: {str(e)}</p><pre>{html.escape(markdown_text)}</pre>"
 
 
-def create_html_preview(text_content, file_ext):
+def cached_render(render_fn, text_content, *args):
     """
-    Creates a styled HTML preview based on file content and extension.
+    Returns render_fn(text_content, *args), from the render cache when the same
+    content was rendered the same way before. Keeps [UI] PreviewCacheItems
+    entries, least recently used first out.
+    """
+    digest = hashlib.blake2b(text_content.encode('utf-8', errors='replace'), digest_size=16).hexdigest()
+    key = (render_fn.__name__, digest, *args)
+    with _render_cache_lock:
+        if key in _render_cache:
+            _render_cache.move_to_end(key)
+            return _render_cache[key]
+    
+    rendered = render_fn(text_content, *args)
+    with _render_cache_lock:
+        _render_cache[key] = rendered
+        while len(_render_cache) > config['UI'].getint('PreviewCacheItems', 64):
+            _render_cache.popitem(last=False)
+    return rendered
+
+
+def preview_window(text_content, file_ext, page=1):
+    """
+    Cuts a large plain-text/CSV output down to one page of [UI] PreviewRows
+    lines, so the browser only gets what is shown. CSV pages repeat the header
+    line. Markdown and HTML are never cut: a window could split a table.
     
     Args:
-        text_content (str): The text content to display
-        file_ext (str): The file extension to determine rendering
+        text_content (str): The full output
+        file_ext (str): The file extension
+        page (int): 1-based page, clamped to the pages available
         
     Returns:
-        str: HTML preview with appropriate styling and formatting
+        tuple: (window_text, page, page_count, first_row, last_row, row_count),
+               with the whole text when it fits on one page
     """
-    # Starting HTML for the preview container
-    html_preview = "<div style='height: 300px; overflow-y: auto; padding: 10px; border: 1px solid #ddd; font-size: 14px;'>"
-    
+    rows_per_page = config['UI'].getint('PreviewRows', 500)
     file_ext = file_ext.lower() if file_ext else ''
+    if file_ext in ['md', 'markdown', 'html', 'htm'] or text_content.count('\n') < rows_per_page:
+        return text_content, 1, 1, 1, None, None
+    
+    lines = text_content.split('\n')
+    header = lines[0] if file_ext == 'csv' else None
+    rows = lines[1:] if header is not None else lines
+    page_count = max(1, -(-len(rows) // rows_per_page))
+    page = min(max(1, int(page or 1)), page_count)
+    first = (page - 1) * rows_per_page
+    window = rows[first:first + rows_per_page]
+    if header is not None:
+        window = [header] + window
+    return '\n'.join(window), page, page_count, first + 1, first + len(window) - (header is not None), len(rows)
+
+
+def _render_preview(text_content, file_ext, page):
+    window_text, page, page_count, first, last, row_count = preview_window(text_content, file_ext, page)
+    html_preview = PREVIEW_CONTAINER
     
     if file_ext in ['md', 'markdown']:
         # Add custom CSS for better table styling
         html_preview += get_table_css()
         
         # Convert markdown to HTML
-        html_content = render_markdown_to_html(text_content)
-        html_preview += html_content
+        html_preview += render_markdown_to_html(text_content)
     
     elif file_ext in ['html', 'htm']:
         # Directly use HTML (with basic sanitization)
         html_preview += text_content
     
-    elif file_ext in ['txt', 'csv', 'json', 'xml']:
-        # Preformatted text for code-like content
-        html_preview += f"<pre style='white-space: pre-wrap;'>{text_content}</pre>"
-    
     else:
-        # Default to preformatted text for unknown types
-        html_preview += f"<pre style='white-space: pre-wrap;'>{text_content}</pre>"
+        # Preformatted text for code-like (txt, csv, json, xml) and unknown content
+        if page_count > 1:
+            html_preview += (f"<p><em>Rows {first:,}-{last:,} of {row_count:,} (page {page} of {page_count}); "
+                             f"the download has every row.</em></p>")
+        html_preview += f"<pre style='white-space: pre-wrap;'>{html.escape(window_text)}</pre>"
     
     html_preview += "</div>"
     
-    return html_preview
\ No newline at end of file
+    return html_preview
+
+
+def create_html_preview(text_content, file_ext, page=1, cache=True):
+    """
+    Creates a styled HTML preview based on file content and extension.
+    
+    Args:
+        text_content (str): The text content to display
+        file_ext (str): The file extension to determine rendering
+        page (int): For large text/CSV outputs, the page to show (see preview_window)
+        cache (bool): Keep the result in the render cache (not worth it for
+            partial, still streaming outputs)
+        
+    Returns:
+        str: HTML preview with appropriate styling and formatting
+    """
+    file_ext = file_ext.lower() if file_ext else ''
+    if not cache:
+        return _render_preview(text_content, file_ext, page)
+    return cached_render(_render_preview, text_content, file_ext, page)
+
@@ -0,0 +1,198 @@
+import contextvars
+import functools
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST,
+                               generate_latest, multiprocess)
+
+# Labels of the request being served; stages read them so that code deep in
+# call_ai does not need model/file type/prompt passed through every function
+_labels = contextvars.ContextVar("metric_labels", default={"model": "", "file_type": "", "prompt_id": ""})
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram(
+    "aru_stage_seconds", "Time spent in each pipeline stage",
+    ["stage", "model", "file_type", "prompt_id"], buckets=LATENCY_BUCKETS)
+REQUEST_SECONDS = Histogram(
+    "aru_request_seconds", "End-to-end API request time",
+    ["endpoint", "model", "file_type", "prompt_id"], buckets=LATENCY_BUCKETS)
+REQUESTS_IN_FLIGHT = Gauge(
+    "aru_requests_in_flight", "Requests currently being handled",
+    ["endpoint"], multiprocess_mode="livesum")
+PROVIDER_ERRORS = Counter(
+    "aru_provider_errors_total", "Errors raised by provider calls",
+    ["model", "error"])
+OCR_FALLBACKS = Counter(
+    "aru_ocr_fallbacks_total", "PDFs sent to Mistral OCR for lack of a text layer",
+    ["model", "prompt_id"])
+OCR_PAGES = Counter(
+    "aru_ocr_pages_total", "Pages sent to Mistral OCR: whole scanned PDFs or selected pages of mixed ones",
+    ["mode"])
+ADMISSION_REJECTED = Counter(
+    "aru_admission_rejected_total", "Provider calls turned away with a 429",
+    ["model", "reason"])
+PROMPT_TOKENS = Counter(
+    "aru_prompt_tokens_total", "Prompt tokens reported by providers, by whether they were served from the provider's cache",
+    ["model", "prompt_id", "cached"])
+ROUTER_HEDGES = Counter(
+    "aru_router_hedges_total", "Hedged provider calls, by which call answered first",
+    ["winner"])
+EMAIL_DEDUP_CHARS = Counter(
+    "aru_email_dedup_chars_total", "Email body characters before (input) and after (output) dropping quoted history",
+    ["prompt_id", "kind"])
+HTTP_CLIENT_SECONDS = Histogram(
+    "aru_http_client_seconds", "Outgoing HTTP calls by pooled session, retries included",
+    ["session"], buckets=LATENCY_BUCKETS)
+HTTP_CLIENT_RETRIES = Counter(
+    "aru_http_client_retries_total", "Retries of outgoing HTTP calls",
+    ["session"])
+HTTP_CLIENT_ERRORS = Counter(
+    "aru_http_client_errors_total", "Outgoing HTTP calls that failed or answered 5xx",
+    ["session"])
+CRAWL_PAGES = Histogram(
+    "aru_crawl_pages", "Pages kept per site crawl",
+    buckets=(1, 2, 4, 8, 16, 32, 64))
+
+_prompt_ids = None
+
+
+def get_prompt_id(prompt_text):
+    # Map prompt text back to its [prompt:<id>] section; edited prompts count as "custom"
+    global _prompt_ids
+    if _prompt_ids is None:
+        from utils.call_ai import load_prompts
+        _, prompt_map = load_prompts()
+        _prompt_ids = {p['Prompt'].strip(): p['id'] for p in prompt_map.values()}
+    return _prompt_ids.get((prompt_text or "").strip(), "custom")
+
+
+def set_labels(model=None, file_type=None, prompt_text=None):
+    """
+    Sets the labels used by stage_timer for the rest of the current context.
+    """
+    labels = dict(_labels.get())
+    if model is not None:
+        labels["model"] = model
+    if file_type is not None:
+        labels["file_type"] = file_type
+    if prompt_text is not None:
+        labels["prompt_id"] = get_prompt_id(prompt_text)
+    _labels.set(labels)
+
+
+def get_labels():
+    return _labels.get()
+
+
+@contextmanager
+def stage_timer(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage=stage, **_labels.get()).observe(time.perf_counter() - start)
+
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.labels(stage=stage, **_labels.get()).observe(seconds)
+
+
+@contextmanager
+def provider_call(model):
+    """
+    Times a provider round trip as the "provider" stage and counts its errors.
+    """
+    with stage_timer("provider"):
+        try:
+            yield
+        except Exception as e:
+            PROVIDER_ERRORS.labels(model=model, error=type(e).__name__).inc()
+            raise
+
+
+def count_ocr_fallback():
+    labels = _labels.get()
+    OCR_FALLBACKS.labels(model=labels["model"], prompt_id=labels["prompt_id"]).inc()
+
+
+def count_ocr_pages(mode, pages):
+    # mode: "document" (scanned PDF) or "pages" (selected pages of a mixed PDF)
+    OCR_PAGES.labels(mode=mode).inc(pages)
+
+
+def count_admission_rejected(model, reason):
+    # reason: "queue_full", "timeout" or "provider" (the provider's own 429)
+    ADMISSION_REJECTED.labels(model=model, reason=reason).inc()
+
+
+def count_prompt_tokens(model, prompt_id, prompt_tokens, cached_tokens):
+    PROMPT_TOKENS.labels(model=model, prompt_id=prompt_id, cached="true").inc(cached_tokens)
+    PROMPT_TOKENS.labels(model=model, prompt_id=prompt_id, cached="false").inc(max(0, prompt_tokens - cached_tokens))
+
+
+def count_hedge(winner):
+    # winner: "primary" or "hedge"
+    ROUTER_HEDGES.labels(winner=winner).inc()
+
+
+def count_email_dedup(input_chars, output_chars):
+    prompt_id = _labels.get()["prompt_id"]
+    EMAIL_DEDUP_CHARS.labels(prompt_id=prompt_id, kind="input").inc(input_chars)
+    EMAIL_DEDUP_CHARS.labels(prompt_id=prompt_id, kind="output").inc(output_chars)
+
+
+def observe_http_call(session, seconds, retries, error):
+    HTTP_CLIENT_SECONDS.labels(session=session).observe(seconds)
+    if retries:
+        HTTP_CLIENT_RETRIES.labels(session=session).inc(retries)
+    if error:
+        HTTP_CLIENT_ERRORS.labels(session=session).inc()
+
+
+def observe_crawl_pages(pages):
+    CRAWL_PAGES.observe(pages)
+
+
+@contextmanager
+def track_request(endpoint):
+    """
+    Counts the request as in flight and records its duration. The request's
+    labels are reset so nothing leaks from the previous request on this thread.
+    """
+    token = _labels.set({"model": "", "file_type": "", "prompt_id": ""})
+    gauge = REQUESTS_IN_FLIGHT.labels(endpoint=endpoint)
+    gauge.inc()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        gauge.dec()
+        REQUEST_SECONDS.labels(endpoint=endpoint, **_labels.get()).observe(time.perf_counter() - start)
+        _labels.reset(token)
+
+
+def tracked(endpoint):
+    # Route decorator form of track_request
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with track_request(endpoint):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render_metrics():
+    """
+    Returns:
+        tuple: (body, content_type) in Prometheus text format. Under gunicorn with
+        PROMETHEUS_MULTIPROC_DIR set, values are aggregated across all workers.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
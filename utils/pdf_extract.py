@@ -0,0 +1,353 @@
+import contextvars
+import io
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import PyPDF2
+
+from utils.config import config
+from utils.uploads import open_stream
+
+# Process pool shared by all requests in this worker, created on first use
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+# Threads for the per-page OCR requests (network bound)
+_ocr_executor = None
+_ocr_executor_pid = None
+
+# Stands in for the text of a page whose OCR the caller runs later (see pending_ocr_pages)
+OCR_PENDING = "\x00ocr-pending\x00"
+PENDING_PAGE_PATTERN = re.compile(r"--- Page (\d+) ---\n" + re.escape(OCR_PENDING))
+
+
+def get_pdf_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # forkserver: never fork a process that has request threads running
+            context = multiprocessing.get_context("forkserver")
+            _pool = ProcessPoolExecutor(max_workers=config['PDF'].getint('Workers', 4), mp_context=context)
+            _pool_pid = os.getpid()
+    return _pool
+
+
+def get_ocr_executor():
+    global _ocr_executor, _ocr_executor_pid
+    with _pool_lock:
+        if _ocr_executor is None or _ocr_executor_pid != os.getpid():
+            _ocr_executor = ThreadPoolExecutor(max_workers=config['PDF'].getint('OcrWorkers', 4),
+                                               thread_name_prefix="page-ocr")
+            _ocr_executor_pid = os.getpid()
+    return _ocr_executor
+
+
+def format_page(index, page_text):
+    return f"--- Page {index+1} ---\n{page_text}"
+
+
+def sample_page_indexes(num_pages, sample_count):
+    """
+    Picks up to sample_count page indexes spread evenly through the document.
+    """
+    if num_pages <= sample_count:
+        return list(range(num_pages))
+    step = (num_pages - 1) / (sample_count - 1) if sample_count > 1 else 0
+    return sorted({round(i * step) for i in range(sample_count)})
+
+
+def page_needs_ocr(page, page_text, min_page_text_len):
+    """
+    A page needs OCR if it has (almost) no text layer but does draw something,
+    e.g. a scanned image. Blank pages are not worth an OCR page.
+    """
+    if not min_page_text_len or len(page_text.strip()) >= min_page_text_len:
+        return False
+    try:
+        contents = page.get_contents()
+        return contents is not None and bool(contents.get_data().strip())
+    except Exception:
+        return True  # Unreadable content stream: let OCR have a look
+
+
+def extract_page_range(file_path, start, end, min_page_text_len=0):
+    """
+    Extracts the text of pages [start, end) from a PDF file on disk. Runs inside
+    the process pool, so it opens its own reader.
+
+    Returns:
+        list: (text, needs_ocr) per page
+    """
+    with open(file_path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        pages = []
+        for i in range(start, end):
+            page_text = reader.pages[i].extract_text() or ""
+            pages.append((page_text, page_needs_ocr(reader.pages[i], page_text, min_page_text_len)))
+        return pages
+
+
+def split_pdf_pages(file_blob, page_indexes):
+    """
+    Copies the given pages into a new, smaller PDF, e.g. to OCR only those.
+
+    Returns:
+        bytes: The PDF file
+    """
+    reader = PyPDF2.PdfReader(open_stream(file_blob))
+    writer = PyPDF2.PdfWriter()
+    for i in page_indexes:
+        writer.add_page(reader.pages[i])
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def pending_ocr_pages(text):
+    # Page indexes left as OCR_PENDING by PdfTextExtractor.extract(defer_ocr=True)
+    return [int(match.group(1)) - 1 for match in PENDING_PAGE_PATTERN.finditer(text)]
+
+
+def splice_ocr_pages(text, ocr_texts):
+    """
+    Replaces OCR_PENDING pages with their OCR text.
+
+    Args:
+        ocr_texts (dict): page index -> text; missing pages end up empty
+    """
+    return PENDING_PAGE_PATTERN.sub(lambda match: format_page(int(match.group(1)) - 1,
+                                                              ocr_texts.get(int(match.group(1)) - 1, "")), text)
+
+
+class PageOcr:
+    """
+    OCRs the pages without a usable text layer in batches of pages_per_request,
+    on the OCR threads, while the extractor carries on with the other pages.
+    """
+    def __init__(self, ocr_pages_fn, pages_per_request):
+        self.ocr_pages_fn = ocr_pages_fn
+        self.pages_per_request = max(1, pages_per_request)
+        self.pending = []
+        self.futures = []
+
+    def add(self, index):
+        self.pending.append(index)
+        if len(self.pending) >= self.pages_per_request:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            # Run in a copy of the caller's context so metric labels carry over
+            self.futures.append(get_ocr_executor().submit(contextvars.copy_context().run,
+                                                          self._run, self.pending))
+            self.pending = []
+
+    def _run(self, indexes):
+        return indexes, self.ocr_pages_fn(indexes)
+
+    def results(self):
+        """
+        Returns:
+            dict: page index -> OCR text. Pages of a failed batch are left out
+                  (they end up empty, as they would without OCR).
+        """
+        self.flush()
+        ocr_texts = {}
+        for future in self.futures:
+            try:
+                indexes, page_texts = future.result()
+            except Exception as e:
+                print(f"Page OCR failed: {e}")
+                continue
+            ocr_texts.update(zip(indexes, page_texts))
+        return ocr_texts
+
+
+class DeferredOcr:
+    """
+    Marks the pages without a usable text layer as OCR_PENDING instead, for a
+    caller that OCRs them itself (e.g. the async app, whose extraction runs in
+    a process pool).
+    """
+    def __init__(self):
+        self.pending = []
+
+    def add(self, index):
+        self.pending.append(index)
+
+    def results(self):
+        return {index: OCR_PENDING for index in self.pending}
+
+
+class PdfTextExtractor:
+    """
+    Extracts the text layer of a PDF, stopping as early as possible:
+
+    1. Sample a few pages spread through the document. If they carry less than
+       min_text_len characters between them, double the sample (up to
+       max_sample_pages) in case the text sits between the sampled pages; if
+       the widest sample is still empty the PDF is treated as scanned and
+       nothing else is parsed.
+    2. Otherwise extract pages in order (in parallel for large documents) and
+       stop once max_text_len characters have been collected.
+    3. Pages with less than min_page_text_len characters that draw something
+       (scanned pages in an otherwise digital PDF) can be OCRed on their own,
+       alongside step 2, and put back in page order.
+    """
+    def __init__(self, min_text_len, max_text_len, sample_pages=3, max_sample_pages=24,
+                 parallel_min_pages=100, pages_per_task=16, workers=4,
+                 min_page_text_len=0, ocr_pages_per_request=8):
+        self.min_text_len = min_text_len
+        self.max_text_len = max_text_len
+        self.sample_pages = sample_pages
+        self.max_sample_pages = max(sample_pages, max_sample_pages)
+        self.parallel_min_pages = parallel_min_pages
+        self.pages_per_task = pages_per_task
+        self.workers = workers
+        self.min_page_text_len = min_page_text_len
+        self.ocr_pages_per_request = ocr_pages_per_request
+
+    def extract(self, file_blob, ocr_pages_fn=None, defer_ocr=False):
+        """
+        Args:
+            file_blob: The PDF
+            ocr_pages_fn (callable): ocr_pages_fn(page_indexes) -> list of page
+                texts; OCRs the pages without a usable text layer. Without it
+                those pages keep their (near empty) text layer...
+            defer_ocr (bool): ...unless defer_ocr, which leaves them as
+                OCR_PENDING for the caller (see pending_ocr_pages)
+
+        Returns:
+            tuple: (text, is_scanned) where text uses the "--- Page N ---" layout
+        """
+        reader = PyPDF2.PdfReader(open_stream(file_blob))
+        num_pages = len(reader.pages)
+        page_ocr = None
+        if ocr_pages_fn is not None:
+            page_ocr = PageOcr(ocr_pages_fn, self.ocr_pages_per_request)
+        elif defer_ocr:
+            page_ocr = DeferredOcr()
+
+        # Small documents: sampling would read most pages anyway
+        if num_pages <= self.sample_pages:
+            page_texts = [page.extract_text() or "" for page in reader.pages]
+            if sum(len(t) for t in page_texts) < self.min_text_len:
+                return "", True
+            return self._join(((i, page_text, page_needs_ocr(reader.pages[i], page_text, self.min_page_text_len))
+                               for i, page_text in enumerate(page_texts)), page_ocr), False
+
+        sampled = self._sample(reader, num_pages)
+        if sampled is None:
+            return "", True
+
+        if num_pages < self.parallel_min_pages:
+            return self._extract_serial(reader, num_pages, sampled, page_ocr), False
+        return self._extract_parallel(file_blob, num_pages, page_ocr), False
+
+    def _sample(self, reader, num_pages):
+        """
+        Returns:
+            dict: page index -> text of every page sampled, or None if even
+                  the widest sample has less than min_text_len characters
+        """
+        sampled = {}
+        sample_count = self.sample_pages
+        while True:
+            for i in sample_page_indexes(num_pages, sample_count):
+                if i not in sampled:
+                    sampled[i] = reader.pages[i].extract_text() or ""
+            if sum(len(t) for t in sampled.values()) >= self.min_text_len:
+                return sampled
+            if sample_count >= min(num_pages, self.max_sample_pages):
+                return None
+            sample_count = min(sample_count * 2, self.max_sample_pages)
+
+    def _join(self, indexed_pages, page_ocr=None):
+        page_parts = []  # (index, text), text None while the page is being OCRed
+        text_len = 0
+        for index, page_text, needs_ocr in indexed_pages:
+            if needs_ocr and page_ocr is not None:
+                page_ocr.add(index)
+                page_parts.append((index, None))
+                continue
+            page_parts.append((index, page_text))
+            text_len += len(format_page(index, page_text)) + 2
+            if text_len >= self.max_text_len:
+                break
+
+        # Stop a generator source right away so unneeded work is cancelled
+        close = getattr(indexed_pages, "close", None)
+        if close is not None:
+            close()
+
+        ocr_texts = page_ocr.results() if page_ocr is not None else {}
+        return "\n\n".join(format_page(index, ocr_texts.get(index, "") if page_text is None else page_text)
+                           for index, page_text in page_parts)
+
+    def _extract_serial(self, reader, num_pages, sampled, page_ocr=None):
+        def indexed_pages():
+            for i in range(num_pages):
+                page_text = sampled[i] if i in sampled else (reader.pages[i].extract_text() or "")
+                yield i, page_text, page_needs_ocr(reader.pages[i], page_text, self.min_page_text_len)
+        # _join consumes lazily, so pages past the text budget are never parsed
+        return self._join(indexed_pages(), page_ocr)
+
+    def _extract_parallel(self, file_blob, num_pages, page_ocr=None):
+        # Workers read the PDF from a file instead of receiving a pickled copy per task;
+        # a spooled upload is already on disk
+        spooled_path = getattr(file_blob, "path", None)
+        if spooled_path is not None:
+            return self._extract_parallel_file(spooled_path, num_pages, page_ocr)
+
+        fd, file_path = tempfile.mkstemp(suffix=".pdf")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(file_blob)
+            return self._extract_parallel_file(file_path, num_pages, page_ocr)
+        finally:
+            os.remove(file_path)
+
+    def _extract_parallel_file(self, file_path, num_pages, page_ocr=None):
+        pool = get_pdf_pool()
+        ranges = [(start, min(start + self.pages_per_task, num_pages))
+                  for start in range(0, num_pages, self.pages_per_task)]
+        # Keep only a window of ranges in flight so an early stop wastes little work
+        window = 2 * self.workers
+        futures = {}
+
+        def indexed_pages():
+            try:
+                for n, (start, end) in enumerate(ranges):
+                    for start_ahead, end_ahead in ranges[n:n + window]:
+                        if start_ahead not in futures:
+                            futures[start_ahead] = pool.submit(extract_page_range, file_path, start_ahead,
+                                                               end_ahead, self.min_page_text_len)
+
+                    # Consume results in page order while later ranges keep running
+                    for offset, (page_text, needs_ocr) in enumerate(futures.pop(start).result()):
+                        yield start + offset, page_text, needs_ocr
+            finally:
+                # Budget reached (or error): drop ranges that have not started
+                for future in futures.values():
+                    future.cancel()
+
+        return self._join(indexed_pages(), page_ocr)
+
+
+def create_pdf_extractor(min_text_len, max_text_len):
+    pdf_config = config['PDF']
+    return PdfTextExtractor(
+        min_text_len,
+        max_text_len,
+        sample_pages=pdf_config.getint('SamplePages', 3),
+        max_sample_pages=pdf_config.getint('MaxSamplePages', 24),
+        parallel_min_pages=pdf_config.getint('ParallelMinPages', 100),
+        pages_per_task=pdf_config.getint('PagesPerTask', 16),
+        workers=pdf_config.getint('Workers', 4),
+        min_page_text_len=pdf_config.getint('MinPageTextLen', 20) if pdf_config.getboolean('SelectiveOcr', True) else 0,
+        ocr_pages_per_request=pdf_config.getint('OcrPagesPerRequest', 8)
+    )
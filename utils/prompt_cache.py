@@ -0,0 +1,195 @@
+import hashlib
+import math
+import os
+import threading
+import time
+from datetime import timedelta
+
+from utils.config import config
+from utils.metrics import get_prompt_id, count_prompt_tokens
+
+# Follows the prompt template in every text request; the template itself comes first
+DOCUMENT_HEADER = "Document content:\n"
+
+
+def canonical_prompt(prompt_text):
+    """
+    The prompt template as a byte-stable prefix: the same template always
+    yields the same bytes (line endings and surrounding whitespace from the
+    form do not leak in), so providers can reuse their cache of it.
+    """
+    return (prompt_text or "").replace("\r\n", "\n").strip()
+
+
+def prompt_cache_key(prompt_text):
+    # e.g. "aru-ocr-3f9a2c1d": stable per template, so OpenAI routes repeats to the same cache
+    prompt_text = canonical_prompt(prompt_text)
+    digest = hashlib.blake2b(prompt_text.encode('utf-8'), digest_size=4).hexdigest()
+    return f"aru-{get_prompt_id(prompt_text)}-{digest}"
+
+
+def is_enabled():
+    return config['PromptCache'].getboolean('Enabled', True)
+
+
+def openai_cache_args(prompt_text):
+    # Extra chat.completions.create arguments for OpenAI's (automatic) prompt caching
+    if not is_enabled() or not config['PromptCache'].getboolean('OpenAICacheKey', True):
+        return {}
+    return {"prompt_cache_key": prompt_cache_key(prompt_text)}
+
+
+def record_usage(model, response, prompt_text):
+    """
+    Counts prompt tokens, and how many of them the provider served from its
+    cache, from an OpenAI or Gemini response (or the last chunk of a stream).
+    Responses without usage (e.g. stand-ins) are skipped.
+    """
+    if response is None:
+        return
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        # OpenAI
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", None) if details is not None else None
+    else:
+        # Gemini
+        usage = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(usage, "prompt_token_count", None)
+        cached_tokens = getattr(usage, "cached_content_token_count", None)
+
+    if isinstance(prompt_tokens, int):
+        count_prompt_tokens(model, get_prompt_id(canonical_prompt(prompt_text)), prompt_tokens,
+                            cached_tokens if isinstance(cached_tokens, int) else 0)
+
+
+class GeminiPromptCache:
+    """
+    One Gemini cached-content object per [prompt:*] template and model, so
+    requests send only the document and the template is billed at the cached
+    rate. Created on first use, and its TTL is extended when it is within
+    RefreshSeconds of expiring. Templates shorter than MinTokens (Gemini's
+    minimum cache size) are left to Gemini's implicit caching, and a failed
+    create is not retried for RetrySeconds.
+
+    The shipped templates are all well under MinTokens (about 100-230
+    tokens), so this only comes into play for longer templates added to
+    config.ini.
+
+    Creates and updates are network calls: they run one at a time per
+    template, outside the lock shared by all templates. Handles are per
+    worker process.
+    """
+    def __init__(self, ttl=3600, refresh=300, min_tokens=1024, retry=600, chars_per_token=4.0):
+        self.ttl = ttl
+        self.refresh = refresh
+        self.min_tokens = min_tokens
+        self.retry = retry
+        self.chars_per_token = chars_per_token
+        self._entries = {}  # (model_name, prompt_id) -> (cached content, expires at)
+        self._failed = {}  # (model_name, prompt_id) -> time of the last failed create
+        self._key_locks = {}  # (model_name, prompt_id) -> lock held while creating or updating
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # The cached contents outlive the fork, but not the client objects holding them
+        self._entries = {}
+        self._failed = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def is_cacheable(self, prompt_text):
+        # Only config templates: custom prompts would each leave a cache behind
+        tokens = len(prompt_text) / self.chars_per_token
+        return get_prompt_id(prompt_text) != "custom" and tokens >= self.min_tokens
+
+    def get(self, model_name, prompt_text):
+        """
+        Returns:
+            The template's cached content, or None to send the template inline
+        """
+        prompt_text = canonical_prompt(prompt_text)
+        if not self.is_cacheable(prompt_text):
+            return None
+
+        key = (model_name, get_prompt_id(prompt_text))
+        with self._lock:
+            cached, expires_at = self._entries.get(key, (None, 0))
+            if expires_at - time.time() > self.refresh:
+                return cached
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Single flight: while one request refreshes a live cache the others keep using it,
+        # and while one creates it the others wait for its result
+        if not key_lock.acquire(blocking=expires_at <= time.time()):
+            return cached
+        try:
+            now = time.time()
+            with self._lock:
+                cached, expires_at = self._entries.get(key, (None, 0))
+                failed_at = self._failed.get(key, -math.inf)
+            if expires_at - now > self.refresh:
+                return cached
+            if now - failed_at < self.retry:
+                return cached if expires_at > now else None
+
+            try:
+                if cached is not None and expires_at > now:
+                    cached.update(ttl=timedelta(seconds=self.ttl))
+                else:
+                    cached = self._create(model_name, key[1], prompt_text)
+            except Exception as e:
+                print(f"Gemini prompt cache for {key[1]} failed: {e}")
+                with self._lock:
+                    self._failed[key] = now
+                return cached if expires_at > now else None
+
+            with self._lock:
+                self._entries[key] = (cached, now + self.ttl)
+            return cached
+        finally:
+            key_lock.release()
+
+    def _create(self, model_name, prompt_id, prompt_text):
+        import google.generativeai as genai
+        from utils.ai_clients import get_gemini_model
+        get_gemini_model(model_name)  # Configures the API key
+        return genai.caching.CachedContent.create(
+            model=model_name if model_name.startswith("models/") else f"models/{model_name}",
+            display_name=f"aru-{prompt_id}",
+            contents=[prompt_text],
+            ttl=timedelta(seconds=self.ttl)
+        )
+
+
+def create_gemini_prompt_cache():
+    settings = config['PromptCache']
+    return GeminiPromptCache(ttl=settings.getint('TTLSeconds', 3600),
+                             refresh=settings.getint('RefreshSeconds', 300),
+                             min_tokens=settings.getint('MinTokens', 1024),
+                             retry=settings.getint('RetrySeconds', 600),
+                             chars_per_token=settings.getfloat('CharsPerToken', 4))
+
+
+gemini_prompt_cache = create_gemini_prompt_cache()
+
+
+def gemini_request(contents):
+    """
+    Picks the model for Gemini contents laid out as [prompt, document...]: the
+    template's cached-content model, with the prompt dropped from contents,
+    when the template is cached.
+
+    Returns:
+        tuple: (model, contents)
+    """
+    from utils.ai_clients import get_gemini_model, get_gemini_cached_model
+
+    if is_enabled() and config['PromptCache'].getboolean('GeminiExplicit', True) \
+            and len(contents) > 1 and isinstance(contents[0], str):
+        cached = gemini_prompt_cache.get(config['Gemini']['Model'], contents[0])
+        if cached is not None:
+            return get_gemini_cached_model(cached), contents[1:]
+    return get_gemini_model(), contents
@@ -0,0 +1,198 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from utils.config import config
+
+CACHE_HIT = "HIT"
+CACHE_MISS = "MISS"
+
+
+def make_cache_key(file_blob, model, model_version, prompt_text, file_type=""):
+    """
+    Builds a content-addressed key for an AI result.
+
+    Args:
+        file_blob (bytes or str): The document content (after EML extraction)
+        model (str): Provider name, e.g. "Gemini"
+        model_version (str): Provider model from config.ini, e.g. "gemini-2.0-flash-lite"
+        prompt_text (str): The prompt sent with the document
+        file_type (str): Result of get_file_type(), since it changes how the blob is parsed
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    if isinstance(file_blob, str):
+        file_blob = file_blob.encode('utf-8')
+
+    h = hashlib.sha256()
+    # Length-prefix each field so that ("ab", "c") and ("a", "bc") never collide
+    for part in (model, model_version, file_type, prompt_text):
+        part = (part or "").encode('utf-8')
+        h.update(len(part).to_bytes(8, 'big'))
+        h.update(part)
+    h.update(len(file_blob).to_bytes(8, 'big'))
+    h.update(file_blob)
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    Two tier cache for AI output text: a per-process LRU in memory in front of
+    a directory on disk that is shared by all gunicorn workers.
+    """
+    def __init__(self, cache_dir, max_items=256, max_memory_bytes=64 << 20,
+                 max_disk_bytes=1 << 30, ttl_seconds=7 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.max_items = max_items
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._memory = OrderedDict()  # key -> (stored_at, value)
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._writes_since_sweep = 0
+
+    def _disk_path(self, key):
+        # Fan out into sub-directories so no single directory grows huge
+        return os.path.join(self.cache_dir, key[:2], key + ".txt")
+
+    def _is_expired(self, stored_at):
+        return self.ttl_seconds > 0 and time.time() - stored_at > self.ttl_seconds
+
+    def _memory_put(self, key, stored_at, value):
+        size = len(value)
+        if size > self.max_memory_bytes:
+            return
+
+        with self._lock:
+            if key in self._memory:
+                self._memory_bytes -= len(self._memory.pop(key)[1])
+            self._memory[key] = (stored_at, value)
+            self._memory_bytes += size
+
+            while len(self._memory) > self.max_items or self._memory_bytes > self.max_memory_bytes:
+                _, (_, old_value) = self._memory.popitem(last=False)
+                self._memory_bytes -= len(old_value)
+
+    def get(self, key):
+        """
+        Looks up a cached result.
+
+        Returns:
+            tuple: (value, tier) where tier is "memory" or "disk", or (None, None) on a miss
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if not self._is_expired(stored_at):
+                    self._memory.move_to_end(key)
+                    return value, "memory"
+                self._memory.pop(key)
+                self._memory_bytes -= len(value)
+
+        file_path = self._disk_path(key)
+        try:
+            stored_at = os.path.getmtime(file_path)
+            if self._is_expired(stored_at):
+                os.remove(file_path)
+                return None, None
+            with open(file_path, 'r', encoding='utf-8') as f:
+                value = f.read()
+        except (FileNotFoundError, UnicodeDecodeError):
+            return None, None
+
+        # Touch atime-equivalent for disk LRU without changing the TTL clock
+        try:
+            os.utime(file_path, (time.time(), stored_at))
+        except OSError:
+            pass
+
+        self._memory_put(key, stored_at, value)
+        return value, "disk"
+
+    def put(self, key, value):
+        if not isinstance(value, str):
+            return
+
+        stored_at = time.time()
+        self._memory_put(key, stored_at, value)
+
+        # Atomic write: other workers either see the old file or the complete new one
+        file_path = self._disk_path(key)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(value)
+            os.replace(tmp_path, file_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._writes_since_sweep += 1
+        if self._writes_since_sweep >= 32:
+            self._writes_since_sweep = 0
+            self.sweep()
+
+    def sweep(self):
+        """
+        Removes expired files and evicts least recently used files until the
+        disk tier fits within max_disk_bytes.
+        """
+        entries = []
+        total_bytes = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                file_path = os.path.join(root, name)
+                try:
+                    st = os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+
+                if name.endswith(".tmp") or self._is_expired(st.st_mtime):
+                    # Expired entry (or a temp file orphaned by a killed worker)
+                    if not name.endswith(".tmp") or time.time() - st.st_mtime > 3600:
+                        self._safe_remove(file_path)
+                    continue
+
+                entries.append((st.st_atime, st.st_size, file_path))
+                total_bytes += st.st_size
+
+        if total_bytes <= self.max_disk_bytes:
+            return
+
+        entries.sort()  # oldest access first
+        for _, size, file_path in entries:
+            if total_bytes <= self.max_disk_bytes:
+                break
+            self._safe_remove(file_path)
+            total_bytes -= size
+
+    @staticmethod
+    def _safe_remove(file_path):
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+
+def create_result_cache():
+    cache_config = config['Cache']
+    return ResultCache(
+        cache_dir=cache_config.get('Dir', 'data/cache'),
+        max_items=cache_config.getint('MemoryItems', 256),
+        max_memory_bytes=cache_config.getint('MemoryMB', 64) << 20,
+        max_disk_bytes=cache_config.getint('DiskMB', 1024) << 20,
+        ttl_seconds=int(cache_config.getfloat('TTLHours', 168) * 3600)
+    )
+
+
+# Result cache (one per worker process, sharing the disk tier)
+result_cache = create_result_cache()
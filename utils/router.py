@@ -0,0 +1,308 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from utils.config import config
+from utils.metrics import count_hedge
+
+
+def routed_model_name():
+    # Requests for this model name (e.g. model=Auto) go through the router
+    return config['Router'].get('Name', 'Auto')
+
+
+def is_routed(model):
+    return model == routed_model_name()
+
+
+class ProviderStats:
+    """
+    EWMA latency and error rate of one provider, plus a window of recent
+    latencies for its tail (the hedge delay).
+    """
+    def __init__(self, window):
+        self.latency = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.last_error = None
+        self.recent = deque(maxlen=window)
+
+    def percentile(self, pct):
+        samples = sorted(self.recent)
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+class ProviderRouter:
+    """
+    Sends each request to the fastest healthy provider, by EWMA latency, and
+    fails over to the next one on an error. With hedging on, a second provider
+    is also called if the first has not answered within its p95 latency; the
+    first answer wins and the other call is cancelled (async) or abandoned
+    (threads cannot be interrupted; its latency is still recorded).
+
+    Stats are per worker process: each gunicorn worker learns on its own.
+    """
+    def __init__(self, providers=None, hedge=None):
+        settings = config['Router']
+        self.providers = providers or settings.get('Providers', 'Gemini|OpenAI').split('|')
+        self.alpha = settings.getfloat('Alpha', 0.2)
+        self.error_threshold = settings.getfloat('ErrorThreshold', 0.5)
+        self.cooldown = settings.getfloat('CooldownSeconds', 30)
+        self.max_attempts = settings.getint('MaxAttempts', 2)
+        self.hedge = settings.getboolean('Hedge', False) if hedge is None else hedge
+        self.hedge_percentile = settings.getfloat('HedgePercentile', 95)
+        self.hedge_min = settings.getfloat('HedgeMinSeconds', 1)
+        self.hedge_max = settings.getfloat('HedgeMaxSeconds', 30)
+        # Until a provider has MinSamples latencies, hedge after HedgeDefaultSeconds
+        self.hedge_default = settings.getfloat('HedgeDefaultSeconds', 10)
+        self.min_samples = settings.getint('MinSamples', 10)
+        self.probe_every = settings.getint('ProbeEvery', 20)
+
+        self._stats = {provider: ProviderStats(settings.getint('Window', 100)) for provider in self.providers}
+        self._routed = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def is_healthy(self, stats, now):
+        # An unhealthy provider gets another chance once its cooldown has passed
+        return (stats.error_rate < self.error_threshold or stats.last_error is None
+                or now - stats.last_error >= self.cooldown)
+
+    def rank(self):
+        """
+        Returns:
+            list: Providers, best first: healthy before unhealthy, then by EWMA
+                  latency. Providers with no successful call yet go first, so
+                  they get measured. Every ProbeEvery-th ranking puts the
+                  runner-up first, so a provider that had one slow spell is
+                  measured again rather than never chosen again.
+        """
+        now = time.monotonic()
+        with self._lock:
+            def sort_key(provider):
+                stats = self._stats[provider]
+                return (not self.is_healthy(stats, now), stats.latency or 0.0, stats.error_rate)
+            ranked = sorted(self.providers, key=sort_key)
+
+            self._routed += 1
+            if self.probe_every and self._routed % self.probe_every == 0 and len(ranked) > 1 \
+                    and self.is_healthy(self._stats[ranked[1]], now):
+                ranked.insert(0, ranked.pop(1))
+            return ranked
+
+    def record(self, provider, seconds, ok):
+        with self._lock:
+            stats = self._stats[provider]
+            stats.calls += 1
+            stats.error_rate += self.alpha * ((0.0 if ok else 1.0) - stats.error_rate)
+            if not ok:
+                # Failures are often fast: keep them out of the latency estimate
+                stats.errors += 1
+                stats.last_error = time.monotonic()
+                return
+            stats.latency = seconds if stats.latency is None else stats.latency + self.alpha * (seconds - stats.latency)
+            stats.recent.append(seconds)
+
+    def hedge_delay(self, provider):
+        with self._lock:
+            stats = self._stats[provider]
+            if len(stats.recent) < self.min_samples:
+                return self.hedge_default
+            return min(self.hedge_max, max(self.hedge_min, stats.percentile(self.hedge_percentile)))
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            return {provider: {"calls": stats.calls, "errors": stats.errors,
+                               "latency_ms": round(stats.latency * 1000, 1) if stats.latency is not None else None,
+                               "error_rate": round(stats.error_rate, 3),
+                               "healthy": self.is_healthy(stats, now)}
+                    for provider, stats in self._stats.items()}
+
+    def timed(self, provider, call_fn):
+        start = time.perf_counter()
+        try:
+            result = call_fn(provider)
+        except Exception:
+            self.record(provider, time.perf_counter() - start, False)
+            raise
+        self.record(provider, time.perf_counter() - start, True)
+        return result
+
+    async def timed_async(self, provider, call_fn):
+        start = time.perf_counter()
+        try:
+            result = await call_fn(provider)
+        except asyncio.CancelledError:
+            # Lost a hedge race: says nothing about the provider
+            raise
+        except Exception:
+            self.record(provider, time.perf_counter() - start, False)
+            raise
+        self.record(provider, time.perf_counter() - start, True)
+        return result
+
+    def get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=config['Router'].getint('HedgeThreads', 32),
+                                                    thread_name_prefix="router")
+        return self._executor
+
+    def route(self, call_fn):
+        """
+        Calls call_fn(provider) on the best provider, failing over (and, with
+        hedging on, hedging) to the next best.
+
+        Args:
+            call_fn (callable): call_fn(provider) -> result, e.g. a call_ai partial
+
+        Returns:
+            The first successful result
+
+        Raises:
+            Exception: The last provider error, if every attempt failed
+        """
+        ranked = self.rank()[:self.max_attempts]
+        if not self.hedge or len(ranked) < 2:
+            for i, provider in enumerate(ranked):
+                try:
+                    return self.timed(provider, call_fn)
+                except Exception as e:
+                    if i == len(ranked) - 1:
+                        raise
+                    print(f"Router: {provider} failed ({e}), trying {ranked[i + 1]}")
+
+        executor = self.get_executor()
+        pending = {}
+        started = 0
+        hedged = False
+        last_error = None
+
+        def start():
+            nonlocal started
+            # Run in a copy of the caller's context so metric labels carry over
+            future = executor.submit(contextvars.copy_context().run, self.timed, ranked[started], call_fn)
+            pending[future] = started
+            started += 1
+
+        start()
+        while pending:
+            timeout = self.hedge_delay(ranked[0]) if started < len(ranked) else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                start()  # Primary is slower than usual: hedge
+                hedged = True
+                continue
+
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                for other in pending:
+                    other.cancel()
+                if hedged:
+                    count_hedge("primary" if index == 0 else "hedge")
+                return result
+
+            if not pending and started < len(ranked):
+                print(f"Router: {ranked[started - 1]} failed ({last_error}), trying {ranked[started]}")
+                start()  # Fail over
+
+        raise last_error
+
+    async def route_async(self, call_fn):
+        """
+        Async form of route: call_fn(provider) returns a coroutine, and the
+        losing call of a hedge is cancelled.
+        """
+        ranked = self.rank()[:self.max_attempts]
+        pending = {}
+        started = 0
+        hedged = False
+        last_error = None
+
+        def start():
+            nonlocal started
+            task = asyncio.ensure_future(self.timed_async(ranked[started], call_fn))
+            pending[task] = started
+            started += 1
+
+        start()
+        try:
+            while pending:
+                timeout = self.hedge_delay(ranked[0]) if self.hedge and started < len(ranked) else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    start()
+                    hedged = True
+                    continue
+
+                for task in done:
+                    index = pending.pop(task)
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        continue
+                    if hedged:
+                        count_hedge("primary" if index == 0 else "hedge")
+                    return task.result()
+
+                if not pending and started < len(ranked):
+                    print(f"Router: {ranked[started - 1]} failed ({last_error}), trying {ranked[started]}")
+                    start()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise last_error
+
+    def route_stream(self, stream_fn):
+        """
+        Streams stream_fn(provider) from the best provider, failing over only
+        while nothing has been yielded. Streams are not hedged.
+        """
+        ranked = self.rank()[:self.max_attempts]
+        for i, provider in enumerate(ranked):
+            start = time.perf_counter()
+            yielded = False
+            try:
+                for chunk in stream_fn(provider):
+                    yielded = True
+                    yield chunk
+            except Exception as e:
+                self.record(provider, time.perf_counter() - start, False)
+                if yielded or i == len(ranked) - 1:
+                    raise
+                print(f"Router: {provider} failed ({e}), trying {ranked[i + 1]}")
+                continue
+            self.record(provider, time.perf_counter() - start, True)
+            return
+
+    async def route_stream_async(self, stream_fn):
+        # Async form of route_stream: stream_fn(provider) returns an async generator
+        ranked = self.rank()[:self.max_attempts]
+        for i, provider in enumerate(ranked):
+            start = time.perf_counter()
+            yielded = False
+            try:
+                async for chunk in stream_fn(provider):
+                    yielded = True
+                    yield chunk
+            except Exception as e:
+                self.record(provider, time.perf_counter() - start, False)
+                if yielded or i == len(ranked) - 1:
+                    raise
+                print(f"Router: {provider} failed ({e}), trying {ranked[i + 1]}")
+                continue
+            self.record(provider, time.perf_counter() - start, True)
+            return
+
+
+provider_router = ProviderRouter()
@@ -1,71 +1,107 @@
-import os
-import requests
-from datetime import datetime, timedelta
+import threading
+import time
+from urllib.parse import urlsplit
 
 from utils.config import config
+from utils.crawl_cache import crawl_cache
+from utils.http_session import http_get
 
 
-def is_file_newish(file_path, days=7, minutes=0):
-    # Check if file exists
-    if not os.path.isfile(file_path):
-        return False
-    
-    # Get the last modification time of the file
-    mod_time = os.path.getmtime(file_path)
-    
-    # Convert to datetime object
-    mod_datetime = datetime.fromtimestamp(mod_time)
-    
-    # Calculate the cutoff date using both days and minutes
-    cutoff_date = datetime.now() - timedelta(days=days, minutes=minutes)
-    
-    # Return True if file was modified after the cutoff date
-    return mod_datetime > cutoff_date
-        
+def page_key(url):
+    """
+    The crawler cache key of a page: the lowercased URL without scheme,
+    fragment or trailing slash. site_scraper and the crawler both key pages
+    this way, so they share cache entries.
+    """
+    url = url.lower()
+    parts = urlsplit(url if url[:4] == "http" else f"https://{url}")
+    key = parts.netloc + parts.path.rstrip('/')
+    return f"{key}?{parts.query}" if parts.query else key
 
-def site_scraper(url):
-    # URL to scrape (URL encoded if it contains special characters)
+
+def normalize_url(url):
+    # Returns (cache key, URL to fetch)
     url = url.lower()
-    if url[:4] != "http":
-        target_url = f'https://{url}'
-    else:
-        target_url = url
-        url = url.split('//')[1]
-        
-    dir = config['UI']['CrawlerDir']
-    file_path = os.path.join(dir, url + '.txt')
-
-    if is_file_newish(file_path):
-        with open(file_path, 'r') as f:
-           return 200, f.read(), url
-        
+    target_url = url if url[:4] == "http" else f'https://{url}'
+    return page_key(target_url), target_url
+
+
+def extract_site_text(html_content):
+    # Extract all text from the page
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html_content, 'html.parser')
+    return soup.get_text(separator=' ', strip=True)
+
+
+def fetch_site_text(target_url):
+    """
+    Fetches one page through ScrapingFish and extracts its text.
+
+    Returns:
+        tuple: (status_code, text)
+    """
     # Construct the API request URL
     api_key = config["ScrapingFish"]["API_KEY"]
     api_url = config["ScrapingFish"]["API_URL"].format(api_key=api_key, target_url=target_url)
 
-    # Make the request
-    response = requests.get(api_url)
+    # Make the request (pooled, with timeouts and retry/backoff on 429/5xx)
+    response = http_get("scraper", api_url)
 
     # Check if the request was successful
-    if response.status_code == 200:
-        # Get the HTML content
-        html_content = response.text
-        
-        # Process the HTML content as needed
-        # For example, you could use BeautifulSoup to extract text
-        from bs4 import BeautifulSoup
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Extract all text from the page
-        text = soup.get_text(separator=' ', strip=True)
-        
-        if "enable JavaScript" in text:
-            return 500, "You need to enable JavaScript to run this app.", "bad.com"
-
-        os.makedirs(dir, exist_ok=True)
-        with open(file_path, 'w') as f:
-            f.write(text)        
-        
+    if response.status_code != 200:
+        return response.status_code, f"Failed to read specified page (Error: {response.status_code})"
+
+    # Get the HTML content and extract all text from the page
+    text = extract_site_text(response.text)
+
+    if "enable JavaScript" in text:
+        return 500, "You need to enable JavaScript to run this app."
+
+    return 200, text
+
+
+def refresh_in_background(url, target_url):
+    def refresh():
+        # Skip if another thread or worker is already fetching this URL
+        with crawl_cache.lock(url, blocking=False) as acquired:
+            if not acquired:
+                return
+            try:
+                return_code, text = fetch_site_text(target_url)
+                if return_code == 200:
+                    crawl_cache.put(url, text)
+            except Exception as e:
+                print(f"Background refresh of {url} failed: {str(e)}")
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def site_scraper(url):
+    url, target_url = normalize_url(url)
+
+    crawler_config = config['Crawler']
+    fresh_seconds = crawler_config.getfloat('FreshDays', 7) * 86400
+    stale_seconds = crawler_config.getfloat('MaxStaleDays', 30) * 86400
+
+    text, fetched_at = crawl_cache.get(url)
+    if text is not None:
+        age = time.time() - fetched_at
+        if age < fresh_seconds:
+            return 200, text, url
+        if age < stale_seconds:
+            # Stale-while-revalidate: answer now, refresh for the next caller
+            refresh_in_background(url, target_url)
+            return 200, text, url
+
+    # Single-flight: one fetch per URL across all workers; the rest wait for it
+    with crawl_cache.lock(url):
+        text, fetched_at = crawl_cache.get(url)
+        if text is not None and time.time() - fetched_at < fresh_seconds:
+            return 200, text, url
+
+        return_code, text = fetch_site_text(target_url)
+        if return_code != 200:
+            return return_code, text, "bad.com"
+
+        crawl_cache.put(url, text)
         return 200, text, url
-    else:
-        return response.status_code, f"Failed to read specified page (Error: {response.status_code})", "bad.com"
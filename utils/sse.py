@@ -0,0 +1,44 @@
+import json
+
+
+def format_sse(event, data):
+    """
+    Formats one Server-Sent Event.
+
+    Args:
+        event (str): The event name, e.g. "chunk" or "done"
+        data (dict): JSON-serializable payload
+
+    Returns:
+        str: The event, terminated by a blank line
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def iter_sse(lines):
+    """
+    Parses Server-Sent Events from an iterable of decoded lines
+    (e.g. requests' response.iter_lines(decode_unicode=True)).
+
+    Yields:
+        tuple: (event, data) with data decoded from JSON
+    """
+    event = "message"
+    data_lines = []
+    for line in lines:
+        if line is None:
+            continue
+
+        if line == "":
+            # A blank line terminates the event
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event = "message"
+            data_lines = []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].lstrip())
+
+    if data_lines:
+        yield event, json.loads("\n".join(data_lines))
@@ -0,0 +1,138 @@
+import csv
+import io
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.config import config
+from utils.metrics import stage_timer
+
+# file_ext values /ocr can answer with a typed table instead of CSV text
+TABLE_MIME_TYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file"
+}
+
+# Currency symbols, thousands separators and spaces inside a number: "$ 1,234.50"
+NUMBER_NOISE_PATTERN = r"[\s$€£¥,]"
+# Identifiers, not numbers: "00123", "-0042" (but "0000.50" is an amount)
+LEADING_ZERO_PATTERN = r"^-?0\d+$"
+
+
+class TableShapeError(ValueError):
+    """
+    The model output is not a rectangular table, so it cannot be typed.
+    """
+    pass
+
+
+def is_table_format(file_ext):
+    return (file_ext or "").lower() in TABLE_MIME_TYPES
+
+
+def unique_columns(header):
+    # Blank and repeated header cells get a suffix: Parquet needs unique names
+    columns, seen = [], {}
+    for i, name in enumerate(header):
+        name = name.strip() or f"column_{i + 1}"
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        columns.append(name if count == 0 else f"{name}_{count + 1}")
+    return columns
+
+
+def parse_table(csv_text):
+    """
+    Parses post_process_csv output (first line the header) into a DataFrame of
+    strings.
+
+    Raises:
+        TableShapeError: If there is no table, or a row's cell count differs
+                         from the header's
+    """
+    rows = [row for row in csv.reader(io.StringIO(csv_text.strip())) if row]
+    if not rows:
+        raise TableShapeError("No table found in the model output")
+
+    header, body = rows[0], rows[1:]
+    bad_rows = [(line, len(row)) for line, row in enumerate(body, start=2) if len(row) != len(header)]
+    if bad_rows:
+        line, cells = bad_rows[0]
+        raise TableShapeError(f"{len(bad_rows)} of {len(body)} rows do not have {len(header)} cells "
+                              f"(line {line} has {cells})")
+
+    return pd.DataFrame(body, columns=unique_columns(header), dtype=object)
+
+
+def to_numbers(column):
+    """
+    Converts a column of number strings, e.g. "$1,234.50", "(200.00)", "12.5%",
+    in one vectorized pass: parentheses make a value negative and percents
+    become fractions (12.5% -> 0.125). Empty cells become nulls.
+
+    Returns:
+        pd.Series or None: None if any non-empty cell is not a number, or the
+                           column looks like identifiers (leading zeros)
+    """
+    text = column.str.strip()
+    empty = text.eq("")
+    if empty.all():
+        return None
+
+    percent = text.str.endswith("%")
+    negative = text.str.startswith("(") & text.str.endswith(")")
+    cleaned = text.str.replace(NUMBER_NOISE_PATTERN, "", regex=True).str.strip("()%")
+    if cleaned[~empty].str.contains(LEADING_ZERO_PATTERN, regex=True).any():
+        return None
+
+    values = pd.to_numeric(cleaned.where(~empty), errors="coerce")
+    if values[~empty].isna().any():
+        return None
+
+    values = values.to_numpy(dtype=np.float64)
+    values = np.where(negative, -np.abs(values), values)
+    values = np.where(percent, values / 100, values)
+    if not percent.any() and not cleaned.str.contains(".", regex=False).any():
+        return pd.Series(values, index=column.index).astype("Int64")
+    return pd.Series(values, index=column.index)
+
+
+def normalize_numbers(frame):
+    """
+    Types every column that holds only numbers (see to_numbers); the others
+    stay strings.
+    """
+    for name in frame.columns:
+        values = to_numbers(frame[name].astype(str))
+        if values is not None:
+            frame[name] = values
+    return frame
+
+
+def encode_table(csv_text, file_ext):
+    """
+    Encodes post_process_csv output as a typed Parquet or Arrow IPC file.
+
+    Args:
+        csv_text (str): The CSV text /ocr would otherwise return
+        file_ext (str): "parquet" or "arrow"
+
+    Returns:
+        bytes: The file
+
+    Raises:
+        TableShapeError: See parse_table
+    """
+    with stage_timer("encode_table"):
+        frame = normalize_numbers(parse_table(csv_text))
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+
+        sink = io.BytesIO()
+        if file_ext.lower() == "parquet":
+            pq.write_table(table, sink, compression=config['Tables'].get('ParquetCompression', 'zstd'))
+        else:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        return sink.getvalue()
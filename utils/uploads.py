@@ -0,0 +1,243 @@
+import io
+import mmap
+import os
+import tempfile
+import uuid
+from contextlib import contextmanager
+
+from utils.config import config
+
+CHUNK_SIZE = 1 << 20
+# Allowance for the form fields sent alongside the file
+FORM_OVERHEAD = 1 << 20
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+def max_file_bytes():
+    return config['Uploads'].getint('MaxFileMB', 100) << 20
+
+
+def max_request_bytes():
+    # Ceiling for a whole request body; batch uploads carry many files
+    return config['Uploads'].getint('MaxRequestMB', 1024) << 20
+
+
+def spool_min_bytes():
+    # Smaller uploads stay in memory, as before
+    return config['Uploads'].getint('SpoolMinKB', 512) << 10
+
+
+def check_content_length(content_length, max_bytes=None):
+    """
+    Fails fast on a declared Content-Length, before any of the body is read.
+
+    Raises:
+        UploadTooLarge: If the body is larger than max_bytes plus the form fields
+    """
+    max_bytes = max_bytes or max_file_bytes()
+    if content_length and content_length > max_bytes + FORM_OVERHEAD:
+        raise UploadTooLarge(f"Upload is {content_length >> 20} MB, maximum is {max_bytes >> 20} MB")
+
+
+def create_spool_file():
+    # Named (not anonymous) so process pools and SDK uploads can reopen it by path
+    spool_dir = config['Uploads'].get('SpoolDir', 'data/spool')
+    os.makedirs(spool_dir, exist_ok=True)
+    return tempfile.NamedTemporaryFile(dir=spool_dir, prefix="upload-", delete=False)
+
+
+def spool_stream(stream, max_bytes=None):
+    """
+    Copies a file-like upload into the spool directory in fixed-size chunks.
+
+    Returns:
+        str: Path of the spooled file (remove it with remove_spooled)
+
+    Raises:
+        UploadTooLarge: As soon as more than max_bytes have been read
+    """
+    max_bytes = max_bytes or max_file_bytes()
+    spool_file = create_spool_file()
+    try:
+        with spool_file:
+            size = 0
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                check_file_size(size, max_bytes)
+                spool_file.write(chunk)
+    except BaseException:
+        remove_spooled(spool_file.name)
+        raise
+    return spool_file.name
+
+
+class SpooledBlob(mmap.mmap):
+    """
+    Read-only memory map of a spooled upload. It stands in for the upload's bytes
+    everywhere in the pipeline (hashing, slicing, base64, str(blob, 'utf-8'))
+    while the pages stay in the page cache instead of the worker's heap. It
+    pickles as its path, so process pools map the same file.
+    """
+    path = None
+
+    # The rest of the io.RawIOBase surface that zipfile/openpyxl probe for
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def writable(self):
+        return False
+
+    def __reduce__(self):
+        return open_spooled, (self.path,)
+
+
+def open_spooled(path):
+    """
+    Returns:
+        SpooledBlob or bytes: b"" for an empty file, which cannot be mapped
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        blob = SpooledBlob(f.fileno(), 0, access=mmap.ACCESS_READ)
+    blob.path = path
+    return blob
+
+
+def check_file_size(size, max_bytes=None):
+    max_bytes = max_bytes or max_file_bytes()
+    if size > max_bytes:
+        raise UploadTooLarge(f"Upload is {size >> 20} MB, maximum is {max_bytes >> 20} MB")
+
+
+def claim_spooled(path):
+    """
+    Moves a spooled upload to a new spool file, so the request's cleanup no
+    longer removes it and work that outlives the request can keep it.
+
+    Returns:
+        str: The new path (remove it with remove_spooled)
+    """
+    spool_file = create_spool_file()
+    spool_file.close()
+    os.replace(path, spool_file.name)
+    return spool_file.name
+
+
+def remove_spooled(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class MappedStream(io.RawIOBase):
+    """
+    Read-only stream over a memory map with its own position, so two parses of
+    the same upload (e.g. a hedged provider call) do not move each other's
+    file pointer. Reads are copied straight out of the map.
+    """
+    def __init__(self, blob):
+        self._view = memoryview(blob)
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = max(0, min(len(buffer), len(self._view) - self._pos))
+        buffer[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def read(self, size=-1):
+        # One slice instead of RawIOBase's loop of readinto calls
+        end = len(self._view) if size is None or size < 0 else min(len(self._view), self._pos + size)
+        data = bytes(self._view[self._pos:end])
+        self._pos = max(self._pos, end)
+        return data
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        # Let the map itself be closed later
+        self._view.release()
+        super().close()
+
+
+def open_stream(file_blob):
+    """
+    Seekable binary stream over a blob for the PDF/Excel parsers: a view of the
+    map for a spooled upload, so nothing is copied.
+    """
+    if isinstance(file_blob, mmap.mmap):
+        return MappedStream(file_blob)
+    return io.BytesIO(file_blob)
+
+
+@contextmanager
+def upload_source(file_blob):
+    # Provider SDK uploads stream a spooled file from disk through a file handle
+    path = getattr(file_blob, "path", None)
+    if path is None:
+        yield file_blob
+        return
+    with open(path, "rb") as f:
+        yield f
+
+
+def as_bytes(file_blob):
+    # For the few consumers that insist on bytes (e.g. inline Gemini parts)
+    return file_blob if isinstance(file_blob, (bytes, str)) else bytes(file_blob)
+
+
+class MultipartStream:
+    """
+    multipart/form-data body that streams the file from disk. requests sends it
+    with a Content-Length (from __len__) without building the body in memory,
+    and can iterate it again if a retry resends the request.
+    """
+    def __init__(self, fields, file_field, file_name, file_path, content_type="application/octet-stream"):
+        self.boundary = uuid.uuid4().hex
+        self.file_path = file_path
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+
+        head = io.BytesIO()
+        for name, value in fields.items():
+            head.write(f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'.encode('utf-8'))
+            head.write(str(value).encode('utf-8') + b"\r\n")
+        head.write((f'--{self.boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+                    f'filename="{file_name}"\r\nContent-Type: {content_type}\r\n\r\n').encode('utf-8'))
+        self.head = head.getvalue()
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode('utf-8')
+
+    def __len__(self):
+        return len(self.head) + os.path.getsize(self.file_path) + len(self.tail)
+
+    def __iter__(self):
+        yield self.head
+        with open(self.file_path, "rb") as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        yield self.tail